@@ -0,0 +1,72 @@
+# redirect-service/benchmarks/bench_password_verify.py
+"""
+Event-loop lag under concurrent password-protected redirects.
+
+Fires CONCURRENCY bcrypt verifications at once, the way a burst of
+?password= requests would, while a probe task measures how late it wakes
+up from a 1 ms sleep. Compares calling pwd_context.verify inline (the old
+behaviour) with security.verify_password (bounded thread pool).
+
+Usage:
+    uv run python -m benchmarks.bench_password_verify [--concurrency 16]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from security import pwd_context, verify_password
+
+PROBE_INTERVAL = 0.001
+
+
+async def probe_loop_lag(lags: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(loop.time() - started - PROBE_INTERVAL)
+
+
+async def inline_verify(password: str, password_hash: str) -> bool:
+    return pwd_context.verify(password, password_hash)
+
+
+async def run_scenario(verify, concurrency: int, password_hash: str) -> dict:
+    lags: list = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(lags, stop))
+    await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(verify("benchmark", password_hash) for _ in range(concurrency))
+    )
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    assert all(results)
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "probe_samples": len(lags_ms),
+        "lag_p50_ms": round(statistics.median(lags_ms), 2),
+        "lag_p99_ms": round(lags_ms[int(len(lags_ms) * 0.99) - 1], 2),
+        "lag_max_ms": round(lags_ms[-1], 2),
+    }
+
+
+async def main(concurrency: int):
+    password_hash = pwd_context.hash("benchmark")
+    for name, verify in (("inline", inline_verify), ("offloaded", verify_password)):
+        result = await run_scenario(verify, concurrency, password_hash)
+        print(f"{name:>10}: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
@@ -0,0 +1,423 @@
+# redirect-service/benchmarks/bench_redirect.py
+"""
+Latency/throughput benchmark for /r/{slug}, one scenario per branch of
+redirect_to_original_url.
+
+By default main.app is driven in-process over ASGI with the in-memory
+stand-ins from benchmarks/standins.py (no Redis, MongoDB or RabbitMQ needed).
+With --url the same scenarios run against a live server; the harness then
+seeds MongoDB and Redis through the service's own MONGO_* / REDIS_* settings,
+and the server should be started with LOCAL_CACHE_MAX_SIZE=0 so the
+layer-specific scenarios are not served from its local cache.
+
+Usage:
+    uv run python -m benchmarks.bench_redirect --output bench.json
+    uv run python -m benchmarks.bench_redirect --baseline bench.json --max-regression 0.15
+    uv run python -m benchmarks.bench_redirect --url http://localhost:8002
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from typing import List, Optional
+from unittest.mock import patch
+
+import messaging
+from benchmarks.standins import InMemoryLinkStore, InMemoryRedis, NullBrokerConnection
+from cache import cache_link, cache_missing_link, link_cache_key
+from httpx import ASGITransport, AsyncClient
+from rate_limit import Rate
+from security import create_access_token, pwd_context
+
+BENCH_PASSWORD = "benchmark"
+# 低成本的 bcrypt 雜湊：量測的是重導向路徑本身，而不是 bcrypt 的 work factor
+BENCH_PASSWORD_HASH = pwd_context.hash(BENCH_PASSWORD, rounds=4)
+
+
+def link(url: str, is_active: bool = True, password: Optional[str] = None) -> dict:
+    return {
+        "original_url": url,
+        "is_active": is_active,
+        "password": password,
+        "expires_at": None,
+    }
+
+
+class Scenario:
+    def __init__(
+        self,
+        name: str,
+        slug: str,
+        expected_status: int,
+        stored: Optional[dict] = None,
+        cached: Optional[dict] = None,
+        null_marker: bool = False,
+        local_cache: bool = True,
+        reset_each: bool = False,
+        params: Optional[dict] = None,
+        cookie: bool = False,
+        max_requests: Optional[int] = None,
+    ):
+        self.name = name
+        self.slug = slug
+        self.expected_status = expected_status
+        self.stored = stored  # document in MongoDB
+        self.cached = cached  # entry already in Redis
+        self.null_marker = null_marker
+        self.local_cache = local_cache
+        self.reset_each = reset_each  # drop the Redis entry before every request
+        self.params = params or {}
+        self.cookie = cookie
+        self.max_requests = max_requests
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario(
+        "local_cache_hit",
+        "bench-local",
+        302,
+        stored=link("http://bench.example/local"),
+        cached=link("http://bench.example/local"),
+    ),
+    Scenario(
+        "redis_hit",
+        "bench-redis",
+        302,
+        cached=link("http://bench.example/redis"),
+        local_cache=False,
+    ),
+    Scenario(
+        "cache_miss",
+        "bench-miss",
+        302,
+        stored=link("http://bench.example/miss"),
+        local_cache=False,
+        reset_each=True,
+    ),
+    Scenario(
+        "null_marker",
+        "bench-null",
+        404,
+        null_marker=True,
+        local_cache=False,
+    ),
+    Scenario(
+        "not_found",
+        "bench-missing",
+        404,
+        local_cache=False,
+        reset_each=True,
+    ),
+    Scenario(
+        "inactive",
+        "bench-inactive",
+        403,
+        cached=link("http://bench.example/inactive", is_active=False),
+    ),
+    Scenario(
+        "password_protected",
+        "bench-protected",
+        302,
+        cached=link("http://bench.example/protected", password=BENCH_PASSWORD_HASH),
+        params={"password": BENCH_PASSWORD},
+        max_requests=200,
+    ),
+    Scenario(
+        "password_cookie",
+        "bench-unlocked",
+        302,
+        cached=link("http://bench.example/unlocked", password=BENCH_PASSWORD_HASH),
+        cookie=True,
+    ),
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def wire_standins(
+    main,
+    redis: InMemoryRedis,
+    store: InMemoryLinkStore,
+    stack: contextlib.AsyncExitStack,
+):
+    """
+    Points main.app at the in-memory stand-ins. The Redis stand-in goes where
+    the lifespan hook puts the real client, so get_redis_db and the
+    performance profile's fast path both find it without a dependency
+    override. `stack` undoes the patches; stop_click_publisher() is left to
+    the caller.
+    """
+    stack.enter_context(
+        patch.object(main.app.state, "redis_client", redis, create=True)
+    )
+    stack.enter_context(patch.object(main, "fetch_link_data", store.fetch_link_data))
+    # 保留限流的 round trip，但額度大到不影響量測
+    stack.enter_context(
+        patch.object(
+            main.rate_limiter,
+            "rules",
+            {
+                rule: Rate(10**9, rate.window)
+                for rule, rate in main.rate_limiter.rules.items()
+            },
+        )
+    )
+    messaging.click_publisher = messaging.ClickEventPublisher(
+        connection_factory=NullBrokerConnection
+    )
+    messaging.click_publisher.start()
+
+
+class InProcessTarget:
+    """main.app over ASGI, wired to in-memory stand-ins."""
+
+    def __init__(self, redis_latency: float, mongo_latency: float):
+        self.redis = InMemoryRedis(latency=redis_latency)
+        self.store = InMemoryLinkStore(latency=mongo_latency)
+        self._stack = contextlib.AsyncExitStack()
+
+    async def __aenter__(self):
+        import main
+
+        self.main = main
+        self._local_cache_size = main.link_cache.max_size
+        wire_standins(main, self.redis, self.store, self._stack)
+        self.client = await self._stack.enter_async_context(
+            AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench")
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stack.aclose()
+        await messaging.stop_click_publisher()
+        self.main.link_cache.clear()
+        self.main.link_cache.max_size = self._local_cache_size
+
+    async def prepare(self, scenario: Scenario):
+        self.main.link_cache.clear()
+        self.main.link_cache.max_size = 10000 if scenario.local_cache else 0
+        if scenario.stored:
+            self.store.links[scenario.slug] = scenario.stored
+        await self.redis.delete(link_cache_key(scenario.slug))
+        if scenario.cached:
+            await cache_link(self.redis, scenario.slug, scenario.cached)
+        if scenario.null_marker:
+            await cache_missing_link(self.redis, scenario.slug)
+
+    async def reset(self, scenario: Scenario):
+        self.redis._delete(link_cache_key(scenario.slug))
+
+    async def cleanup(self, scenario: Scenario):
+        self.store.links.pop(scenario.slug, None)
+        self.redis._delete(link_cache_key(scenario.slug))
+
+
+class LiveServerTarget:
+    """A running server; seeds its MongoDB and Redis directly."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._stack = contextlib.AsyncExitStack()
+
+    async def __aenter__(self):
+        from cache import close_redis_connection, connect_to_redis
+        from database import close_mongo_connection, connect_to_mongo
+
+        self.mongo_client, _ = await connect_to_mongo()
+        self._stack.push_async_callback(close_mongo_connection, self.mongo_client)
+        self.redis = await connect_to_redis()
+        self._stack.push_async_callback(close_redis_connection, self.redis)
+        self.client = await self._stack.enter_async_context(
+            AsyncClient(base_url=self.url)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stack.aclose()
+
+    async def prepare(self, scenario: Scenario):
+        from models import Link
+
+        await self.cleanup(scenario)
+        if scenario.stored:
+            await Link(
+                original_url=scenario.stored["original_url"],
+                original_url_hash=f"benchmark:{scenario.slug}",
+                slug=scenario.slug,
+                is_active=scenario.stored["is_active"],
+                password=scenario.stored["password"],
+            ).insert()
+        if scenario.cached:
+            await cache_link(self.redis, scenario.slug, scenario.cached)
+        if scenario.null_marker:
+            await cache_missing_link(self.redis, scenario.slug)
+
+    async def reset(self, scenario: Scenario):
+        await self.redis.delete(link_cache_key(scenario.slug))
+
+    async def cleanup(self, scenario: Scenario):
+        from models import Link
+
+        await Link.find(Link.slug == scenario.slug).delete()
+        await self.redis.delete(link_cache_key(scenario.slug))
+
+
+async def run_scenario(target, scenario: Scenario, requests: int, concurrency: int):
+    await target.prepare(scenario)
+    requests = min(requests, scenario.max_requests or requests)
+    cookies = {}
+    if scenario.cookie:
+        password_hash = scenario.cached["password"]
+        cookies["link_access"] = create_access_token(scenario.slug, password_hash)
+    headers = {"cookie": "; ".join(f"{k}={v}" for k, v in cookies.items())}
+    path = f"/r/{scenario.slug}"
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            if scenario.reset_each:
+                await target.reset(scenario)
+            started = time.perf_counter()
+            response = await target.client.get(
+                path,
+                params=scenario.params,
+                headers=headers if cookies else None,
+                follow_redirects=False,
+            )
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != scenario.expected_status:
+                errors += 1
+
+    # 暖身：第一個請求填入各層快取
+    await target.client.get(path, params=scenario.params, follow_redirects=False)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await target.cleanup(scenario)
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> List[str]:
+    """
+    Returns a description of every scenario whose throughput dropped or p99
+    latency grew by more than max_regression (a fraction) against the baseline.
+    """
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current["rps"] < previous["rps"] * (1 - max_regression):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+        if current["p99_ms"] > previous["p99_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{name}: p99 {previous['p99_ms']}ms -> {current['p99_ms']}ms"
+            )
+    return regressions
+
+
+async def run(args) -> dict:
+    scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    if args.url:
+        target = LiveServerTarget(args.url)
+    else:
+        target = InProcessTarget(args.redis_latency, args.mongo_latency)
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "mode": "live" if args.url else "in-process",
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "redis_latency_ms": args.redis_latency * 1000,
+            "mongo_latency_ms": args.mongo_latency * 1000,
+        },
+        "scenarios": {},
+    }
+    async with target:
+        for scenario in scenarios:
+            result = await run_scenario(
+                target, scenario, args.requests, args.concurrency
+            )
+            results["scenarios"][scenario.name] = result
+            print(f"{scenario.name:>20}: {result}", file=sys.stderr)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenario", action="append", help="run only these")
+    parser.add_argument("--redis-latency", type=float, default=0.0002)
+    parser.add_argument("--mongo-latency", type=float, default=0.002)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    # 每個請求一行的 httpx 日誌會拖慢量測
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    failed = [name for name, r in results["scenarios"].items() if r["errors"]]
+    if failed:
+        print(f"Unexpected responses in: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print("Performance regressions:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# redirect-service/benchmarks/bench_server.py
+"""
+Single-core HTTP throughput of /r/{slug} under each server profile.
+
+For every profile a uvicorn server with one worker is started in a child
+process, pinned to one CPU and wired to the in-memory stand-ins of
+bench_redirect, so the numbers include the event loop, HTTP parser, middleware
+and response building that the in-process benchmark skips. A keep-alive load
+generator then requests a link served from the local cache for --duration
+seconds. Profiles (see server.py):
+
+  asyncio      plain uvicorn without the [standard] extras: asyncio + h11
+  default      `uvicorn main:app`, i.e. SERVER_PROFILE=default
+  performance  SERVER_PROFILE=performance
+
+On a single-CPU machine the load generator shares the core with the server, so
+absolute numbers are lower than the server alone would reach; the ratio
+between profiles is what matters.
+
+Usage:
+    uv run python -m benchmarks.bench_server --output bench_server.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+BENCH_SLUG = "bench-server"
+PROFILES = ("asyncio", "default", "performance")
+
+
+def server_options(profile: str, port: int) -> dict:
+    from server import uvicorn_options
+
+    if profile == "asyncio":
+        options = dict(
+            uvicorn_options("default", workers=1), loop="asyncio", http="h11"
+        )
+    else:
+        options = uvicorn_options(profile, workers=1)
+    options.update(host="127.0.0.1", port=port, log_level="warning")
+    return options
+
+
+def serve(profile: str, port: int, cpu: Optional[int]):
+    """Child process: main.app on the stand-ins under one profile."""
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    os.environ["SERVER_PROFILE"] = (
+        "performance" if profile == "performance" else "default"
+    )
+    import main
+    import uvicorn
+    from benchmarks.bench_redirect import link, wire_standins
+    from benchmarks.standins import InMemoryLinkStore, InMemoryRedis
+
+    options = server_options(profile, port)
+    options.pop("workers", None)
+    # lifespan 會連線到真正的 MongoDB 與 Redis，這裡由 stand-ins 取代
+    server = uvicorn.Server(uvicorn.Config(main.app, lifespan="off", **options))
+
+    async def run():
+        redis, store = InMemoryRedis(), InMemoryLinkStore()
+        store.links[BENCH_SLUG] = link("http://bench.example/server")
+        async with contextlib.AsyncExitStack() as stack:
+            wire_standins(main, redis, store, stack)
+            await server.serve()
+
+    # 與 uvicorn.run() 相同：先依 profile 設定 event loop
+    server.config.setup_event_loop()
+    asyncio.run(run())
+
+
+async def wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return
+
+
+async def load(port: int, duration: float, concurrency: int) -> dict:
+    """
+    Keep-alive GET requests from `concurrency` connections for `duration`
+    seconds. Reads just enough of each response to stay in sync.
+    """
+    request = (
+        f"GET /r/{BENCH_SLUG} HTTP/1.1\r\nHost: bench\r\nUser-Agent: bench\r\n\r\n"
+    ).encode()
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def connection():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                writer.write(request)
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line[:15].lower() == b"content-length:":
+                        length = int(line[15:])
+                if length:
+                    await reader.readexactly(length)
+                latencies.append(time.perf_counter() - started)
+                if not head.startswith(b"HTTP/1.1 302"):
+                    errors += 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_profile(profile: str, args) -> dict:
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.bench_server", "--serve", profile]
+    command += ["--port", str(port)]
+    if args.cpu is not None:
+        command += ["--cpu", str(args.cpu)]
+    child = subprocess.Popen(command)
+    try:
+        await wait_for_port(port)
+        # 暖身：第一個請求填入快取，之後都是本機快取命中
+        await load(port, min(1.0, args.duration), 1)
+        return await load(port, args.duration, args.concurrency)
+    finally:
+        child.terminate()
+        child.wait()
+
+
+async def run(args) -> dict:
+    results = {
+        "meta": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "cpus": len(os.sched_getaffinity(0)),
+        },
+        "profiles": {},
+    }
+    for profile in args.profile or ["default", "performance"]:
+        result = await run_profile(profile, args)
+        results["profiles"][profile] = result
+        print(f"{profile:>12}: {result}", file=sys.stderr)
+    profiles = results["profiles"]
+    if "default" in profiles and "performance" in profiles:
+        results["performance_gain"] = round(
+            profiles["performance"]["rps"] / profiles["default"]["rps"], 2
+        )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profile", action="append", choices=PROFILES)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--cpu", type=int, help="pin the server to this CPU (default: the last one)"
+    )
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--serve", choices=PROFILES, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, args.port, args.cpu)
+        return 0
+    if args.cpu is None:
+        args.cpu = max(os.sched_getaffinity(0))
+    # 負載產生器避開伺服器所在的 CPU (若還有其他 CPU)
+    others = os.sched_getaffinity(0) - {args.cpu}
+    if others:
+        os.sched_setaffinity(0, others)
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    failed = [name for name, r in results["profiles"].items() if r["errors"]]
+    if failed:
+        print(f"Unexpected responses in: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,504 @@
+# redirect-service/benchmarks/simulate_cache.py
+"""
+Offline cache policy simulator driven by slug access traces.
+
+Replays a trace through a model of the redirect path - slug index, each
+worker's LocalLinkCache, Redis with fixed or popularity-aware TTLs and a
+memory limit, then MongoDB - for every combination of the given settings in a single pass, and reports
+the hit rates, MongoDB queries per second and Redis memory of each.
+
+Traces are text files (optionally .gz) with one request per line:
+    <unix timestamp> <slug> [missing]
+where "missing" marks slugs that do not exist. They are streamed, so
+multi-GB access logs never have to fit in memory. Synthetic traces (zipf,
+bursty, scanner) can be generated instead, or written out with --write-trace.
+
+Usage:
+    uv run python -m benchmarks.simulate_cache --trace access.log.gz \\
+        --link-ttl 3600,86400,604800 --redis-memory 64,256 --policy lru,lfu
+    uv run python -m benchmarks.simulate_cache --synthetic scanner --requests 1000000
+"""
+
+import argparse
+import bisect
+import gzip
+import heapq
+import itertools
+import json
+import random
+import string
+import sys
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cache import (
+    LINK_CACHE_TTL,
+    NOT_FOUND_CACHE_TTL,
+    NOT_FOUND_VALUE,
+    encode_link_data,
+    link_cache_key,
+)
+from local_cache import LocalLinkCache
+from popularity import PopularityTracker
+from slug_index import BloomFilter, create_slug_index, sized_bloom_filter
+
+# (timestamp, slug, exists)
+Request = Tuple[float, str, bool]
+
+# 每個 key 在 Redis 中的額外開銷 (dictEntry、redisObject、SDS 標頭、expires 表)
+REDIS_ENTRY_OVERHEAD = 72
+SAMPLE_LINK = {
+    "original_url": "https://example.com/" + "x" * 60,
+    "is_active": True,
+    "password": None,
+    "expires_at": None,
+}
+LINK_VALUE_BYTES = len(encode_link_data(SAMPLE_LINK))
+
+
+def read_trace(path: str) -> Iterator[Request]:
+    """Streams requests from a trace file, gzip-compressed if it ends in .gz."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            yield float(fields[0]), fields[1], fields[2:3] != ["missing"]
+
+
+def write_trace(path: str, requests: Iterable[Request]) -> int:
+    opener = gzip.open if path.endswith(".gz") else open
+    count = 0
+    with opener(path, "wt") as f:
+        for timestamp, slug, exists in requests:
+            f.write(f"{timestamp:.3f} {slug}{'' if exists else ' missing'}\n")
+            count += 1
+    return count
+
+
+def synthetic_trace(
+    kind: str,
+    requests: int,
+    links: int = 100000,
+    rate: float = 1000.0,
+    exponent: float = 1.0,
+    seed: int = 0,
+) -> Iterator[Request]:
+    """
+    Generates `requests` Poisson arrivals at `rate` per second:
+      zipf    - link popularity follows Zipf(`exponent`) over `links` slugs
+      bursty  - zipf, plus a previously unseen link taking 30% of the
+                traffic for 60 seconds every 10 minutes
+      scanner - zipf, plus 30% of requests for random slugs that do not exist
+    """
+    rng = random.Random(seed)
+    cumulative = list(
+        itertools.accumulate(1 / rank**exponent for rank in range(1, links + 1))
+    )
+    timestamp = 0.0
+    for _ in range(requests):
+        timestamp += rng.expovariate(rate)
+        if kind == "bursty" and timestamp % 600 < 60 and rng.random() < 0.3:
+            yield timestamp, f"burst-{int(timestamp // 600)}", True
+        elif kind == "scanner" and rng.random() < 0.3:
+            yield timestamp, "".join(rng.choices(string.ascii_letters, k=7)), False
+        else:
+            rank = bisect.bisect(cumulative, rng.random() * cumulative[-1])
+            yield timestamp, f"link-{rank}", True
+
+
+class RedisModel:
+    """
+    Link keys in Redis: per-key TTLs removed as they expire, and `max_bytes`
+    enforced with allkeys-lru or allkeys-lfu eviction (0 = no limit).
+    """
+
+    def __init__(self, max_bytes: int = 0, policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        # key -> (expires_at, size, exists)
+        self._entries: "OrderedDict[str, Tuple[float, int, bool]]" = OrderedDict()
+        self._expiry: List[Tuple[float, str]] = []
+        self._frequency: Dict[str, int] = {}
+        self._lfu_heap: List[Tuple[int, int, str]] = []
+        self._sequence = itertools.count()
+        self.memory_bytes = 0
+        self.peak_memory_bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str, now: float) -> Optional[bool]:
+        """Returns whether the cached link exists, or None on a miss."""
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.policy == "lru":
+            self._entries.move_to_end(key)
+        else:
+            self._touch(key)
+        return entry[2]
+
+    def set(self, key: str, exists: bool, ttl: float, now: float):
+        self._delete(key)
+        size = len(key) + REDIS_ENTRY_OVERHEAD
+        size += LINK_VALUE_BYTES if exists else len(NOT_FOUND_VALUE)
+        self._entries[key] = (now + ttl, size, exists)
+        heapq.heappush(self._expiry, (now + ttl, key))
+        if len(self._expiry) > 4 * len(self._entries) + 1024:
+            self._expiry = [(entry[0], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._expiry)
+        self.memory_bytes += size
+        if self.policy == "lfu":
+            self._touch(key)
+        while self.max_bytes and self.memory_bytes > self.max_bytes:
+            self._evict()
+        self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+
+    def extend(self, key: str, ttl: float, now: float):
+        """EXPIRE GT: only ever lengthens the TTL of an existing key."""
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is not None and now + ttl > entry[0]:
+            self._entries[key] = (now + ttl, entry[1], entry[2])
+            heapq.heappush(self._expiry, (now + ttl, key))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _touch(self, key: str):
+        frequency = self._frequency.get(key, 0) + 1
+        self._frequency[key] = frequency
+        heapq.heappush(self._lfu_heap, (frequency, next(self._sequence), key))
+        if len(self._lfu_heap) > 4 * len(self._entries) + 1024:
+            # 丟掉過時的堆積項目，避免記憶體隨存取次數成長
+            self._lfu_heap = [
+                (frequency, next(self._sequence), key)
+                for key, frequency in self._frequency.items()
+            ]
+            heapq.heapify(self._lfu_heap)
+
+    def _delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= entry[1]
+            self._frequency.pop(key, None)
+
+    def _expire(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            # 重新寫入過的 key 以新的到期時間為準
+            if entry is not None and entry[0] == expires_at:
+                self._delete(key)
+
+    def _evict(self):
+        if self.policy == "lru":
+            key = next(iter(self._entries))
+        else:
+            while True:
+                frequency, _, key = heapq.heappop(self._lfu_heap)
+                if self._frequency.get(key) == frequency:
+                    break
+        self._delete(key)
+        self.evictions += 1
+
+
+class PolicySimulation:
+    """One cache configuration replayed over the trace."""
+
+    def __init__(
+        self,
+        link_ttl: float = LINK_CACHE_TTL,
+        null_ttl: float = NOT_FOUND_CACHE_TTL,
+        redis_memory: int = 0,
+        policy: str = "lru",
+        local_size: int = 10000,
+        local_ttl: float = 30.0,
+        workers: int = 1,
+        slug_index: Optional[BloomFilter] = None,
+        min_ttl: float = 0,
+        half_life: float = 86400.0,
+    ):
+        self.config = {
+            "link_ttl": link_ttl,
+            "null_ttl": null_ttl,
+            "redis_limit_mb": redis_memory / 1024**2,
+            "policy": policy,
+            "local_size": local_size,
+            "workers": workers,
+            "slug_index": slug_index is not None,
+            "min_ttl": min_ttl,
+        }
+        self.link_ttl = link_ttl
+        self.null_ttl = null_ttl
+        self.now = 0.0
+        self.redis = RedisModel(redis_memory, policy)
+        self.local_caches = [
+            LocalLinkCache(
+                max_size=local_size,
+                ttl=local_ttl,
+                negative_ttl=min(5.0, local_ttl),
+                clock=lambda: self.now,
+            )
+            for _ in range(workers)
+        ]
+        self.slug_index = slug_index
+        # min_ttl > 0：與服務相同的熱度自適應 TTL，延長立即套用
+        self.popularity = (
+            PopularityTracker(
+                min_ttl=int(min_ttl),
+                max_ttl=int(link_ttl),
+                half_life=half_life,
+                max_entries=10**9,
+                clock=lambda: self.now,
+            )
+            if min_ttl
+            else None
+        )
+        self.requests = 0
+        self.rejected = 0
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.mongo_queries = 0
+        self.first_timestamp: Optional[float] = None
+
+    def replay(self, timestamp: float, slug: str, exists: bool, worker: int):
+        self.now = timestamp
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.requests += 1
+        if self.slug_index is not None and slug not in self.slug_index:
+            self.rejected += 1
+            return
+        local_cache = self.local_caches[worker]
+        if local_cache.get(slug) is not None:
+            self.local_hits += 1
+        else:
+            self._lookup(slug, exists, local_cache)
+        if exists and self.popularity is not None:
+            self.popularity.hit(slug)
+            for hot_slug, ttl in self.popularity.pop_extensions().items():
+                self.redis.extend(link_cache_key(hot_slug), ttl, self.now)
+
+    def _lookup(self, slug: str, exists: bool, local_cache: LocalLinkCache):
+        key = link_cache_key(slug)
+        cached = self.redis.get(key, self.now)
+        if cached is None:
+            self.mongo_queries += 1
+            cached = exists
+            if not exists:
+                ttl = self.null_ttl
+            elif self.popularity is not None:
+                ttl = self.popularity.ttl(slug)
+            else:
+                ttl = self.link_ttl
+            self.redis.set(key, exists, ttl, self.now)
+        else:
+            self.redis_hits += 1
+        if cached:
+            local_cache.set(slug, SAMPLE_LINK)
+        else:
+            local_cache.set_not_found(slug)
+
+    def report(self) -> dict:
+        duration = max(self.now - (self.first_timestamp or 0.0), 1e-9)
+        requests = max(self.requests, 1)
+        return {
+            **self.config,
+            "requests": self.requests,
+            "hit_rate": round((self.local_hits + self.redis_hits) / requests, 4),
+            "local_hit_rate": round(self.local_hits / requests, 4),
+            "redis_hit_rate": round(self.redis_hits / requests, 4),
+            "rejected_by_index": self.rejected,
+            "mongo_queries": self.mongo_queries,
+            "mongo_qps": round(self.mongo_queries / duration, 2),
+            "redis_keys": len(self.redis),
+            "redis_memory_mb": round(self.redis.memory_bytes / 1024**2, 2),
+            "redis_peak_memory_mb": round(self.redis.peak_memory_bytes / 1024**2, 2),
+            "redis_evictions": self.redis.evictions,
+            "local_entries": sum(len(cache) for cache in self.local_caches),
+        }
+
+
+def simulate(
+    requests: Iterable[Request], simulations: List[PolicySimulation], seed: int = 0
+) -> List[dict]:
+    """
+    Feeds every request to every simulation in one pass over the trace.
+    Requests are spread over workers at random, like a load balancer would.
+    """
+    rng = random.Random(seed)
+    workers = max(len(simulation.local_caches) for simulation in simulations)
+    for timestamp, slug, exists in requests:
+        worker = rng.randrange(workers)
+        for simulation in simulations:
+            simulation.replay(
+                timestamp, slug, exists, worker % len(simulation.local_caches)
+            )
+    return [simulation.report() for simulation in simulations]
+
+
+def slug_index_from_trace(
+    path: Optional[str],
+    links: int,
+    expected: Optional[int] = None,
+    error_rate: Optional[float] = None,
+) -> BloomFilter:
+    """
+    Bloom filter of the slugs that exist: read from the trace, or the
+    synthetic link-<rank> and burst-<n> slugs. Built like SlugIndex.build()
+    for a collection of `expected` links, by default the number of slugs it
+    will hold, with the configured SLUG_INDEX_ERROR_RATE unless `error_rate`
+    is given. For a trace, counting the slugs takes a first pass keeping the
+    distinct slugs in memory; pass `expected` to stream it once instead.
+    """
+    if path:
+        existing: Iterable[str] = (
+            slug for _, slug, exists in read_trace(path) if exists
+        )
+        if expected is None:
+            existing = set(existing)
+            expected = len(existing)
+    else:
+        existing = itertools.chain(
+            (f"link-{rank}" for rank in range(1, links + 1)),
+            (f"burst-{burst}" for burst in range(10000)),
+        )
+        expected = expected or links + 10000
+    if error_rate is None:
+        error_rate = create_slug_index().error_rate
+    index = sized_bloom_filter(expected, error_rate)
+    for slug in existing:
+        index.add(slug)
+    return index
+
+
+def _floats(value: str) -> List[float]:
+    return [float(item) for item in value.split(",")]
+
+
+def build_simulations(args: argparse.Namespace) -> List[PolicySimulation]:
+    slug_index = (
+        slug_index_from_trace(
+            args.trace, args.links, args.slug_index_links, args.slug_index_error_rate
+        )
+        if args.slug_index
+        else None
+    )
+    return [
+        PolicySimulation(
+            link_ttl=link_ttl,
+            null_ttl=null_ttl,
+            redis_memory=int(redis_memory * 1024**2),
+            policy=policy,
+            local_size=int(local_size),
+            workers=args.workers,
+            slug_index=slug_index,
+            min_ttl=min_ttl,
+            half_life=args.half_life,
+        )
+        for (
+            link_ttl,
+            null_ttl,
+            redis_memory,
+            policy,
+            local_size,
+            min_ttl,
+        ) in itertools.product(
+            _floats(args.link_ttl),
+            _floats(args.null_ttl),
+            _floats(args.redis_memory),
+            args.policy.split(","),
+            _floats(args.local_size),
+            _floats(args.min_ttl),
+        )
+    ]
+
+
+COLUMNS = (
+    "link_ttl",
+    "null_ttl",
+    "min_ttl",
+    "redis_limit_mb",
+    "policy",
+    "local_size",
+    "hit_rate",
+    "mongo_qps",
+    "redis_peak_memory_mb",
+    "redis_evictions",
+)
+
+
+def print_table(reports: List[dict]):
+    print("  ".join(f"{column:>20}" for column in COLUMNS))
+    for report in sorted(reports, key=lambda report: report["mongo_qps"]):
+        print("  ".join(f"{str(report[column]):>20}" for column in COLUMNS))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="trace file to replay (.gz supported)")
+    source.add_argument("--synthetic", choices=("zipf", "bursty", "scanner"))
+    parser.add_argument("--requests", type=int, default=1000000)
+    parser.add_argument("--links", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=1000.0, help="requests/s")
+    parser.add_argument("--zipf-exponent", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--write-trace", help="write the synthetic trace and exit")
+    parser.add_argument("--link-ttl", default=str(LINK_CACHE_TTL))
+    parser.add_argument("--null-ttl", default=str(NOT_FOUND_CACHE_TTL))
+    parser.add_argument("--redis-memory", default="0", help="MB, 0 = unlimited")
+    parser.add_argument("--policy", default="lru", help="lru,lfu")
+    parser.add_argument("--local-size", default="10000")
+    parser.add_argument(
+        "--min-ttl", default="0", help="adaptive TTL floor, 0 = fixed link TTL"
+    )
+    parser.add_argument("--half-life", type=float, default=86400.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--slug-index", action="store_true")
+    parser.add_argument(
+        "--slug-index-links",
+        type=int,
+        help="links the index is built for (default: distinct slugs of the trace)",
+    )
+    parser.add_argument(
+        "--slug-index-error-rate",
+        type=float,
+        help="Bloom filter error rate (default: SLUG_INDEX_ERROR_RATE or 0.001)",
+    )
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    def requests() -> Iterator[Request]:
+        if args.trace:
+            return read_trace(args.trace)
+        return synthetic_trace(
+            args.synthetic,
+            args.requests,
+            links=args.links,
+            rate=args.rate,
+            exponent=args.zipf_exponent,
+            seed=args.seed,
+        )
+
+    if args.write_trace:
+        if not args.synthetic:
+            parser.error("--write-trace needs --synthetic")
+        count = write_trace(args.write_trace, requests())
+        print(f"Wrote {count} requests to {args.write_trace}")
+        return 0
+
+    reports = simulate(requests(), build_simulations(args), seed=args.seed)
+    print_table(reports)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"simulations": reports}, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
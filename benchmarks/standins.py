@@ -0,0 +1,248 @@
+# redirect-service/benchmarks/standins.py
+"""
+In-memory stand-ins for Redis, MongoDB and RabbitMQ used by the benchmarks.
+
+They implement only what the redirect path calls, and each simulated network
+round trip can be given a fixed latency so cache-layer changes show up in the
+numbers the way they would against real servers.
+"""
+
+import asyncio
+import fnmatch
+import time
+from typing import Any, Dict, List, Optional
+
+from cache import _READ_LEGACY_LINK_SCRIPT, _RELEASE_LOCK_SCRIPT
+from rate_limit import _SLIDING_WINDOW_SCRIPT
+
+
+class InMemoryRedis:
+    """
+    Subset of redis.asyncio.Redis (decode_responses=True) with simulated latency.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._data: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self._scripts = {
+            _RELEASE_LOCK_SCRIPT: self._release_lock,
+            _SLIDING_WINDOW_SCRIPT: self._sliding_window,
+            _READ_LEGACY_LINK_SCRIPT: self._read_legacy_link,
+        }
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _live(self, key: str) -> Optional[Any]:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    # --- commands (synchronous bodies, shared with the pipeline) ---
+
+    def _get(self, key):
+        value = self._live(key)
+        return value if isinstance(value, str) else None
+
+    def _hgetall(self, key):
+        value = self._live(key)
+        return dict(value) if isinstance(value, dict) else {}
+
+    def _set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._live(key) is not None:
+            return None
+        self._data[key] = str(value)
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expires[key] = time.monotonic() + ex
+        if px is not None:
+            self._expires[key] = time.monotonic() + px / 1000
+        return True
+
+    def _hset(self, key, mapping):
+        value = self._live(key)
+        if not isinstance(value, dict):
+            value = self._data[key] = {}
+        value.update({field: str(item) for field, item in mapping.items()})
+        return len(mapping)
+
+    def _hmset(self, key, mapping):
+        self._hset(key, mapping)
+        return True
+
+    def _expire(self, key, seconds, gt=False):
+        if self._live(key) is None:
+            return False
+        expires_at = time.monotonic() + seconds
+        current = self._expires.get(key)
+        if gt and (current is None or current >= expires_at):
+            return False
+        self._expires[key] = expires_at
+        return True
+
+    def _ttl(self, key):
+        if self._live(key) is None:
+            return -2
+        expires = self._expires.get(key)
+        return -1 if expires is None else int(expires - time.monotonic())
+
+    def _delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key) is not None:
+                removed += 1
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return removed
+
+    def _exists(self, *keys):
+        return sum(self._live(key) is not None for key in keys)
+
+    def _keys(self, pattern="*"):
+        return [key for key in list(self._data) if fnmatch.fnmatchcase(key, pattern)]
+
+    def _eval(self, script, numkeys, *args):
+        handler = self._scripts.get(script)
+        if handler is None:
+            raise NotImplementedError("Script not supported by InMemoryRedis")
+        return handler(list(args[:numkeys]), list(args[numkeys:]))
+
+    def _release_lock(self, keys, args):
+        if self._get(keys[0]) == args[0]:
+            return self._delete(keys[0])
+        return 0
+
+    def _read_legacy_link(self, keys, args):
+        # 只支援字串值；stand-in 不會寫入舊版的 Hash
+        value = self._get(keys[0])
+        if value is None:
+            return None
+        expires = self._expires.get(keys[0])
+        ttl_ms = -1 if expires is None else int((expires - time.monotonic()) * 1000)
+        return [value, ttl_ms]
+
+    def _sliding_window(self, keys, args):
+        # 與 Lua 版本相同的判斷，只是不必精確計算 Retry-After
+        now, limit, window = float(args[0]), float(args[1]), float(args[2])
+        previous = int(self._get(keys[0]) or 0)
+        current = int(self._get(keys[1]) or 0)
+        elapsed = now % window
+        if previous * (1 - elapsed / window) + current + 1 > limit:
+            return str(window - elapsed)
+        self._set(keys[1], str(current + 1), px=int(window * 2000))
+        return None
+
+    def _decr(self, key):
+        value = int(self._get(key) or 0) - 1
+        self._data[key] = str(value)
+        return value
+
+    def _ping(self):
+        return True
+
+    def __getattr__(self, name: str):
+        command = getattr(type(self), f"_{name}", None)
+        if command is None:
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            await self._round_trip()
+            return command(self, *args, **kwargs)
+
+        return call
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryPipeline":
+        return InMemoryPipeline(self)
+
+    async def aclose(self, close_connection_pool: Optional[bool] = None):
+        pass
+
+
+class InMemoryPipeline:
+    """Buffers commands and runs them in a single simulated round trip."""
+
+    def __init__(self, redis_client: InMemoryRedis):
+        self._redis = redis_client
+        self._commands = []
+
+    def __getattr__(self, name: str):
+        command = getattr(type(self._redis), f"_{name}", None)
+        if command is None:
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def __await__(self):
+        # 與 redis.asyncio 的 Pipeline 相同：await 佇列中的指令會回傳 pipeline 本身
+        if False:
+            yield
+        return self
+
+    async def execute(self, raise_on_error: bool = True):
+        commands, self._commands = self._commands, []
+        await self._redis._round_trip()
+        return [
+            command(self._redis, *args, **kwargs) for command, args, kwargs in commands
+        ]
+
+
+class InMemoryLinkStore:
+    """
+    Stand-in for the links collection, keyed by slug.
+    Mirrors the functions in database.py that the redirect path calls.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.queries = 0
+        self.links: Dict[str, dict] = {}
+
+    async def fetch_link_data(self, slug: str) -> Optional[dict]:
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        link_data = self.links.get(slug)
+        return dict(link_data) if link_data else None
+
+    async def fetch_many_link_data(self, slugs: List[str]) -> Dict[str, dict]:
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return {slug: dict(self.links[slug]) for slug in slugs if slug in self.links}
+
+
+class NullBrokerConnection:
+    """pika.BlockingConnection stand-in that accepts and discards messages."""
+
+    is_open = True
+
+    def channel(self):
+        return self
+
+    def queue_declare(self, queue, durable):
+        pass
+
+    def tx_select(self):
+        pass
+
+    def tx_commit(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        pass
+
+    def process_data_events(self, time_limit=None):
+        pass
+
+    def close(self):
+        pass
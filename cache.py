@@ -1,38 +1,433 @@
 # redirect-service/cache.py
+import asyncio
+import logging
 import os
-from typing import Generator
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import redis
+import redis.asyncio as redis
+from fastapi import Request
+from local_cache import NOT_FOUND
+from sharding import ShardedRedis
 
+logger = logging.getLogger(__name__)
 
-def get_redis_client_instance() -> redis.Redis:
+LINK_CACHE_TTL = 3600 * 24 * 7
+NOT_FOUND_CACHE_TTL = 60
+
+# Cached link values are compact strings, see encode_link_data()
+CACHE_FORMAT_VERSION = "1"
+LINK_FLAG_ACTIVE = 1
+# 重導向狀態碼：301 = permanent，307 = preserve method，308 = 兩者，302 = 皆無
+LINK_FLAG_PERMANENT = 2
+LINK_FLAG_PRESERVE_METHOD = 4
+DEFAULT_REDIRECT_TYPE = 302
+NOT_FOUND_VALUE = f"{CACHE_FORMAT_VERSION}|-"
+# 舊格式：連結存成 Hash，不存在的連結存成字串 "NULL"
+LEGACY_NOT_FOUND_VALUE = "NULL"
+# While workers of the previous version may still be running (rolling
+# deploy) or their entries are still cached, misses fall back to the legacy
+# link_data:<slug> keys and deletes remove both keys. Turn off once the
+# legacy keys have expired (LINK_CACHE_TTL after the last old worker).
+LEGACY_LINK_KEYS = os.environ.get("CACHE_LEGACY_KEYS", "true").lower() == "true"
+
+# 讀取舊版寫在 link_data:<slug> 的值 (Hash 或字串)，轉成目前的字串格式，
+# 連同剩餘 TTL (毫秒) 一起回傳；舊 key 保留給仍在執行舊版的 worker
+_READ_LEGACY_LINK_SCRIPT = """
+local key_type = redis.call("type", KEYS[1]).ok
+local value
+if key_type == "string" then
+    value = redis.call("get", KEYS[1])
+elseif key_type == "hash" then
+    local fields = redis.call("hmget", KEYS[1], "original_url", "is_active", "password", "expires_at")
+    local flags = 0
+    if fields[2] == "True" then
+        flags = tonumber(ARGV[2])
+    end
+    local expires_at = fields[4] or ""
+    if expires_at ~= "" then
+        expires_at = tostring(math.floor(tonumber(expires_at)))
+    end
+    value = table.concat(
+        {ARGV[1], tostring(flags), expires_at, fields[3] or "", fields[1] or ""}, "|"
+    )
+else
+    return false
+end
+return {value, redis.call("pttl", KEYS[1])}
+"""
+
+# 只有持有者才能釋放鎖 (compare-and-delete)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def create_redis_pool(
+    host: Optional[str] = None, port: Optional[int] = None
+) -> redis.BlockingConnectionPool:
     """
-    Returns a new Redis client instance.
-    This function is intended to be called once during application startup
-    or for testing purposes.
+    Builds a Redis connection pool, by default for REDIS_HOST:REDIS_PORT.
+    Requests wait up to REDIS_POOL_TIMEOUT seconds for a free connection
+    instead of failing once REDIS_MAX_CONNECTIONS are in use.
     """
-    REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
-    REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
-    client = redis.Redis(
-        host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True
-    )  # 返回 python 字串
+    REDIS_HOST = host or os.environ.get("REDIS_HOST", "localhost")
+    REDIS_PORT = port or int(os.environ.get("REDIS_PORT", 6379))
+    return redis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+        decode_responses=True,  # 返回 python 字串
+        max_connections=int(os.environ.get("REDIS_MAX_CONNECTIONS", 50)),
+        timeout=float(os.environ.get("REDIS_POOL_TIMEOUT", 5)),
+        health_check_interval=int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+        # 連線失敗要快速回報，由 circuit breaker 決定何時重試
+        socket_connect_timeout=float(os.environ.get("REDIS_CONNECT_TIMEOUT", 1)),
+    )
+
+
+def redis_nodes() -> List[Tuple[str, int]]:
+    """
+    Redis nodes from REDIS_NODES ("host:port,host:port"), defaulting to the
+    single REDIS_HOST:REDIS_PORT node.
+    """
+    nodes = []
+    for node in os.environ.get("REDIS_NODES", "").split(","):
+        host, _, port = node.strip().rpartition(":")
+        if host:
+            nodes.append((host, int(port)))
+    return nodes or [
+        (
+            os.environ.get("REDIS_HOST", "localhost"),
+            int(os.environ.get("REDIS_PORT", 6379)),
+        )
+    ]
+
+
+def create_redis_client() -> Union[redis.Redis, ShardedRedis]:
+    """
+    Builds the application-wide Redis client: a pooled client for a single
+    node, or a ShardedRedis with one pool per node when REDIS_NODES lists
+    several. Keys are spread with REDIS_VNODES virtual nodes per node; a
+    failing node is skipped for REDIS_NODE_RETRY_INTERVAL seconds.
+    """
+    nodes = redis_nodes()
+    if len(nodes) == 1:
+        return redis.Redis(connection_pool=create_redis_pool(*nodes[0]))
+    return ShardedRedis(
+        {
+            f"{host}:{port}": redis.Redis(connection_pool=create_redis_pool(host, port))
+            for host, port in nodes
+        },
+        vnodes=int(os.environ.get("REDIS_VNODES", 160)),
+        retry_interval=float(os.environ.get("REDIS_NODE_RETRY_INTERVAL", 5)),
+    )
+
+
+async def connect_to_redis() -> Union[redis.Redis, ShardedRedis]:
+    """
+    Creates the application-wide Redis client, see create_redis_client().
+    Called once from the lifespan hook. A failed ping is logged but does not
+    stop startup: the pool reconnects on demand and the redirect path runs
+    degraded (MongoDB and stale local entries) until Redis is back.
+    """
+    client = create_redis_client()
+    nodes = ", ".join(f"{host}:{port}" for host, port in redis_nodes())
     try:
-        client.ping()
-        print(f"Connected to Redis: {REDIS_HOST}:{REDIS_PORT}")
-    except redis.exceptions.ConnectionError as e:
-        print(f"Redis connection failed: {e}")
-        raise
+        await client.ping()
+        logger.info(
+            "Connected to Redis: %s (max %s connections per node)",
+            nodes,
+            os.environ.get("REDIS_MAX_CONNECTIONS", 50),
+        )
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        logger.error("Redis connection failed, starting degraded: %s", e)
     return client
 
 
-def get_redis_db() -> Generator[redis.Redis, None, None]:
+async def close_redis_connection(client: redis.Redis):
+    await client.aclose(close_connection_pool=True)
+    logger.info("Disconnected from Redis.")
+
+
+async def get_redis_db(request: Request) -> redis.Redis:
+    """
+    Dependency that provides the shared Redis client created in the lifespan hook.
+    """
+    return request.app.state.redis_client
+
+
+def link_cache_key(slug: str) -> str:
+    # 格式版本放在 key 中：舊版 worker 讀不到新格式，不會遇到 WRONGTYPE
+    return f"link:v{CACHE_FORMAT_VERSION}:{slug}"
+
+
+def legacy_link_cache_key(slug: str) -> str:
+    return f"link_data:{slug}"
+
+
+def encode_link_data(link_data: dict) -> str:
+    """
+    Compact cache value: "<version>|<flags>|<expires_at>|<password>|<original_url>".
+    The URL goes last so it may contain the separator.
+    """
+    flags = LINK_FLAG_ACTIVE if link_data["is_active"] else 0
+    redirect_type = link_data.get("redirect_type", DEFAULT_REDIRECT_TYPE)
+    if redirect_type in (301, 308):
+        flags |= LINK_FLAG_PERMANENT
+    if redirect_type in (307, 308):
+        flags |= LINK_FLAG_PRESERVE_METHOD
+    expires_at = link_data.get("expires_at")
+    return "|".join(
+        (
+            CACHE_FORMAT_VERSION,
+            str(flags),
+            "" if expires_at is None else str(int(expires_at)),
+            link_data["password"] or "",
+            link_data["original_url"],
+        )
+    )
+
+
+def decode_link_data(value: Optional[str]) -> Optional[Any]:
+    """
+    Parses a cached value. Returns the link data, NOT_FOUND for a negative
+    entry, or None for a miss or a value written in an unknown format.
+    """
+    if value is None:
+        return None
+    if value == NOT_FOUND_VALUE or value == LEGACY_NOT_FOUND_VALUE:
+        return NOT_FOUND
+    parts = value.split("|", 4)
+    if len(parts) != 5 or parts[0] != CACHE_FORMAT_VERSION:
+        # 其他版本寫入的值當作未命中，交由 MongoDB 重新填入
+        return None
+    _, flags, expires_at, password, original_url = parts
+    flags = int(flags)
+    permanent = flags & LINK_FLAG_PERMANENT
+    if flags & LINK_FLAG_PRESERVE_METHOD:
+        redirect_type = 308 if permanent else 307
+    else:
+        redirect_type = 301 if permanent else 302
+    return {
+        "original_url": original_url,
+        "is_active": bool(flags & LINK_FLAG_ACTIVE),
+        "password": password or None,
+        "expires_at": float(expires_at) if expires_at else None,
+        "redirect_type": redirect_type,
+    }
+
+
+async def _copy_legacy_link(
+    redis_client: redis.Redis, slug: str, reply
+) -> Optional[str]:
+    """
+    Stores a value returned by _READ_LEGACY_LINK_SCRIPT under the current key
+    with the legacy key's remaining TTL. Returns the value, or None if there
+    was no usable legacy entry.
+    """
+    if not reply:
+        return None
+    value, ttl_ms = reply
+    if decode_link_data(value) is None:
+        return None
+    if ttl_ms > 0:
+        await redis_client.set(link_cache_key(slug), value, px=ttl_ms)
+    else:
+        await redis_client.set(link_cache_key(slug), value, ex=LINK_CACHE_TTL)
+    return value
+
+
+async def read_legacy_link(redis_client: redis.Redis, slug: str) -> Optional[str]:
+    """
+    Reads a link cached by a previous version under its legacy key and copies
+    it to the current key, so later reads need a single GET. The legacy key
+    is left for workers still running the previous version.
+    """
+    reply = await redis_client.eval(
+        _READ_LEGACY_LINK_SCRIPT,
+        1,
+        legacy_link_cache_key(slug),
+        CACHE_FORMAT_VERSION,
+        LINK_FLAG_ACTIVE,
+    )
+    return await _copy_legacy_link(redis_client, slug, reply)
+
+
+async def read_cached_link(redis_client: redis.Redis, slug: str) -> Optional[Any]:
+    """
+    Reads a link from Redis with a single GET (plus a legacy lookup on a
+    miss while LEGACY_LINK_KEYS is on). Returns the link data, NOT_FOUND for
+    a cached "not found" marker, or None on a miss.
+    """
+    value = await redis_client.get(link_cache_key(slug))
+    if value is None and LEGACY_LINK_KEYS:
+        value = await read_legacy_link(redis_client, slug)
+
+    cached = decode_link_data(value)
+    if cached is not None:
+        logger.debug("Cache hit for slug: %s", slug)
+    return cached
+
+
+async def read_cached_links(
+    redis_client: redis.Redis, slugs: List[str]
+) -> Dict[str, Any]:
+    """
+    Bulk version of read_cached_link: one pipelined round trip for all slugs,
+    plus two for the legacy lookup of the misses while LEGACY_LINK_KEYS is on.
+    Returns link data or NOT_FOUND per cached slug; misses are left out.
+    """
+    pipeline = redis_client.pipeline(transaction=False)
+    for slug in slugs:
+        pipeline.get(link_cache_key(slug))
+    values = dict(zip(slugs, await pipeline.execute()))
+
+    misses = [slug for slug, value in values.items() if value is None]
+    if misses and LEGACY_LINK_KEYS:
+        for slug in misses:
+            pipeline.eval(
+                _READ_LEGACY_LINK_SCRIPT,
+                1,
+                legacy_link_cache_key(slug),
+                CACHE_FORMAT_VERSION,
+                LINK_FLAG_ACTIVE,
+            )
+        replies = await pipeline.execute()
+        for slug, reply in zip(misses, replies):
+            values[slug] = await _copy_legacy_link(pipeline, slug, reply)
+        await pipeline.execute()
+
+    cached = {}
+    for slug, value in values.items():
+        link_data = decode_link_data(value)
+        if link_data is not None:
+            cached[slug] = link_data
+    return cached
+
+
+def link_cache_ttl(link_data: dict, ttl: int = LINK_CACHE_TTL) -> int:
+    """
+    Cache TTL in seconds: `ttl`, shortened to the link's remaining lifetime.
+    Already expired links are kept for NOT_FOUND_CACHE_TTL so repeated hits
+    do not fall through to MongoDB.
+    """
+    expires_at = link_data.get("expires_at")
+    if expires_at is None:
+        return ttl
+    remaining = int(expires_at - time.time())
+    return min(ttl, max(remaining, NOT_FOUND_CACHE_TTL))
+
+
+async def cache_link(
+    redis_client: redis.Redis, slug: str, link_data: dict, ttl: Optional[int] = None
+):
+    await redis_client.set(
+        link_cache_key(slug),
+        encode_link_data(link_data),
+        ex=link_cache_ttl(link_data, ttl or LINK_CACHE_TTL),
+    )
+
+
+async def extend_cached_links(redis_client: redis.Redis, ttls: Dict[str, int]):
+    """
+    Raises the TTL of cached links in one pipeline. EXPIRE GT (Redis 7+)
+    never shortens a TTL and leaves missing keys alone.
+    """
+    pipeline = redis_client.pipeline(transaction=False)
+    for slug, ttl in ttls.items():
+        pipeline.expire(link_cache_key(slug), ttl, gt=True)
+    await pipeline.execute()
+
+
+async def apply_memory_budget(redis_client: redis.Redis):
+    """
+    With REDIS_MEMORY_BUDGET_MB set, caps each Redis node at that much memory
+    and lets Redis evict the least frequently used keys first (allkeys-lfu).
+    Best effort: managed Redis services often disable CONFIG SET.
+    """
+    budget = float(os.environ.get("REDIS_MEMORY_BUDGET_MB", 0))
+    if budget <= 0:
+        return
+    clients = (
+        redis_client.clients.values()
+        if isinstance(redis_client, ShardedRedis)
+        else [redis_client]
+    )
+    for client in clients:
+        try:
+            await client.config_set("maxmemory", int(budget * 1024**2))
+            await client.config_set("maxmemory-policy", "allkeys-lfu")
+        except (redis.ResponseError, redis.ConnectionError, redis.TimeoutError) as e:
+            logger.warning("Could not apply the Redis memory budget: %s", e)
+
+
+async def delete_cached_link(redis_client: redis.Redis, slug: str):
+    if not LEGACY_LINK_KEYS:
+        await redis_client.delete(link_cache_key(slug))
+        return
+    # 兩個 key 可能在不同的分片上：各自送出 DEL
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.delete(link_cache_key(slug))
+    pipeline.delete(legacy_link_cache_key(slug))
+    await pipeline.execute()
+
+
+async def claim_edge_purge(redis_client: redis.Redis, slug: str) -> bool:
+    """
+    Every worker applies each link change; the first one to claim the slug
+    purges the CDN and the others skip it for EDGE_PURGE_DEDUP_MS.
+    """
+    dedup_ms = int(os.environ.get("EDGE_PURGE_DEDUP_MS", 1000))
+    claimed = await redis_client.set(
+        f"purge:{link_cache_key(slug)}", 1, nx=True, px=dedup_ms
+    )
+    return bool(claimed)
+
+
+async def cache_missing_link(redis_client: redis.Redis, slug: str):
+    # Cache a "not found" value to prevent cache penetration
+    await redis_client.set(
+        link_cache_key(slug), NOT_FOUND_VALUE, ex=NOT_FOUND_CACHE_TTL
+    )
+
+
+async def acquire_fill_lock(redis_client: redis.Redis, slug: str) -> Optional[str]:
+    """
+    Takes the short cross-worker lock that guards refilling a slug from MongoDB.
+    Returns the lock token, or None if another worker already holds it.
+    """
+    token = uuid.uuid4().hex
+    lock_ttl_ms = int(os.environ.get("CACHE_FILL_LOCK_TTL_MS", 3000))
+    acquired = await redis_client.set(
+        f"lock:{link_cache_key(slug)}", token, nx=True, px=lock_ttl_ms
+    )
+    return token if acquired else None
+
+
+async def release_fill_lock(redis_client: redis.Redis, slug: str, token: str):
+    await redis_client.eval(
+        _RELEASE_LOCK_SCRIPT, 1, f"lock:{link_cache_key(slug)}", token
+    )
+
+
+async def wait_for_cached_link(redis_client: redis.Redis, slug: str) -> Optional[Any]:
     """
-    Dependency that provides a Redis client and handles its closing.
+    Polls Redis while another worker holds the fill lock, for at most
+    CACHE_FILL_LOCK_WAIT seconds. Returns what read_cached_link returns.
     """
-    redis_client = get_redis_client_instance()
+    wait = float(os.environ.get("CACHE_FILL_LOCK_WAIT", 0.5))
     try:
-        yield redis_client
-    finally:
-        if redis_client:
-            redis_client.close()
-            print("Disconnected from Redis.")
+        # 整體等待時間有上限，單次讀取卡住也不會超過
+        async with asyncio.timeout(wait):
+            while True:
+                await asyncio.sleep(0.02)
+                cached = await read_cached_link(redis_client, slug)
+                if cached is not None:
+                    return cached
+    except TimeoutError:
+        return None
@@ -0,0 +1,165 @@
+# redirect-service/clicks.py
+import asyncio
+import contextlib
+import glob
+import json
+import logging
+import os
+import re
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional
+
+from models import Link
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+async def increment_click_counts(counts: Dict[str, int]) -> None:
+    """
+    Applies aggregated clicks to Link.click_count with one unordered bulk_write.
+    """
+    await Link.get_motor_collection().bulk_write(
+        [
+            UpdateOne({"slug": slug}, {"$inc": {"click_count": count}})
+            for slug, count in counts.items()
+        ],
+        ordered=False,
+    )
+
+
+class ClickAggregator:
+    """
+    Counts clicks per slug in memory and hands the totals to `sink` every
+    `interval` seconds, so one window costs one write per slug instead of one
+    per click.
+
+    The sink may return the counts it could not deliver; those, and every
+    count of a flush that raised or was cancelled, are kept for the next
+    window. stop() lets an in-flight flush finish, then flushes what is left;
+    if that fails too the counts are written to a per-process file next to
+    `state_file` (`<state_file>.<pid>`), so workers sharing the path do not
+    overwrite each other. start() claims and loads every such file left by
+    earlier processes.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[Dict[str, int]], Awaitable[Optional[Dict[str, int]]]],
+        interval: float = 5.0,
+        state_file: Optional[str] = None,
+    ):
+        self._sink = sink
+        self.interval = interval
+        self.state_file = state_file
+        self._counts: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self.recorded = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(self._counts.values())
+
+    def record(self, slug: str):
+        self._counts[slug] += 1
+        self.recorded += 1
+
+    def start(self):
+        self._load_state()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # 不取消 task：進行中的 flush 完成 (或把計數放回) 後迴圈才結束
+            self._stopping.set()
+            await self._task
+            self._task = None
+            self._stopping.clear()
+        if not await self.flush():
+            self._save_state()
+
+    async def flush(self) -> bool:
+        """
+        Sends the current window to the sink. Returns False if it failed,
+        in which case the counts are merged back for the next attempt.
+        """
+        if not self._counts:
+            return True
+        counts, self._counts = self._counts, Counter()
+        try:
+            undelivered = await self._sink(dict(counts)) or {}
+        except Exception as e:
+            self._counts.update(counts)
+            self.failed_flushes += 1
+            logger.warning("Failed to flush clicks for %s slugs: %s", len(counts), e)
+            return False
+        except BaseException:
+            # 被取消時不知道 sink 完成了多少，寧可重複計數也不遺失
+            self._counts.update(counts)
+            raise
+        self._counts.update(undelivered)
+        self.flushed += sum(counts.values()) - sum(undelivered.values())
+        if undelivered:
+            self.failed_flushes += 1
+            return False
+        return True
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def _load_state(self):
+        if not self.state_file:
+            return
+        # 只讀取各 worker 寫入的 <state_file>.<pid>；其他同名前綴的檔案一律略過
+        pattern = re.compile(re.escape(os.path.basename(self.state_file)) + r"\.\d+")
+        restored = 0
+        for path in glob.glob(f"{glob.escape(self.state_file)}.*"):
+            if not pattern.fullmatch(os.path.basename(path)):
+                continue
+            # rename 是原子操作：同時啟動的 worker 只有一個能取得檔案
+            claimed = f"{self.state_file}.loading.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(claimed) as f:
+                    counts = Counter(
+                        {str(slug): int(count) for slug, count in json.load(f).items()}
+                    )
+                os.remove(claimed)
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                quarantined = f"{path}.corrupt"
+                logger.error(
+                    "Unreadable click state file %s, moved to %s: %s",
+                    path,
+                    quarantined,
+                    e,
+                )
+                with contextlib.suppress(OSError):
+                    os.rename(claimed, quarantined)
+                continue
+            self._counts.update(counts)
+            restored += sum(counts.values())
+        if restored:
+            logger.info(
+                "Restored %s unflushed clicks from %s.", restored, self.state_file
+            )
+
+    def _save_state(self):
+        if not self.state_file or not self._counts:
+            return
+        path = f"{self.state_file}.{os.getpid()}"
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(dict(self._counts), f)
+        os.replace(tmp_file, path)
+        logger.warning("Saved %s unflushed clicks to %s.", self.pending, path)
@@ -1,10 +1,26 @@
 # redirect-service/database.py
+import logging
 import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
 from beanie import init_beanie
 from models import Link
 from motor.motor_asyncio import AsyncIOMotorClient
 
+logger = logging.getLogger(__name__)
+
+# Only the fields the redirect path needs; used with raw Motor queries
+LINK_DATA_PROJECTION = {
+    "_id": 0,
+    "slug": 1,
+    "original_url": 1,
+    "is_active": 1,
+    "password": 1,
+    "expires_at": 1,
+    "redirect_type": 1,
+}
+
 
 async def connect_to_mongo():
     MONGO_HOST = os.environ.get("MONGO_HOST", "localhost")
@@ -16,15 +32,58 @@ async def connect_to_mongo():
 
     try:
         await database.command("ping")
-        print(f"Connected to MongoDB: {MONGO_DB} on {MONGO_HOST}:{MONGO_PORT}")
+        logger.info(
+            "Connected to MongoDB: %s on %s:%s", MONGO_DB, MONGO_HOST, MONGO_PORT
+        )
         await init_beanie(database=database, document_models=[Link])
-        print("Beanie ODM initialized.")
+        logger.info("Beanie ODM initialized.")
         return client, database
     except Exception as e:
-        print(f"MongoDB connection failed: {e}")
+        logger.error("MongoDB connection failed: %s", e)
         raise
 
 
 async def close_mongo_connection(client: AsyncIOMotorClient):
     client.close()
-    print("Disconnected from MongoDB.")
+    logger.info("Disconnected from MongoDB.")
+
+
+def link_data_from_document(document: dict) -> dict:
+    """
+    Converts a projected links document into the link data shape used by the caches.
+    expires_at becomes a Unix timestamp (MongoDB returns naive UTC datetimes).
+    """
+    expires_at: Optional[datetime] = document.get("expires_at")
+    if expires_at is not None and expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return {
+        "original_url": document["original_url"],
+        "is_active": document.get("is_active", True),
+        "password": document.get("password") or None,
+        "expires_at": expires_at.timestamp() if expires_at else None,
+        "redirect_type": document.get("redirect_type") or 302,
+    }
+
+
+async def fetch_link_data(slug: str) -> Optional[dict]:
+    """
+    Looks up the redirect-relevant fields of a link with a projected raw query,
+    skipping Beanie document construction. Returns None if the slug does not exist.
+    """
+    document = await Link.get_motor_collection().find_one(
+        {"slug": slug}, LINK_DATA_PROJECTION
+    )
+    return link_data_from_document(document) if document else None
+
+
+async def fetch_many_link_data(slugs: List[str]) -> Dict[str, dict]:
+    """
+    Looks up many links with a single projected `$in` query.
+    Returns link data keyed by slug; slugs that do not exist are left out.
+    """
+    cursor = Link.get_motor_collection().find(
+        {"slug": {"$in": slugs}}, LINK_DATA_PROJECTION
+    )
+    return {
+        document["slug"]: link_data_from_document(document) async for document in cursor
+    }
@@ -0,0 +1,146 @@
+# redirect-service/edge_cache.py
+import asyncio
+import logging
+import os
+import urllib.request
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+NO_STORE = "private, no-store"
+
+
+def surrogate_key(slug: str) -> str:
+    return f"link-{slug}"
+
+
+class RedirectCachePolicy:
+    """
+    HTTP caching headers for redirects.
+
+    Only links anyone can follow for as long as the cache keeps them - active,
+    without password and without expiry - are cacheable: browsers may keep
+    them `browser_max_age` seconds and shared caches (CDN) `edge_max_age`
+    seconds, tagged with the link's surrogate key so they can be purged when
+    the link changes. Everything else, including permanent redirects that
+    browsers would otherwise cache indefinitely, is sent with no-store.
+
+    Redirects answered from a cache never reach this service, so they are
+    not counted as clicks.
+    """
+
+    def __init__(
+        self,
+        edge_max_age: int = 0,
+        browser_max_age: int = 0,
+        surrogate_key_header: str = "Surrogate-Key",
+    ):
+        self.edge_max_age = edge_max_age
+        self.browser_max_age = browser_max_age
+        self.surrogate_key_header = surrogate_key_header
+
+    @property
+    def enabled(self) -> bool:
+        return self.edge_max_age > 0 or self.browser_max_age > 0
+
+    def cacheable(self, link_data: dict) -> bool:
+        return (
+            self.enabled
+            and link_data["is_active"]
+            and not link_data["password"]
+            and link_data["expires_at"] is None
+        )
+
+    def headers(self, slug: str, link_data: dict) -> Dict[str, str]:
+        if not self.cacheable(link_data):
+            return {"Cache-Control": NO_STORE}
+        headers = {
+            "Cache-Control": (
+                f"public, max-age={self.browser_max_age}, "
+                f"s-maxage={self.edge_max_age}"
+            )
+        }
+        if self.surrogate_key_header:
+            headers[self.surrogate_key_header] = surrogate_key(slug)
+        return headers
+
+
+class EdgePurger:
+    """
+    Purges a link's cached redirect from the CDN by surrogate key.
+
+    `url` is a template such as
+    "https://api.fastly.com/service/<id>/purge/{key}"; {key} is the surrogate
+    key and {slug} the slug. Requests run on a worker thread with a short
+    timeout, and failures are only logged: the edge copy then lives until
+    its max-age.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        method: str = "POST",
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 2.0,
+        opener=urllib.request.urlopen,
+    ):
+        self.url = url
+        self.method = method
+        self.headers = headers or {}
+        self.timeout = timeout
+        self._opener = opener
+        self.purged = 0
+        self.failed = 0
+
+    async def purge(self, slug: str) -> bool:
+        request = urllib.request.Request(
+            self.url.format(key=surrogate_key(slug), slug=slug),
+            method=self.method,
+            headers=self.headers,
+        )
+        try:
+            await asyncio.to_thread(self._send, request)
+        except OSError as e:
+            self.failed += 1
+            logger.warning("Edge purge of %s failed: %s", slug, e)
+            return False
+        self.purged += 1
+        return True
+
+    def _send(self, request: urllib.request.Request):
+        with self._opener(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def create_redirect_cache_policy() -> RedirectCachePolicy:
+    """
+    Builds the redirect caching policy from environment variables.
+    REDIRECT_EDGE_MAX_AGE and REDIRECT_BROWSER_MAX_AGE default to 0, which
+    keeps every redirect uncacheable.
+    """
+    return RedirectCachePolicy(
+        edge_max_age=int(os.environ.get("REDIRECT_EDGE_MAX_AGE", 0)),
+        browser_max_age=int(os.environ.get("REDIRECT_BROWSER_MAX_AGE", 0)),
+        surrogate_key_header=os.environ.get("SURROGATE_KEY_HEADER", "Surrogate-Key"),
+    )
+
+
+def create_edge_purger() -> Optional[EdgePurger]:
+    """
+    Builds the purger from EDGE_PURGE_URL (empty disables purging),
+    EDGE_PURGE_METHOD and EDGE_PURGE_HEADERS ("Name: value; Name: value").
+    """
+    url = os.environ.get("EDGE_PURGE_URL", "")
+    if not url:
+        return None
+    headers = {}
+    for header in os.environ.get("EDGE_PURGE_HEADERS", "").split(";"):
+        name, _, value = header.partition(":")
+        if name.strip():
+            headers[name.strip()] = value.strip()
+    return EdgePurger(
+        url,
+        method=os.environ.get("EDGE_PURGE_METHOD", "POST"),
+        headers=headers,
+        timeout=float(os.environ.get("EDGE_PURGE_TIMEOUT", 2)),
+    )
@@ -0,0 +1,95 @@
+# redirect-service/fast_path.py
+import functools
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import RedirectResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# 與 starlette.responses.RedirectResponse 相同的 Location 編碼規則
+_LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+_EMPTY_BODY_HEADER = (b"content-length", b"0")
+
+
+@functools.lru_cache(maxsize=4096)
+def _location(url: str) -> bytes:
+    return quote(url, safe=_LOCATION_SAFE).encode("latin-1")
+
+
+@functools.lru_cache(maxsize=64)
+def _header(name: str) -> bytes:
+    return name.lower().encode("latin-1")
+
+
+class FastRedirectResponse(RedirectResponse):
+    """
+    RedirectResponse built straight from raw headers. The quoted Location of
+    recently served URLs is cached, and none of Response's content rendering
+    or header-normalizing steps run per request.
+    """
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str]):
+        self.status_code = status_code
+        self.background = None
+        self.body = b""
+        raw_headers: List[Tuple[bytes, bytes]] = [
+            (_header(name), value.encode("latin-1")) for name, value in headers.items()
+        ]
+        raw_headers.append(_EMPTY_BODY_HEADER)
+        raw_headers.append((b"location", _location(url)))
+        self.raw_headers = raw_headers
+
+
+def error_response(e: HTTPException) -> Response:
+    """Same response as FastAPI's default HTTPException handler."""
+    return Response(
+        json.dumps({"detail": e.detail}, ensure_ascii=False, separators=(",", ":")),
+        status_code=e.status_code,
+        headers=e.headers,
+        media_type="application/json",
+    )
+
+
+class RedirectFastPath:
+    """
+    ASGI middleware answering GET/HEAD `<prefix><slug>` with `handler`
+    directly, skipping the middleware added before it, routing and FastAPI's
+    parameter and dependency handling. Every other request goes through the
+    app as usual. The route should stay registered for documentation and as
+    the fallback when the fast path is disabled.
+
+    `handler(slug, request, password)` returns the response or raises
+    HTTPException.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        prefix: str,
+        handler: Callable[[str, Request, Optional[str]], Awaitable[Response]],
+    ):
+        self.app = app
+        self.prefix = prefix
+        self.handler = handler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            path: str = scope["path"]
+            slug = path[len(self.prefix) :]
+            if path.startswith(self.prefix) and slug and "/" not in slug:
+                request = Request(scope, receive)
+                password = (
+                    request.query_params.get("password")
+                    if scope["query_string"]
+                    else None
+                )
+                try:
+                    response = await self.handler(slug, request, password)
+                except HTTPException as e:
+                    response = error_response(e)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,286 @@
+# redirect-service/invalidation.py
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import pika
+from database import link_data_from_document
+from messaging import create_rabbitmq_connection
+from models import Link
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+LINK_CHANGES_EXCHANGE = "link_changes"
+
+# (slug, new link data); None means the link is gone or its data is unknown
+LinkChange = Tuple[str, Optional[dict]]
+LinkChangeHandler = Callable[[str, Optional[dict]], Awaitable[None]]
+
+
+def link_changes_from_message(body: bytes) -> List[LinkChange]:
+    """
+    Parses a message published by the admin backend:
+        {"slug": "abc", "old_slug": "previous-slug"}   # old_slug optional
+    Messages carry no link data, so every affected slug is invalidated.
+    """
+    message = json.loads(body)
+    slugs = [message["slug"]]
+    if message.get("old_slug") and message["old_slug"] != message["slug"]:
+        slugs.append(message["old_slug"])
+    return [(slug, None) for slug in slugs]
+
+
+def link_changes_from_change_event(change: dict) -> List[LinkChange]:
+    """
+    Converts a links change stream event. Updates carry the current document,
+    so the new data can be cached right away; a deleted or renamed slug is
+    only known when pre-images are enabled on the collection.
+    """
+    changes: List[LinkChange] = []
+    document = change.get("fullDocument")
+    previous = change.get("fullDocumentBeforeChange")
+    if document is not None:
+        changes.append((document["slug"], link_data_from_document(document)))
+    if previous is not None and (
+        document is None or previous["slug"] != document["slug"]
+    ):
+        changes.append((previous["slug"], None))
+    return changes
+
+
+def change_event_missing_pre_image(change: dict) -> bool:
+    """
+    True for a delete, or an update that changed the slug, that arrived
+    without its pre-image: the slug to evict is unknown.
+    """
+    if change.get("fullDocumentBeforeChange") is not None:
+        return False
+    if change.get("operationType") == "delete":
+        return True
+    updated = change.get("updateDescription", {}).get("updatedFields", {})
+    return "slug" in updated
+
+
+async def pre_images_enabled(collection) -> bool:
+    """Whether changeStreamPreAndPostImages is enabled on `collection`."""
+    options = await collection.options()
+    return bool(options.get("changeStreamPreAndPostImages", {}).get("enabled"))
+
+
+class RabbitInvalidationConsumer:
+    """
+    Receives link-change messages from the `link_changes` fanout exchange.
+
+    Each worker binds its own exclusive, auto-deleted queue so every worker
+    sees every change and can evict its in-process caches. pika runs on a
+    dedicated thread; each message is handled on the event loop and acked
+    once the handler finished. Connection failures are retried every
+    `retry_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        handler: LinkChangeHandler,
+        connection_factory: Callable[[], pika.BlockingConnection] = (
+            create_rabbitmq_connection
+        ),
+        retry_interval: float = 5.0,
+    ):
+        self._handler = handler
+        self._connection_factory = connection_factory
+        self.retry_interval = retry_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.received = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="link-invalidation", daemon=True
+            )
+            self._thread.start()
+
+    async def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._consume()
+            except Exception as e:
+                logger.warning(
+                    "Link invalidation consumer disconnected, retrying in %ss: %s",
+                    self.retry_interval,
+                    e,
+                )
+                self._stopping.wait(self.retry_interval)
+
+    def _consume(self):
+        connection = self._connection_factory()
+        try:
+            channel = connection.channel()
+            channel.exchange_declare(
+                exchange=LINK_CHANGES_EXCHANGE, exchange_type="fanout", durable=True
+            )
+            queue = channel.queue_declare(queue="", exclusive=True, auto_delete=True)
+            queue_name = queue.method.queue
+            channel.queue_bind(exchange=LINK_CHANGES_EXCHANGE, queue=queue_name)
+            logger.info("Listening for link changes on %s.", LINK_CHANGES_EXCHANGE)
+            # inactivity_timeout 讓迴圈定期檢查是否該停止
+            for method, _, body in channel.consume(queue_name, inactivity_timeout=1):
+                if self._stopping.is_set():
+                    break
+                if method is None:
+                    continue
+                self._handle(body)
+                channel.basic_ack(method.delivery_tag)
+            channel.cancel()
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def _handle(self, body: bytes):
+        self.received += 1
+        try:
+            changes = link_changes_from_message(body)
+        except (ValueError, KeyError) as e:
+            self.failed += 1
+            logger.warning("Ignoring malformed link change message: %s", e)
+            return
+        for slug, link_data in changes:
+            future = asyncio.run_coroutine_threadsafe(
+                self._handler(slug, link_data), self._loop
+            )
+            try:
+                future.result()
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Failed to apply link change for %s: %s", slug, e)
+
+
+class ChangeStreamInvalidationConsumer:
+    """
+    Watches the links collection with a MongoDB change stream (requires a
+    replica set). Resumes after the last seen event when the stream breaks.
+
+    Deletes and renames name their old slug only through pre-images. Without
+    them those events cannot be applied, and the link keeps redirecting from
+    Redis until its TTL expires. They are counted as failed, and startup
+    logs an error when the collection does not record pre-images.
+    """
+
+    def __init__(self, handler: LinkChangeHandler, retry_interval: float = 5.0):
+        self._handler = handler
+        self.retry_interval = retry_interval
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+        self.pre_images: Optional[bool] = None
+        self.received = 0
+        self.failed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _check_pre_images(self):
+        collection = Link.get_motor_collection()
+        try:
+            self.pre_images = await pre_images_enabled(collection)
+        except PyMongoError as e:
+            # 沒有權限讀取集合設定時不影響監聽，只是無法預先警告
+            self.pre_images = False
+            logger.warning("Could not check change stream pre-images: %s", e)
+            return
+        if not self.pre_images:
+            logger.error(
+                "Change stream pre-images are disabled on %s: deleted and renamed "
+                "links keep redirecting until their cache TTL expires. Enable them "
+                "with collMod %s changeStreamPreAndPostImages: {enabled: true}.",
+                collection.name,
+                collection.name,
+            )
+
+    async def _run(self):
+        while True:
+            try:
+                if self.pre_images is None:
+                    await self._check_pre_images()
+                await self._watch()
+            except PyMongoError as e:
+                logger.warning(
+                    "Link change stream failed, retrying in %ss: %s",
+                    self.retry_interval,
+                    e,
+                )
+                await asyncio.sleep(self.retry_interval)
+
+    async def _watch(self):
+        pipeline = [
+            {
+                "$match": {
+                    "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+                }
+            }
+        ]
+        async with Link.get_motor_collection().watch(
+            pipeline,
+            full_document="updateLookup",
+            full_document_before_change="whenAvailable",
+            resume_after=self._resume_token,
+        ) as stream:
+            logger.info("Watching the links collection for changes.")
+            async for change in stream:
+                await self._apply(change)
+                self._resume_token = stream.resume_token
+
+    async def _apply(self, change: dict):
+        self.received += 1
+        if change_event_missing_pre_image(change):
+            self.failed += 1
+            logger.warning(
+                "Link %s event for %s has no pre-image, the old slug stays cached.",
+                change.get("operationType"),
+                change.get("documentKey"),
+            )
+        for slug, link_data in link_changes_from_change_event(change):
+            try:
+                await self._handler(slug, link_data)
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Failed to apply link change for %s: %s", slug, e)
+
+
+def create_invalidation_consumer(handler: LinkChangeHandler):
+    """
+    Builds the consumer selected by LINK_INVALIDATION:
+      off           - no invalidation, cached links live until their TTL (default)
+      rabbitmq      - messages on the link_changes fanout exchange
+      change_stream - MongoDB change stream on the links collection
+    """
+    mode = os.environ.get("LINK_INVALIDATION", "off").lower()
+    retry_interval = float(os.environ.get("LINK_INVALIDATION_RETRY_INTERVAL", 5))
+    if mode == "rabbitmq":
+        return RabbitInvalidationConsumer(handler, retry_interval=retry_interval)
+    if mode == "change_stream":
+        return ChangeStreamInvalidationConsumer(handler, retry_interval=retry_interval)
+    return None
@@ -0,0 +1,153 @@
+# redirect-service/local_cache.py
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# 代表「確定不存在」的 negative entry，與一般的 cache miss (None) 區分
+NOT_FOUND = object()
+
+
+class LocalLinkCache:
+    """
+    Bounded in-process LRU cache for link data, consulted before Redis.
+
+    Entries expire after `ttl` seconds (`negative_ttl` for NOT_FOUND entries)
+    and the least recently used entry is evicted once `max_size` is reached.
+    The cache is only touched from the event loop, so no locking is needed.
+
+    Link entries are kept for another `stale_ttl` seconds after they expire so
+    they can still be served by get_stale() while Redis or MongoDB are
+    unhealthy. Entries read after `soft_ttl` seconds are reported once by
+    refresh_due() so hot links can be refreshed before they expire.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 30.0,
+        negative_ttl: float = 5.0,
+        stale_ttl: float = 0.0,
+        soft_ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.soft_ttl = soft_ttl
+        self._clock = clock
+        # slug -> [expires_at, refresh_at, value]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, slug: str) -> Optional[Any]:
+        """
+        Returns the cached link data, NOT_FOUND for a negative entry,
+        or None on a miss.
+        """
+        entry = self._entries.get(slug)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, value = entry
+        now = self._clock()
+        if expires_at <= now:
+            # 過期的連結在 stale 期間內保留，供 get_stale() 使用
+            if value is NOT_FOUND or expires_at + self.stale_ttl <= now:
+                del self._entries[slug]
+                self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(slug)
+        if value is NOT_FOUND:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_stale(self, slug: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns link data even if it has expired, as long as it is within
+        `stale_ttl`. Negative entries are never served stale.
+        """
+        entry = self._entries.get(slug)
+        if entry is None or entry[2] is NOT_FOUND:
+            return None
+        if entry[0] + self.stale_ttl <= self._clock():
+            return None
+        self.stale_hits += 1
+        return entry[2]
+
+    def refresh_due(self, slug: str) -> bool:
+        """
+        True once per entry when a fresh link entry is past its soft TTL.
+        """
+        entry = self._entries.get(slug)
+        if entry is None or entry[1] > self._clock():
+            return False
+        entry[1] = float("inf")
+        return True
+
+    def set(self, slug: str, link_data: Dict[str, Any]):
+        self._store(slug, link_data, self.ttl)
+
+    def set_not_found(self, slug: str):
+        self._store(slug, NOT_FOUND, self.negative_ttl)
+
+    def invalidate(self, slug: str):
+        self._entries.pop(slug, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale_hits": self.stale_hits,
+        }
+
+    def _store(self, slug: str, value: Any, ttl: float):
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        now = self._clock()
+        refresh_at = (
+            now + self.soft_ttl
+            if self.soft_ttl is not None and value is not NOT_FOUND
+            else float("inf")
+        )
+        self._entries[slug] = [now + ttl, refresh_at, value]
+        self._entries.move_to_end(slug)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+def create_link_cache() -> LocalLinkCache:
+    """
+    Builds the process-wide link cache from environment variables.
+    LOCAL_CACHE_MAX_SIZE=0 disables it; LOCAL_CACHE_SOFT_TTL defaults to 80%
+    of LOCAL_CACHE_TTL.
+    """
+    ttl = float(os.environ.get("LOCAL_CACHE_TTL", 30))
+    return LocalLinkCache(
+        max_size=int(os.environ.get("LOCAL_CACHE_MAX_SIZE", 10000)),
+        ttl=ttl,
+        negative_ttl=float(os.environ.get("LOCAL_CACHE_NEGATIVE_TTL", 5)),
+        stale_ttl=float(os.environ.get("LOCAL_CACHE_STALE_TTL", 3600)),
+        soft_ttl=float(os.environ.get("LOCAL_CACHE_SOFT_TTL", ttl * 0.8)),
+    )
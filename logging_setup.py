@@ -0,0 +1,35 @@
+# redirect-service/logging_setup.py
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging() -> QueueListener:
+    """
+    Sends the service's log records through an in-memory queue. The handler on
+    the event loop only enqueues; a QueueListener thread formats the records
+    and writes them to stderr. Level comes from LOG_LEVEL (default INFO).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
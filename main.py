@@ -1,19 +1,211 @@
 # redirect-service/main.py
+import asyncio
+import logging
+import math
+import os
+import time
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Dict, List, Optional, Set
 
-import redis
-from cache import get_redis_db
-from database import close_mongo_connection, connect_to_mongo
+from cache import (
+    DEFAULT_REDIRECT_TYPE,
+    acquire_fill_lock,
+    apply_memory_budget,
+    cache_link,
+    cache_missing_link,
+    claim_edge_purge,
+    close_redis_connection,
+    connect_to_redis,
+    delete_cached_link,
+    extend_cached_links,
+    get_redis_db,
+    read_cached_link,
+    read_cached_links,
+    release_fill_lock,
+    wait_for_cached_link,
+)
+from database import (
+    close_mongo_connection,
+    connect_to_mongo,
+    fetch_link_data,
+    fetch_many_link_data,
+)
+from edge_cache import create_edge_purger, create_redirect_cache_policy
+from fast_path import FastRedirectResponse, RedirectFastPath
 from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
-from fastapi.responses import RedirectResponse
-from messaging import publish_click_event
-from models import Link
-from passlib.context import CryptContext  # 導入密碼雜湊工具
+from fastapi.responses import PlainTextResponse, RedirectResponse
+from invalidation import create_invalidation_consumer
+from local_cache import NOT_FOUND, create_link_cache
+from logging_setup import configure_logging
+from messaging import (
+    publish_click_event,
+    start_click_publisher,
+    stop_click_publisher,
+)
+from metrics import (
+    CACHE_LOOKUPS,
+    LINK_INVALIDATIONS,
+    LINK_REFRESHES,
+    RATE_LIMITED,
+    REDIRECTS,
+    REGISTRY,
+    STAGE_LATENCY,
+    STALE_SERVED,
+)
+from popularity import create_popularity_tracker
+from pydantic import BaseModel, Field
+from pymongo.errors import PyMongoError
+from rate_limit import (
+    Check,
+    RateLimitExceeded,
+    create_rate_limiter,
+    retry_after_header,
+)
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from resilience import DependencyUnavailable, create_circuit_breaker
+from security import (
+    ACCESS_COOKIE_NAME,
+    pwd_context,
+    set_access_cookie,
+    verify_access_token,
+    verify_password,
+)
+from sharding import ShardedRedis
+from shared_snapshot import create_link_snapshot
+from singleflight import SingleFlight
+from slug_index import create_slug_index
 from starlette.middleware.cors import CORSMiddleware  # 導入 CORSMiddleware
+from warmup import run_cache_warmup
+
+# Log records are written to stderr by a background thread, not the event loop
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# In-process L1 cache in front of Redis (per worker process)
+link_cache = create_link_cache()
+# One in-flight MongoDB lookup per slug per worker
+link_loader = SingleFlight()
+# Bloom-filter front door: unknown or malformed slugs are rejected without I/O
+slug_index = create_slug_index()
+# Optional mmap snapshot of the hottest links, shared by the workers on a host
+link_snapshot = create_link_snapshot()
+# Per-worker hit counters; hot links get longer Redis TTLs
+link_popularity = create_popularity_tracker()
+# Per-dependency timeouts and circuit breakers for the redirect path
+redis_breaker = create_circuit_breaker(
+    "redis", (RedisError, OSError), default_timeout=0.25
+)
+mongo_breaker = create_circuit_breaker("mongo", (PyMongoError,), default_timeout=1.0)
+rate_limiter = create_rate_limiter()
+# HTTP caching of redirects by browsers and the CDN (off unless configured)
+redirect_cache_policy = create_redirect_cache_policy()
+edge_purger = create_edge_purger()
+# In-flight background refreshes of local cache entries, by slug
+link_refreshes: Dict[str, asyncio.Task] = {}
+# Delayed second pass of each applied link change, see apply_link_change
+LINK_INVALIDATION_REPEAT_DELAY = float(
+    os.environ.get("LINK_INVALIDATION_REPEAT_DELAY", 2)
+)
+link_invalidations: Set[asyncio.Task] = set()
+link_change_consumer = None
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+REGISTRY.callback(
+    "link_local_cache_entries",
+    "Entries in this worker's local link cache.",
+    lambda: len(link_cache),
+)
+REGISTRY.callback(
+    "link_local_cache_evictions_total",
+    "Local link cache entries evicted to stay within LOCAL_CACHE_MAX_SIZE.",
+    lambda: link_cache.evictions,
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "link_loader_coalesced_total",
+    "Cache misses that joined an in-flight MongoDB lookup.",
+    lambda: link_loader.coalesced,
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "dependency_circuit_open",
+    "1 while the dependency's circuit breaker is open or half-open.",
+    lambda: {
+        (breaker.name,): float(breaker.state != breaker.CLOSED)
+        for breaker in (redis_breaker, mongo_breaker)
+    },
+    labelnames=("dependency",),
+)
+REGISTRY.callback(
+    "dependency_failures_total",
+    "Dependency calls that failed or timed out.",
+    lambda: {
+        (breaker.name,): breaker.failures for breaker in (redis_breaker, mongo_breaker)
+    },
+    metric_type="counter",
+    labelnames=("dependency",),
+)
+REGISTRY.callback(
+    "link_snapshot_entries",
+    "Links in the shared snapshot mapped by this worker.",
+    lambda: len(link_snapshot),
+)
+REGISTRY.callback(
+    "link_snapshot_age_seconds",
+    "Age of the shared link snapshot mapped by this worker.",
+    lambda: link_snapshot.stats()["age_seconds"],
+)
+REGISTRY.callback(
+    "link_change_events_total",
+    "Link change events received by this worker.",
+    lambda: {
+        ("received",): getattr(link_change_consumer, "received", 0),
+        ("failed",): getattr(link_change_consumer, "failed", 0),
+    },
+    metric_type="counter",
+    labelnames=("result",),
+)
+REGISTRY.callback(
+    "link_popularity_tracked",
+    "Slugs whose popularity this worker tracks for adaptive TTLs.",
+    lambda: len(link_popularity),
+)
+REGISTRY.callback(
+    "link_ttl_extensions_total",
+    "Cached links whose Redis TTL was extended because they became popular.",
+    lambda: link_popularity.extended,
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "edge_purges_total",
+    "CDN purges of changed links sent by this worker.",
+    lambda: {
+        ("ok",): getattr(edge_purger, "purged", 0),
+        ("failed",): getattr(edge_purger, "failed", 0),
+    },
+    metric_type="counter",
+    labelnames=("result",),
+)
+REGISTRY.callback(
+    "slug_index_false_positive_rate",
+    "Estimated false-positive rate of the slug Bloom filter.",
+    lambda: slug_index.stats().get("false_positive_rate"),
+)
+REGISTRY.callback(
+    "slug_index_memory_bytes",
+    "Memory used by the slug Bloom filter.",
+    lambda: slug_index.stats().get("memory_bytes"),
+)
+REGISTRY.callback(
+    "slug_index_rejections_total",
+    "Requests rejected by the slug index without any I/O.",
+    lambda: {
+        ("malformed",): slug_index.rejected_malformed,
+        ("absent",): slug_index.rejected_absent,
+    },
+    metric_type="counter",
+    labelnames=("reason",),
+)
 
 
 # Global variables for MongoDB client (仍然需要，因為Beanie初始化需要)
@@ -23,14 +215,45 @@ mongodb = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global mongo_client, mongodb
+    global mongo_client, mongodb, link_change_consumer
     # Connect to MongoDB
     mongo_client, mongodb = await connect_to_mongo()
-    # Redis connection will be handled by dependency injection per request
+    # Shared Redis connection pool, injected into routes by get_redis_db
+    app.state.redis_client = await connect_to_redis()
+    # Optional REDIS_MEMORY_BUDGET_MB, evicting the least frequently used keys
+    await apply_memory_budget(app.state.redis_client)
+    # Optional warm-up of the hottest links, bounded by CACHE_WARMUP_BUDGET
+    await run_cache_warmup(app.state.redis_client, link_cache)
+    # Background click publisher; redirects only enqueue events
+    start_click_publisher()
+    slug_index.start()
+    link_snapshot.start()
+    link_popularity.start(
+        lambda ttls: _redis_best_effort(
+            extend_cached_links, app.state.redis_client, ttls
+        )
+    )
+    # Optional cache invalidation on link changes, selected by LINK_INVALIDATION
+    link_change_consumer = create_invalidation_consumer(
+        lambda slug, link_data: apply_link_change(
+            app.state.redis_client, slug, link_data
+        )
+    )
+    if link_change_consumer is not None:
+        link_change_consumer.start()
     yield
+    if link_change_consumer is not None:
+        await link_change_consumer.stop()
+    for task in list(link_invalidations):
+        task.cancel()
+    await link_popularity.stop()
+    await link_snapshot.stop()
+    await slug_index.stop()
+    # Flush pending click events before closing the other connections
+    await stop_click_publisher()
     # Close MongoDB connection on shutdown
     await close_mongo_connection(mongo_client)
-    # Redis connection is closed by the dependency's finally block
+    await close_redis_connection(app.state.redis_client)
 
 
 app = FastAPI(
@@ -58,106 +281,540 @@ async def health_check():
     return {"status": "ok", "message": "Redirect Service is running!"}
 
 
-@app.get("/r/{slug}", tags=["Redirect"])
+@app.get("/stats", tags=["Health Check"])
+async def service_stats(redis_client: Redis = Depends(get_redis_db)):
+    """
+    In-process cache and slug index statistics for this worker.
+    """
+    return {
+        "link_cache": link_cache.stats(),
+        "slug_index": slug_index.stats(),
+        "link_snapshot": link_snapshot.stats(),
+        "link_popularity": link_popularity.stats(),
+        "link_loader": {"calls": link_loader.calls, "coalesced": link_loader.coalesced},
+        "dependencies": {
+            breaker.name: breaker.stats() for breaker in (redis_breaker, mongo_breaker)
+        },
+        "redis_nodes": (
+            redis_client.stats() if isinstance(redis_client, ShardedRedis) else None
+        ),
+        "link_changes": {
+            "received": getattr(link_change_consumer, "received", 0),
+            "failed": getattr(link_change_consumer, "failed", 0),
+        },
+    }
+
+
+@app.get("/metrics", tags=["Health Check"], response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus metrics for this worker.
+    """
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+async def _redis_best_effort(fn, *args):
+    # 寫入快取只是最佳化：失敗只記錄在 breaker，不影響回應
+    try:
+        await redis_breaker.call(fn, *args)
+    except DependencyUnavailable as e:
+        logger.debug("Skipped Redis cache write: %s", e)
+
+
+async def load_link_from_db(slug: str, redis_client: Optional[Redis]) -> Optional[dict]:
+    """
+    Loads a link from MongoDB and stores it in Redis.
+    A short Redis lock keeps other workers from refilling the same slug at
+    the same time; they wait for this fill instead. With Redis unavailable
+    (`redis_client` None or failing) MongoDB is queried without caching.
+    """
+    lock_token = None
+    if redis_client is not None:
+        try:
+            lock_token = await redis_breaker.call(acquire_fill_lock, redis_client, slug)
+            if lock_token is None:
+                cached = await redis_breaker.call(
+                    wait_for_cached_link, redis_client, slug, timeout=None
+                )
+                if cached is not None:
+                    return None if cached is NOT_FOUND else cached
+                # 等待逾時：自行查詢 MongoDB
+        except DependencyUnavailable:
+            redis_client = None
+
+    try:
+        with STAGE_LATENCY.time(stage="mongo"):
+            link_data = await mongo_breaker.call(fetch_link_data, slug)
+
+        if redis_client is None:
+            return link_data
+        if link_data is None:
+            await _redis_best_effort(cache_missing_link, redis_client, slug)
+            return None
+
+        await _redis_best_effort(
+            cache_link, redis_client, slug, link_data, link_popularity.ttl(slug)
+        )
+        logger.debug("Cache miss for slug: %s, fetched from DB and cached.", slug)
+        return link_data
+    finally:
+        if lock_token is not None:
+            await _redis_best_effort(release_fill_lock, redis_client, slug, lock_token)
+
+
+def _lookup_result(cached) -> str:
+    if cached is None:
+        return "miss"
+    return "negative_hit" if cached is NOT_FOUND else "hit"
+
+
+def _store_local(slug: str, cached):
+    if cached is NOT_FOUND:
+        link_cache.set_not_found(slug)
+    else:
+        link_cache.set(slug, cached)
+
+
+async def fetch_link(slug: str, redis_client: Redis):
+    """
+    Reads a link from Redis, falling back to MongoDB on a miss or when Redis
+    is unavailable. Returns link data or NOT_FOUND; raises
+    DependencyUnavailable when MongoDB is needed and fails.
+    """
+    try:
+        with STAGE_LATENCY.time(stage="redis"):
+            cached = await redis_breaker.call(read_cached_link, redis_client, slug)
+        CACHE_LOOKUPS.inc(layer="redis", result=_lookup_result(cached))
+    except DependencyUnavailable:
+        cached, redis_client = None, None
+
+    # If not in cache, query MongoDB; concurrent misses share one lookup
+    if cached is None:
+        cached = await link_loader.do(
+            slug, lambda: load_link_from_db(slug, redis_client)
+        )
+        cached = NOT_FOUND if cached is None else cached
+    return cached
+
+
+async def refresh_link(slug: str, redis_client: Redis):
+    try:
+        cached = await fetch_link(slug, redis_client)
+    except DependencyUnavailable as e:
+        LINK_REFRESHES.inc(result="failed")
+        logger.debug("Background refresh of %s failed: %s", slug, e)
+        return
+    _store_local(slug, cached)
+    LINK_REFRESHES.inc(result="ok")
+
+
+def refresh_in_background(slug: str, redis_client: Redis):
+    """
+    Refreshes a local cache entry without making the request wait.
+    At most one refresh per slug runs at a time.
+    """
+    if slug in link_refreshes:
+        return
+    task = asyncio.create_task(refresh_link(slug, redis_client))
+    link_refreshes[slug] = task
+    task.add_done_callback(lambda _: link_refreshes.pop(slug, None))
+
+
+def serve_stale(slug: str, redis_client: Redis) -> Optional[dict]:
+    stale = link_cache.get_stale(slug)
+    if stale is not None:
+        STALE_SERVED.inc()
+        # 依賴恢復後由背景更新取代舊資料
+        refresh_in_background(slug, redis_client)
+    return stale
+
+
+async def purge_edge(redis_client: Optional[Redis], slug: str):
+    """
+    Purges the slug's cached redirect from the CDN once across all workers.
+    Without Redis every worker purges; a duplicate purge is harmless.
+    """
+    if edge_purger is None:
+        return
+    if redis_client is not None:
+        try:
+            if not await redis_breaker.call(claim_edge_purge, redis_client, slug):
+                return
+        except DependencyUnavailable:
+            pass
+    await edge_purger.purge(slug)
+
+
+async def _apply_link_change(
+    redis_client: Optional[Redis], slug: str, link_data: Optional[dict]
+):
+    link_cache.invalidate(slug)
+    link_snapshot.invalidate(slug)
+    if redis_client is not None:
+        if link_data is None:
+            await _redis_best_effort(delete_cached_link, redis_client, slug)
+        else:
+            await _redis_best_effort(
+                cache_link, redis_client, slug, link_data, link_popularity.ttl(slug)
+            )
+    # 在 Redis 更新之後才清除 CDN，避免 CDN 回源時又取得舊資料
+    await purge_edge(redis_client, slug)
+
+
+async def _repeat_link_change(
+    redis_client: Optional[Redis], slug: str, link_data: Optional[dict]
+):
+    await asyncio.sleep(LINK_INVALIDATION_REPEAT_DELAY)
+    await _apply_link_change(redis_client, slug, link_data)
+
+
+async def apply_link_change(
+    redis_client: Optional[Redis], slug: str, link_data: Optional[dict]
+):
+    """
+    Applies a link change to every cache layer of this worker: the Redis
+    entry is replaced with the new data, or deleted when the new data is
+    unknown, and the local cache and shared snapshot stop serving the old
+    entry. The CDN copy of the redirect is purged when EDGE_PURGE_URL is
+    set. The change is applied a second time after
+    LINK_INVALIDATION_REPEAT_DELAY seconds, undoing a concurrent fill that
+    read MongoDB just before the change.
+    """
+    LINK_INVALIDATIONS.inc(action="delete" if link_data is None else "refresh")
+    # 新建或改名的 slug 立即加入索引；在 filter 中多一個已刪除的 slug 無害
+    slug_index.add(slug)
+    if link_data is None:
+        link_popularity.forget(slug)
+    await _apply_link_change(redis_client, slug, link_data)
+    if LINK_INVALIDATION_REPEAT_DELAY > 0:
+        task = asyncio.create_task(_repeat_link_change(redis_client, slug, link_data))
+        link_invalidations.add(task)
+        task.add_done_callback(link_invalidations.discard)
+
+
+async def get_link_data(slug: str, redis_client: Redis) -> Optional[dict]:
+    """
+    Resolves link data through the local cache, Redis and finally MongoDB.
+    Returns None when the slug does not exist. While Redis or MongoDB are
+    failing, recently seen links are served stale from the local cache;
+    without a stale copy DependencyUnavailable is raised.
+    """
+    # 0. Try the in-process cache first (no network hop)
+    cached = link_cache.get(slug)
+    CACHE_LOOKUPS.inc(layer="local", result=_lookup_result(cached))
+    if cached is not None:
+        if cached is not NOT_FOUND and link_cache.refresh_due(slug):
+            # Soft TTL: 熱門連結在過期前於背景更新，請求不必等待
+            refresh_in_background(slug, redis_client)
+        return None if cached is NOT_FOUND else cached
+
+    # 0b. Hot links from the snapshot shared by all workers on this host;
+    # not copied into the local cache so each worker does not duplicate it
+    if link_snapshot.ready:
+        shared = link_snapshot.get(slug)
+        CACHE_LOOKUPS.inc(layer="snapshot", result=_lookup_result(shared))
+        if shared is not None:
+            return shared
+
+    # Redis 斷路中：有舊資料就直接使用，不把流量轉到 MongoDB
+    if not redis_breaker.available:
+        stale = serve_stale(slug, redis_client)
+        if stale is not None:
+            return stale
+
+    # 1. Redis, then MongoDB
+    try:
+        cached = await fetch_link(slug, redis_client)
+    except DependencyUnavailable:
+        stale = serve_stale(slug, redis_client)
+        if stale is None:
+            raise
+        return stale
+
+    _store_local(slug, cached)
+    return None if cached is NOT_FOUND else cached
+
+
+async def get_many_link_data(
+    slugs: List[str], redis_client: Redis
+) -> Dict[str, Optional[dict]]:
+    """
+    Bulk version of get_link_data with a fixed number of round trips: one
+    Redis pipeline for everything the local cache does not have, one MongoDB
+    `$in` query for the Redis misses and one pipeline to backfill them.
+    Bulk results are not put in the local cache so large batches do not evict
+    the links the redirect path is serving.
+    """
+    resolved: Dict[str, Optional[dict]] = {}
+    pending = []
+    for slug in slugs:
+        if not slug_index.might_exist(slug):
+            resolved[slug] = None
+            continue
+        cached = link_cache.get(slug)
+        CACHE_LOOKUPS.inc(layer="local", result=_lookup_result(cached))
+        if cached is None and link_snapshot.ready:
+            cached = link_snapshot.get(slug)
+            CACHE_LOOKUPS.inc(layer="snapshot", result=_lookup_result(cached))
+        if cached is None:
+            pending.append(slug)
+        else:
+            resolved[slug] = None if cached is NOT_FOUND else cached
+    if not pending:
+        return resolved
+
+    redis_available = True
+    try:
+        cached_links = await redis_breaker.call(
+            read_cached_links, redis_client, pending
+        )
+    except DependencyUnavailable:
+        cached_links, redis_available = {}, False
+    misses = []
+    for slug in pending:
+        cached = cached_links.get(slug)
+        if redis_available:
+            CACHE_LOOKUPS.inc(layer="redis", result=_lookup_result(cached))
+        if cached is None:
+            misses.append(slug)
+        else:
+            resolved[slug] = None if cached is NOT_FOUND else cached
+    if not misses:
+        return resolved
+
+    try:
+        found = await mongo_breaker.call(fetch_many_link_data, misses)
+    except DependencyUnavailable:
+        stale = {slug: link_cache.get_stale(slug) for slug in misses}
+        if any(link_data is None for link_data in stale.values()):
+            raise
+        STALE_SERVED.inc(len(stale))
+        resolved.update(stale)
+        return resolved
+
+    pipeline = redis_client.pipeline(transaction=False)
+    for slug in misses:
+        link_data = found.get(slug)
+        if link_data is None:
+            await cache_missing_link(pipeline, slug)
+        else:
+            await cache_link(pipeline, slug, link_data, link_popularity.ttl(slug))
+        resolved[slug] = link_data
+    if redis_available:
+        await _redis_best_effort(pipeline.execute)
+    return resolved
+
+
+def unavailable_error(e: DependencyUnavailable) -> HTTPException:
+    logger.warning("Request failed, %s", e)
+    retry_after = max(redis_breaker.reset_timeout, mongo_breaker.reset_timeout)
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Service temporarily unavailable.",
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+async def enforce_rate_limit(redis_client: Redis, checks: List[Check]):
+    """
+    Counts the request against the enabled rate limit rules: first this
+    worker's token buckets, then the shared limit in one Redis round trip,
+    which is skipped while Redis is unavailable. Raises 429 with
+    Retry-After when a limit is exceeded.
+    """
+    checks = rate_limiter.active(checks)
+    if not checks:
+        return
+    try:
+        # 單一 worker 就已超額的來源不必再查 Redis
+        rate_limiter.check_local(checks)
+        try:
+            await redis_breaker.call(rate_limiter.check, redis_client, checks)
+        except DependencyUnavailable:
+            pass
+    except RateLimitExceeded as e:
+        RATE_LIMITED.inc(rule=e.rule)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests.",
+            headers={"Retry-After": retry_after_header(e.retry_after)},
+        )
+
+
+def link_status(slug: str, link_data: Optional[dict]) -> dict:
+    """
+    Bulk resolution result for one slug, in the same order of checks as the
+    redirect. The target is only disclosed for links that would redirect
+    without a password.
+    """
+    if link_data is None:
+        return {"slug": slug, "status": "missing", "original_url": None}
+    if not link_data["is_active"]:
+        return {"slug": slug, "status": "inactive", "original_url": None}
+    if link_data["expires_at"] is not None and link_data["expires_at"] <= time.time():
+        return {"slug": slug, "status": "expired", "original_url": None}
+    if link_data["password"]:
+        return {"slug": slug, "status": "protected", "original_url": None}
+    return {"slug": slug, "status": "active", "original_url": link_data["original_url"]}
+
+
+class BulkResolveRequest(BaseModel):
+    slugs: List[str] = Field(..., min_length=1)
+
+
+@app.post("/resolve", tags=["Redirect"])
+async def resolve_links(
+    body: BulkResolveRequest,
+    redis_client: Redis = Depends(get_redis_db),
+):
+    """
+    Resolves many slugs to their targets and statuses (active, inactive,
+    expired, protected or missing) without redirecting or counting clicks.
+    """
+    max_slugs = int(os.environ.get("BULK_RESOLVE_MAX_SLUGS", 1000))
+    slugs = list(dict.fromkeys(body.slugs))  # 去除重複，保留順序
+    if len(slugs) > max_slugs:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {max_slugs} slugs per request.",
+        )
+    try:
+        link_data = await get_many_link_data(slugs, redis_client)
+    except DependencyUnavailable as e:
+        raise unavailable_error(e)
+    return {"results": [link_status(slug, link_data.get(slug)) for slug in slugs]}
+
+
+@app.api_route("/r/{slug}", methods=["GET", "HEAD"], tags=["Redirect"])
 async def redirect_to_original_url(
     slug: str,
-    request: Request,  # 導入 Request 以獲取查詢參數
-    redis_client: redis.Redis = Depends(get_redis_db),
+    request: Request,  # 導入 Request 以讀取已解鎖的 cookie
+    redis_client: Redis = Depends(get_redis_db),
     password: Optional[str] = Query(
         None, description="Password for protected short links"
     ),
 ):
     """
-    Redirects to the original URL based on the provided slug.
+    Redirects to the original URL based on the provided slug, with the link's
+    redirect status (301, 302, 307 or 308). HEAD returns the same redirect
+    without counting a click or checking a password.
     """
-    # 1. Try to get from Redis cache
-    cached_link_data = redis_client.hgetall(f"link_data:{slug}")
+    return await serve_redirect(slug, request, redis_client, password)
 
-    if cached_link_data:
-        print(f"Cache hit for slug: {slug}, data: {cached_link_data}")
-        is_active = cached_link_data.get("is_active") == "True"
-        password_hash = (
-            cached_link_data.get("password")
-            if cached_link_data.get("password")
-            else None
-        )
-        original_url = cached_link_data.get("original_url")
 
-        if not is_active:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Short link is inactive.",
-            )
+async def serve_fast_redirect(
+    slug: str, request: Request, password: Optional[str]
+) -> RedirectResponse:
+    # RedirectFastPath 不經過 FastAPI 的依賴注入，直接使用共用的連線池
+    return await serve_redirect(slug, request, request.app.state.redis_client, password)
 
-        # Handle password protected links (from cache)
-        if password_hash:
-            provided_password = request.query_params.get("password")
-            if not provided_password or not pwd_context.verify(
-                provided_password, password_hash
-            ):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Password required or incorrect password.",
-                )
-            # 如果密碼正確，則繼續重導向
-            publish_click_event(slug)
-            return RedirectResponse(url=original_url, status_code=status.HTTP_302_FOUND)
 
-        publish_click_event(slug)  # 只有在成功重導向時才發布事件
-        return RedirectResponse(url=original_url, status_code=status.HTTP_302_FOUND)
+async def serve_redirect(
+    slug: str, request: Request, redis_client: Redis, password: Optional[str]
+) -> RedirectResponse:
+    started = time.perf_counter()
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        response = await build_redirect_response(slug, request, redis_client, password)
+        status_code = response.status_code
+        return response
+    except HTTPException as e:
+        status_code = e.status_code
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage="total")
+        REDIRECTS.inc(status=status_code)
+
 
-    # Check for NULL marker if hash is empty or key type is string
-    cached_string_value = redis_client.get(f"link_data:{slug}")
-    if cached_string_value == "NULL":
-        print(f"Cache hit for slug: {slug} (NULL marker)")
+async def build_redirect_response(
+    slug: str, request: Request, redis_client: Redis, password: Optional[str]
+) -> RedirectResponse:
+    """
+    Resolves the slug and builds the redirect; every other outcome is raised
+    as an HTTPException. HEAD requests have no side effects: no click event,
+    no popularity hit and no password attempt.
+    """
+    head = request.method == "HEAD"
+    # 格式與 Bloom filter 檢查不需 I/O，掃描產生的 404 不必耗用限流的 round trip
+    if not slug_index.might_exist(slug):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Short link not found."
         )
 
-    # 2. If not in cache (or was NULL marker/empty hash), query MongoDB
-    link = await Link.find_one(Link.slug == slug)
+    client_ip = request.client.host if request.client else "unknown"
+    await enforce_rate_limit(
+        redis_client, [("redirect_ip", client_ip), ("redirect_slug", slug)]
+    )
+
+    try:
+        link_data = await get_link_data(slug, redis_client)
+    except DependencyUnavailable as e:
+        raise unavailable_error(e)
 
-    if not link:
-        # Cache a "not found" value to prevent cache penetration
-        # 儲存為字串，而不是 Hash，以區分
-        redis_client.set(f"link_data:{slug}", "NULL", ex=60)
+    if link_data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Short link not found."
         )
 
-    # 3. Store in Redis cache for future requests (moved up)
-    redis_client.hmset(
-        f"link_data:{slug}",
-        {
-            "original_url": link.original_url,
-            "is_active": str(link.is_active),
-            "password": link.password if link.password else "",
-        },
-    )
-    redis_client.expire(f"link_data:{slug}", 3600 * 24 * 7)
-    print(f"Cache miss for slug: {slug}, fetched from DB and cached.")
-
-    if not link.is_active:
+    if not link_data["is_active"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Short link is inactive.",
         )
 
-    # Handle password protected links (from DB)
-    if link.password:
-        provided_password = request.query_params.get("password")
-        if not provided_password or not pwd_context.verify(
-            provided_password, link.password
+    # 快取與資料庫路徑都會帶 expires_at，在此統一拒絕已過期的連結
+    if link_data["expires_at"] is not None and link_data["expires_at"] <= time.time():
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE, detail="Short link has expired."
+        )
+
+    # Handle password protected links
+    password_hash = link_data["password"]
+    grant_access = False
+    if password_hash:
+        # 已解鎖過的訪客帶有簽章 cookie，不必再跑一次 bcrypt
+        access_token = request.cookies.get(ACCESS_COOKIE_NAME)
+        if not access_token or not verify_access_token(
+            access_token, slug, password_hash
         ):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Password required or incorrect password.",
+            if not password or head:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Password required or incorrect password.",
+                )
+            # 密碼嘗試另有更嚴格的額度，在耗費 bcrypt CPU 之前檢查
+            await enforce_rate_limit(
+                redis_client, [("password_ip", client_ip), ("password_slug", slug)]
             )
-        # 如果密碼正確，則繼續重導向
-        publish_click_event(slug)
-        return RedirectResponse(
-            url=link.original_url, status_code=status.HTTP_302_FOUND
-        )
+            with STAGE_LATENCY.time(stage="bcrypt"):
+                verified = await verify_password(password, password_hash)
+            if not verified:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Password required or incorrect password.",
+                )
+            # 如果密碼正確，則繼續重導向並發放 cookie
+            grant_access = True
+
+    if not head:
+        # 只有成功的重導向計入熱度與點擊：403/410/401 不會延長快取 TTL
+        link_popularity.hit(slug, link_data["expires_at"])
+        with STAGE_LATENCY.time(stage="publish"):
+            publish_click_event(slug)  # 只有在成功重導向時才發布事件
+    # 受密碼保護或會過期的連結一律 no-store，不會被瀏覽器或 CDN 快取
+    response = FastRedirectResponse(
+        link_data["original_url"],
+        link_data.get("redirect_type", DEFAULT_REDIRECT_TYPE),
+        redirect_cache_policy.headers(slug, link_data),
+    )
+    if grant_access:
+        set_access_cookie(response, slug, password_hash)
+    return response
+
 
-    publish_click_event(slug)  # 只有在成功重導向時才發布事件
-    return RedirectResponse(url=link.original_url, status_code=status.HTTP_302_FOUND)
+# Performance profile (see server.py): redirects skip CORSMiddleware, routing
+# and dependency injection, so no CORS headers are sent on them
+if os.environ.get("SERVER_PROFILE", "default") == "performance":
+    app.add_middleware(RedirectFastPath, prefix="/r/", handler=serve_fast_redirect)
@@ -1,49 +1,416 @@
 # redirect-service/messaging.py
+import asyncio
 import json
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 
 import pika
+from clicks import ClickAggregator, increment_click_counts
+from metrics import REGISTRY
+from spool import ClickSpool, create_click_spool
 
+logger = logging.getLogger(__name__)
 
-def publish_click_event(slug: str):
-    print(f"Attempting to publish click event for slug: {slug}")
+CLICK_QUEUE = "link_clicks"
+
+
+def create_rabbitmq_connection() -> pika.BlockingConnection:
     RABBITMQ_HOST = os.environ.get("RABBITMQ_HOST", "localhost")
-    try:
-        # 建立與 RabbitMQ 伺服器的連線
-        # pika.BlockingConnection: 建立一個同步的、阻塞式的連線。
-        # 這裡使用阻塞式連線是因為發送訊息是一個快速操作，且我們希望確保訊息被發送。
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=RABBITMQ_HOST)
+    # pika.BlockingConnection: 建立一個同步的、阻塞式的連線。
+    # 這個連線只會在 publisher 專屬的執行緒中使用，不會阻塞事件迴圈。
+    return pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
+
+
+class ClickEventPublisher:
+    """
+    Long-lived click event publisher.
+
+    publish() only puts the event on a bounded in-memory queue, so the redirect
+    response never waits on the broker. A background task drains the queue in
+    batches of up to `flush_size` events (or whatever arrived within
+    `flush_interval` seconds) and publishes them over one persistent channel,
+    each batch as one AMQP transaction: the messages are sent back to back
+    and tx_commit() returns once the broker has taken the whole batch, so a
+    batch costs one round trip instead of one per message. A batch that fails
+    before its commit is discarded by the broker and sent again in full. All
+    pika calls run on a single dedicated thread because pika connections are
+    not thread-safe.
+
+    With a `spool`, batches the broker cannot take are written to disk
+    instead of being lost: after a failed publish the broker is left alone
+    for `retry_interval` seconds and batches go straight to the spool, as
+    they do while the queue is more than half full. Once the broker is
+    reachable the spool is replayed in order; while it still holds events,
+    new batches are appended behind them so ordering is kept.
+    """
+
+    def __init__(
+        self,
+        connection_factory: Callable[[], pika.BlockingConnection] = (
+            create_rabbitmq_connection
+        ),
+        queue_size: int = 10000,
+        flush_size: int = 100,
+        flush_interval: float = 0.5,
+        drain_timeout: float = 5.0,
+        spool: Optional[ClickSpool] = None,
+        retry_interval: float = 5.0,
+    ):
+        self._connection_factory = connection_factory
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._high_watermark = max(queue_size // 2, 1)
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self._broker_down_until = 0.0
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.drain_timeout = drain_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="click-publisher"
+        )
+        self._connection = None
+        self._channel = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def publish(self, slug: str, count: int = 1) -> bool:
+        """
+        Enqueues a click event without blocking. Returns False if the event
+        was dropped because the queue is full or the publisher is stopping.
+        Aggregated events carry a "count" field.
+        """
+        if self._stopping:
+            self.dropped += 1
+            return False
+        message = {"slug": slug} if count == 1 else {"slug": slug, "count": count}
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            # 每個事件都記錄會在過載時灌爆日誌；丟棄數量由 metrics 呈現
+            logger.debug("Click event queue full, dropping event for slug: %s", slug)
+            return False
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops accepting events, flushes whatever is still queued (bounded by
+        drain_timeout) and closes the broker connection.
+        """
+        self._stopping = True
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Click publisher drain timed out, %s events lost.", self.queue_depth
+                )
+            self._task = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_connection)
+        if self.spool is not None:
+            # 尚未重送的事件留在磁碟上，下次啟動時繼續
+            await loop.run_in_executor(self._executor, self.spool.close)
+        self._executor.shutdown(wait=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not (self._stopping and self._queue.empty()):
+            # 需要重送 spool 時不等待新事件湊批
+            batch = await self._next_batch(wait=not self._should_replay())
+            if batch:
+                await self._flush(batch)
+            if self._should_replay():
+                await self._replay()
+            elif not batch:
+                # 閒置時處理 heartbeat，避免 broker 因逾時關閉連線
+                await loop.run_in_executor(self._executor, self._keepalive)
+
+    def _broker_available(self) -> bool:
+        return asyncio.get_running_loop().time() >= self._broker_down_until
+
+    def _should_replay(self) -> bool:
+        return (
+            self.spool is not None
+            and not self._stopping
+            and self.spool.pending
+            and self._broker_available()
         )
-        # 通道是連線內部的邏輯路徑，用於發送和接收訊息。
-        # 一個連線可以有多個通道，這樣可以提高效率。
-        channel = connection.channel()
-        # 宣告一個佇列 (Queue)
-        channel.queue_declare(
-            queue="link_clicks", durable=True
-        )  # durable=True for persistence
-
-        message = {"slug": slug}
-        # 發布訊息
-        # 使用預設的交換器 (default exchange)
-        # 預設交換器會根據 routing_key 將訊息直接路由到同名的佇列。
-        # routing_key='link_clicks': 訊息將被路由到名為 'link_clicks' 的佇列。
-        channel.basic_publish(
-            exchange="",
-            routing_key="link_clicks",
-            body=json.dumps(message),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.DeliveryMode.Persistent  # 即使 RabbitMQ 伺服器在訊息被消費者處理前重啟，這條訊息也不會丟失，它會被寫入磁碟
+
+    async def _next_batch(self, wait: bool = True) -> List[dict]:
+        batch: List[dict] = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.flush_interval if wait else 0)
+        while len(batch) < self.flush_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            if self._stopping:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[dict]):
+        loop = asyncio.get_running_loop()
+        if self.spool is not None and (
+            not self._broker_available()
+            or self.spool.pending
+            or self.queue_depth >= self._high_watermark
+        ):
+            await self._spool_batch(batch)
+            return
+        try:
+            await loop.run_in_executor(self._executor, self._send_batch, batch)
+            self.published += len(batch)
+        except Exception as e:
+            logger.warning("Failed to publish %s click events: %s", len(batch), e)
+            if self.spool is None:
+                self.failed += len(batch)
+                return
+            # 暫停連線嘗試，避免每一批都要等連線逾時
+            self._broker_down_until = loop.time() + self.retry_interval
+            await self._spool_batch(batch)
+
+    async def _spool_batch(self, batch: List[dict]):
+        loop = asyncio.get_running_loop()
+        try:
+            stored = await loop.run_in_executor(
+                self._executor, self.spool.append, batch
+            )
+        except OSError as e:
+            logger.error("Failed to spool %s click events: %s", len(batch), e)
+            stored = False
+        if not stored:
+            self.failed += len(batch)
+
+    async def _replay(self):
+        loop = asyncio.get_running_loop()
+        try:
+            replayed = await loop.run_in_executor(self._executor, self._replay_batch)
+            self.published += replayed
+        except Exception as e:
+            self._broker_down_until = loop.time() + self.retry_interval
+            logger.warning(
+                "Click spool replay failed, retrying in %ss: %s", self.retry_interval, e
+            )
+
+    def _replay_batch(self) -> int:
+        messages, position = self.spool.read(self.flush_size)
+        if messages:
+            self._send_batch(messages)
+        self.spool.commit(position, len(messages))
+        return len(messages)
+
+    def _send_batch(self, batch: List[dict]):
+        # 連線可能已被 broker 關閉：重新連線後重試一次
+        try:
+            self._publish_all(batch)
+        except pika.exceptions.AMQPError:
+            self._close_connection()
+            self._publish_all(batch)
+
+    def _publish_all(self, batch: List[dict]):
+        channel = self._get_channel()
+        for message in batch:
+            channel.basic_publish(
+                exchange="",
+                routing_key=CLICK_QUEUE,
+                body=json.dumps(message),
+                properties=pika.BasicProperties(
+                    delivery_mode=pika.DeliveryMode.Persistent  # 即使 RabbitMQ 重啟，訊息也會被寫入磁碟
+                ),
+            )
+        # 整批在同一個交易中：只有 commit 需要等待 broker 回覆
+        channel.tx_commit()
+
+    def _get_channel(self):
+        if self._channel is None or not self._channel.is_open:
+            self._close_connection()
+            self._connection = self._connection_factory()
+            self._channel = self._connection.channel()
+            self._channel.queue_declare(queue=CLICK_QUEUE, durable=True)
+            # 交易模式：basic_publish 不等待回覆，tx_commit 在 broker 接受整批後才返回
+            # (confirm_delivery 的 BlockingChannel 會在每則訊息後等待 ack)
+            self._channel.tx_select()
+        return self._channel
+
+    def _keepalive(self):
+        if self._connection is not None and self._connection.is_open:
+            try:
+                self._connection.process_data_events(time_limit=0)
+            except pika.exceptions.AMQPError:
+                self._close_connection()
+
+    def _close_connection(self):
+        connection, self._connection, self._channel = self._connection, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except pika.exceptions.AMQPError:
+                pass
+
+
+click_publisher: Optional[ClickEventPublisher] = None
+click_aggregator: Optional[ClickAggregator] = None
+
+
+async def publish_click_counts(counts: Dict[str, int]) -> Dict[str, int]:
+    # 每個 slug 每個時間窗只發布一則帶 count 的訊息；佇列已滿的留待下次
+    return {
+        slug: count
+        for slug, count in counts.items()
+        if not click_publisher.publish(slug, count)
+    }
+
+
+def start_click_publisher() -> ClickEventPublisher:
+    """
+    Starts the background publisher and, depending on CLICK_AGGREGATION, a
+    click aggregator in front of it:
+      off    - one {"slug"} event per click (default)
+      mongo  - periodic bulk $inc of Link.click_count, no per-click events
+      events - one {"slug", "count"} event per slug per window
+    """
+    global click_publisher, click_aggregator
+    click_publisher = ClickEventPublisher(
+        queue_size=int(os.environ.get("CLICK_QUEUE_SIZE", 10000)),
+        flush_size=int(os.environ.get("CLICK_FLUSH_SIZE", 100)),
+        flush_interval=float(os.environ.get("CLICK_FLUSH_INTERVAL", 0.5)),
+        drain_timeout=float(os.environ.get("CLICK_DRAIN_TIMEOUT", 5)),
+        spool=create_click_spool(),
+        retry_interval=float(os.environ.get("CLICK_BROKER_RETRY_INTERVAL", 5)),
+    )
+    click_publisher.start()
+    logger.info("Click event publisher started.")
+
+    mode = os.environ.get("CLICK_AGGREGATION", "off").lower()
+    if mode in ("mongo", "events"):
+        click_aggregator = ClickAggregator(
+            sink=increment_click_counts if mode == "mongo" else publish_click_counts,
+            interval=float(os.environ.get("CLICK_AGGREGATION_INTERVAL", 5)),
+            state_file=os.environ.get(
+                "CLICK_AGGREGATION_STATE_FILE", "click_counts.json"
             ),
         )
-        print(f"Successfully published click event for slug: {slug}")
-        connection.close()
-    except Exception as e:
-        print(f"Failed to publish click event for slug {slug}: {e}. Error: {e}")
-        # 在實際生產環境中，這裡應該有更健壯的錯誤處理機制，例如重試、記錄到日誌系統、或發送到死信佇列 (Dead-Letter Queue)。
-
-    finally:
-        # 8. 關閉連線
-        # 無論成功或失敗，都嘗試關閉與 RabbitMQ 的連線。
-        if "connection" in locals() and connection.is_open:
-            connection.close()
+        click_aggregator.start()
+        logger.info("Click aggregation enabled (%s).", mode)
+    return click_publisher
+
+
+async def stop_click_publisher():
+    global click_publisher, click_aggregator
+    if click_aggregator is not None:
+        # 先把最後一個時間窗交給 publisher，再排空 publisher
+        await click_aggregator.stop()
+        click_aggregator = None
+    if click_publisher is not None:
+        await click_publisher.stop()
+        logger.info(
+            "Click event publisher stopped (%s published).", click_publisher.published
+        )
+        click_publisher = None
+
+
+def publish_click_event(slug: str):
+    """
+    Hands a click event to the aggregator or the background publisher.
+    Never blocks on the broker.
+    """
+    if click_aggregator is not None:
+        click_aggregator.record(slug)
+        return
+    if click_publisher is None:
+        logger.debug("Click publisher not running, dropping event for slug: %s", slug)
+        return
+    click_publisher.publish(slug)
+
+
+def _publisher_stat(name: str):
+    return lambda: getattr(click_publisher, name) if click_publisher else 0
+
+
+REGISTRY.callback(
+    "click_event_queue_depth",
+    "Click events waiting to be published.",
+    _publisher_stat("queue_depth"),
+)
+REGISTRY.callback(
+    "click_events_published_total",
+    "Click events committed to the broker.",
+    _publisher_stat("published"),
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "click_events_failed_total",
+    "Click events that could not be published.",
+    _publisher_stat("failed"),
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "click_events_dropped_total",
+    "Click events dropped because the queue was full or stopping.",
+    _publisher_stat("dropped"),
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "click_aggregator_pending_clicks",
+    "Clicks counted locally and not yet flushed.",
+    lambda: click_aggregator.pending if click_aggregator else 0,
+)
+
+
+def _spool_stat(name: str):
+    return lambda: (
+        getattr(click_publisher.spool, name)
+        if click_publisher and click_publisher.spool
+        else 0
+    )
+
+
+REGISTRY.callback(
+    "click_spool_pending_bytes",
+    "Spooled click events not yet replayed to the broker, in bytes.",
+    _spool_stat("pending_bytes"),
+)
+REGISTRY.callback(
+    "click_spool_size_bytes",
+    "Disk used by the click spool.",
+    _spool_stat("size_bytes"),
+)
+REGISTRY.callback(
+    "click_spool_appended_total",
+    "Click events written to the spool.",
+    _spool_stat("appended"),
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "click_spool_replayed_total",
+    "Spooled click events replayed to the broker.",
+    _spool_stat("replayed"),
+    metric_type="counter",
+)
+REGISTRY.callback(
+    "click_spool_dropped_total",
+    "Click events dropped because the spool was full.",
+    _spool_stat("dropped"),
+    metric_type="counter",
+)
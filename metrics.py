@@ -0,0 +1,240 @@
+# redirect-service/metrics.py
+"""
+Minimal Prometheus text-format metrics.
+
+Counters and histograms are plain in-process objects updated from the event
+loop; callback metrics read their value from another object (cache stats,
+publisher queue depth, ...) when /metrics is scraped.
+"""
+
+import bisect
+import time
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: LabelValues, **extra) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_started")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._started, **self._labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # 每組 label：各 bucket 的 (非累計) 次數、總和、總次數
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """
+    Reads its value at scrape time. `callback` returns a number, or a dict of
+    label-value tuples to numbers for labelled metrics.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[float, Dict[LabelValues, float]]],
+        metric_type: str = "gauge",
+        labelnames: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.type = metric_type
+        self._callback = callback
+
+    def samples(self) -> List[str]:
+        value = self._callback()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            return [f"{self.name} {float(value)}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {float(item)}"
+            for key, item in value.items()
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=()) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames))
+
+    def callback(self, name: str, documentation: str, callback, **kwargs):
+        return self.register(CallbackMetric(name, documentation, callback, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Per-stage latency of the redirect path
+STAGE_LATENCY = REGISTRY.histogram(
+    "redirect_stage_duration_seconds",
+    "Latency of each stage of the redirect path.",
+    labelnames=("stage",),
+)
+# layer: local | snapshot | redis, result: hit | negative_hit | miss
+CACHE_LOOKUPS = REGISTRY.counter(
+    "link_cache_lookups_total",
+    "Link cache lookups by cache layer and result.",
+    labelnames=("layer", "result"),
+)
+REDIRECTS = REGISTRY.counter(
+    "redirect_responses_total",
+    "Redirect endpoint responses by HTTP status.",
+    labelnames=("status",),
+)
+STALE_SERVED = REGISTRY.counter(
+    "link_stale_served_total",
+    "Expired local cache entries served while Redis or MongoDB were unavailable.",
+)
+# result: ok | failed
+LINK_REFRESHES = REGISTRY.counter(
+    "link_background_refreshes_total",
+    "Background refreshes of local cache entries (soft TTL or stale).",
+    labelnames=("result",),
+)
+# action: refresh | delete
+LINK_INVALIDATIONS = REGISTRY.counter(
+    "link_invalidations_total",
+    "Link change events applied to the caches of this worker.",
+    labelnames=("action",),
+)
+# rule: redirect_ip | redirect_slug | password_ip | password_slug
+RATE_LIMITED = REGISTRY.counter(
+    "rate_limited_total",
+    "Requests rejected with 429 by rate limit rule.",
+    labelnames=("rule",),
+)
@@ -1,8 +1,9 @@
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
 from beanie import Document
 from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 
 class Link(Document):
@@ -15,7 +16,20 @@ class Link(Document):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: Optional[datetime] = None
     click_count: int = 0
+    # 301 / 308 permanent, 302 / 307 temporary; 307 / 308 keep the request method
+    redirect_type: Literal[301, 302, 307, 308] = 302
     notes: Optional[str] = None
 
     class Settings:
         name = "links"  # MongoDB collection
+        indexes = [
+            # 啟動時的快取預熱依點擊數排序取前 N 筆
+            IndexModel([("click_count", DESCENDING)], name="click_count_desc"),
+            # 只索引有設定到期時間的連結；不使用 TTL index，
+            # 因為連結文件由後端管理，過期時只拒絕重導向而不刪除資料
+            IndexModel(
+                [("expires_at", ASCENDING)],
+                name="expires_at_partial",
+                partialFilterExpression={"expires_at": {"$type": "date"}},
+            ),
+        ]
@@ -0,0 +1,161 @@
+# redirect-service/popularity.py
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from cache import LINK_CACHE_TTL, link_cache_ttl
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityTracker:
+    """
+    Per-worker popularity of links, driving their Redis TTLs.
+
+    Each slug has a hit counter that halves every `half_life` seconds. A
+    link's TTL starts at `min_ttl` and doubles with every doubling of its
+    score, up to `max_ttl`, so links hit once leave Redis after `min_ttl`
+    while links that stay busy keep the long TTL. When a cached link becomes
+    hot enough for a longer TTL, the extension is queued and applied to
+    Redis in batches every `flush_interval` seconds.
+
+    At most `max_entries` slugs are tracked; the least recently hit are
+    forgotten first and start over at `min_ttl`.
+    """
+
+    def __init__(
+        self,
+        min_ttl: int = 86400,
+        max_ttl: int = LINK_CACHE_TTL,
+        half_life: float = 86400.0,
+        max_entries: int = 100000,
+        flush_interval: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.min_ttl = min_ttl
+        self.max_ttl = max(max_ttl, min_ttl)
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._clock = clock
+        # slug -> [score, updated_at, granted ttl]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._extensions: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.extended = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def adaptive(self) -> bool:
+        return self.min_ttl < self.max_ttl
+
+    def score(self, slug: str) -> float:
+        entry = self._entries.get(slug)
+        if entry is None:
+            return 0.0
+        return entry[0] * 0.5 ** ((self._clock() - entry[1]) / self.half_life)
+
+    def ttl_for_score(self, score: float) -> int:
+        if score < 2:
+            return self.min_ttl
+        return min(self.max_ttl, self.min_ttl * 2 ** int(math.log2(score)))
+
+    def hit(self, slug: str, expires_at: Optional[float] = None):
+        """
+        Records a successful redirect, queueing a TTL extension if the link
+        outgrew the TTL it was cached with. For a link with `expires_at` the
+        extension is capped like link_cache_ttl(), so it never outlives the
+        link by more than the flush interval.
+        """
+        if not self.adaptive:
+            return
+        now = self._clock()
+        entry = self._entries.get(slug)
+        if entry is None:
+            self._entries[slug] = [1.0, now, 0]
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return
+        self._entries.move_to_end(slug)
+        entry[0] = entry[0] * 0.5 ** ((now - entry[1]) / self.half_life) + 1
+        entry[1] = now
+        ttl = link_cache_ttl({"expires_at": expires_at}, self.ttl_for_score(entry[0]))
+        # granted 為 0：由其他 worker 寫入，剩餘 TTL 未知；EXPIRE GT 不會縮短它
+        if ttl > max(entry[2], self.min_ttl):
+            entry[2] = ttl
+            self._extensions[slug] = ttl
+
+    def ttl(self, slug: str) -> int:
+        """TTL for caching a link now; remembered to detect later extensions."""
+        if not self.adaptive:
+            return self.max_ttl
+        ttl = self.ttl_for_score(self.score(slug))
+        entry = self._entries.get(slug)
+        if entry is not None:
+            entry[2] = ttl
+        return ttl
+
+    def forget(self, slug: str):
+        self._entries.pop(slug, None)
+        self._extensions.pop(slug, None)
+
+    def pop_extensions(self) -> Dict[str, int]:
+        extensions, self._extensions = self._extensions, {}
+        return extensions
+
+    def start(self, flush: Callable[[Dict[str, int]], Awaitable[None]]):
+        if self.adaptive and self._task is None:
+            self._task = asyncio.create_task(self._run(flush))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, flush: Callable[[Dict[str, int]], Awaitable[None]]):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            extensions = self.pop_extensions()
+            if not extensions:
+                continue
+            try:
+                await flush(extensions)
+                self.extended += len(extensions)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Extending link TTLs failed: %s", e)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "adaptive": self.adaptive,
+            "tracked": len(self._entries),
+            "min_ttl": self.min_ttl,
+            "max_ttl": self.max_ttl,
+            "pending_extensions": len(self._extensions),
+            "extended": self.extended,
+        }
+
+
+def create_popularity_tracker() -> PopularityTracker:
+    """
+    Builds the tracker from environment variables. Setting LINK_CACHE_MIN_TTL
+    to LINK_CACHE_MAX_TTL turns adaptive TTLs off.
+    """
+    return PopularityTracker(
+        min_ttl=int(os.environ.get("LINK_CACHE_MIN_TTL", 86400)),
+        max_ttl=int(os.environ.get("LINK_CACHE_MAX_TTL", LINK_CACHE_TTL)),
+        half_life=float(os.environ.get("LINK_POPULARITY_HALF_LIFE", 86400)),
+        max_entries=int(os.environ.get("LINK_POPULARITY_MAX_ENTRIES", 100000)),
+        flush_interval=float(os.environ.get("LINK_TTL_FLUSH_INTERVAL", 10)),
+    )
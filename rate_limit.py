@@ -0,0 +1,188 @@
+# redirect-service/rate_limit.py
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import redis.asyncio as redis
+
+# 滑動視窗近似：上一個固定視窗的計數依重疊比例加權，再加上目前視窗的計數。
+# 一條規則一次 EVAL：允許時計數並回傳 nil，拒絕時不計數並回傳需等待的秒數。
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local previous = tonumber(redis.call("get", KEYS[1]) or "0")
+local current = tonumber(redis.call("get", KEYS[2]) or "0")
+local elapsed = now % window
+if previous * (1 - elapsed / window) + current + 1 > limit then
+    local wait = window - elapsed
+    if current + 1 <= limit then
+        wait = window * (1 - (limit - 1 - current) / previous) - elapsed
+    end
+    return tostring(wait)
+end
+redis.call("incr", KEYS[2])
+redis.call("pexpire", KEYS[2], math.ceil(window * 2000))
+return false
+"""
+
+
+class Rate(NamedTuple):
+    limit: int
+    window: float
+
+
+# (rule name, identity), e.g. ("redirect_ip", "203.0.113.7")
+Check = Tuple[str, str]
+
+
+def parse_rate(value: str) -> Optional[Rate]:
+    """
+    Parses "<limit>/<window seconds>", e.g. "600/60". Empty or "0" disables
+    the rule.
+    """
+    value = value.strip()
+    if not value or value == "0":
+        return None
+    limit, _, window = value.partition("/")
+    return Rate(int(limit), float(window or 1))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(f"rate limit {rule} exceeded, retry after {retry_after}s")
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Sliding-window rate limits shared by every worker through Redis.
+
+    Each rule is its own EVAL on keys hash-tagged with the identity, so with
+    a sharded cache the counters spread over the nodes instead of all
+    landing on one. The EVALs of a request go out in one pipeline (one round
+    trip per node, concurrently); when a rule refuses, the counts the others
+    just took are given back, so a refused request uses no budget. check_local() applies
+    the same limits with per-worker token buckets. Each worker grants the
+    full budget, so a local refusal means the shared limit is exceeded too.
+    Callers run it before check() so such clients cost no round trip, and
+    it is the only check while Redis is unavailable.
+    """
+
+    def __init__(
+        self,
+        rules: Dict[str, Rate],
+        prefix: str = "rate",
+        max_local_keys: int = 10000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.rules = rules
+        self.prefix = prefix
+        self.max_local_keys = max_local_keys
+        self._clock = clock
+        # (rule, identity) -> [tokens, updated_at]
+        self._buckets: OrderedDict = OrderedDict()
+
+    def reset(self):
+        self._buckets.clear()
+
+    def active(self, checks: List[Check]) -> List[Check]:
+        """Drops checks whose rule is disabled."""
+        return [check for check in checks if check[0] in self.rules]
+
+    async def check(self, redis_client: redis.Redis, checks: List[Check]):
+        """
+        Counts one request against every check, raising RateLimitExceeded
+        (without counting) if any of them is over its limit.
+        """
+        now = self._clock()
+        pipeline = redis_client.pipeline(transaction=False)
+        current_keys = []
+        for rule, identity in checks:
+            rate = self.rules[rule]
+            window = int(now // rate.window)
+            key = f"{self.prefix}:{rule}:{{{identity}}}"
+            current_keys.append(f"{key}:{window}")
+            pipeline.eval(
+                _SLIDING_WINDOW_SCRIPT,
+                2,
+                f"{key}:{window - 1}",
+                f"{key}:{window}",
+                now,
+                rate.limit,
+                rate.window,
+            )
+        results = await pipeline.execute()
+        denied = [
+            (float(result), rule)
+            for result, (rule, _) in zip(results, checks)
+            if result is not None
+        ]
+        if not denied:
+            return
+        for result, key in zip(results, current_keys):
+            if result is None:
+                pipeline.decr(key)
+        await pipeline.execute()
+        retry_after, rule = max(denied)
+        raise RateLimitExceeded(rule, retry_after)
+
+    def check_local(self, checks: List[Check]):
+        """Same contract as check(), with this worker's token buckets."""
+        now = self._clock()
+        buckets = []
+        for rule, identity in checks:
+            rate = self.rules[rule]
+            bucket = self._buckets.get((rule, identity))
+            if bucket is None:
+                bucket = [float(rate.limit), now]
+                self._buckets[(rule, identity)] = bucket
+                if len(self._buckets) > self.max_local_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end((rule, identity))
+            refill = rate.limit / rate.window
+            bucket[0] = min(rate.limit, bucket[0] + (now - bucket[1]) * refill)
+            bucket[1] = now
+            if bucket[0] < 1:
+                raise RateLimitExceeded(rule, (1 - bucket[0]) / refill)
+            buckets.append(bucket)
+        for bucket in buckets:
+            bucket[0] -= 1
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
+
+
+def create_rate_limiter() -> RateLimiter:
+    """
+    Builds the rate limiter from "<limit>/<seconds>" environment variables;
+    an empty value disables a rule:
+      RATE_LIMIT_REDIRECT_IP       redirects per client IP (default off)
+      RATE_LIMIT_REDIRECT_SLUG     redirects per slug (default off)
+      RATE_LIMIT_PASSWORD_IP       password attempts per client IP (default 10/60)
+      RATE_LIMIT_PASSWORD_SLUG     password attempts per slug (default 30/60)
+
+    The client IP is the connection's peer address. Behind a load balancer
+    or CDN, list it in FORWARDED_ALLOW_IPS (see server.py) so the address
+    is taken from X-Forwarded-For; otherwise every client shares the proxy's
+    budget, which is why the per-IP redirect rule is opt-in.
+    """
+    defaults = {
+        "redirect_ip": "",
+        "redirect_slug": "",
+        "password_ip": "10/60",
+        "password_slug": "30/60",
+    }
+    rules = {}
+    for rule, default in defaults.items():
+        rate = parse_rate(os.environ.get(f"RATE_LIMIT_{rule.upper()}", default))
+        if rate is not None:
+            rules[rule] = rate
+    return RateLimiter(
+        rules, max_local_keys=int(os.environ.get("RATE_LIMIT_LOCAL_KEYS", 10000))
+    )
@@ -0,0 +1,145 @@
+# redirect-service/resilience.py
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+_DEFAULT = object()
+
+
+class DependencyUnavailable(Exception):
+    """Raised when a dependency call failed, timed out or its circuit is open."""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"{name} unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """
+    Per-dependency timeout and circuit breaker.
+
+    Every call is bounded by `timeout` seconds. After `failure_threshold`
+    consecutive failures the circuit opens and calls fail immediately for
+    `reset_timeout` seconds; then a single trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit. Only
+    timeouts and the given `exceptions` count as failures; anything else
+    is a bug and propagates unchanged.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        exceptions: Tuple[Type[BaseException], ...] = (OSError,),
+        timeout: Optional[float] = 1.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.exceptions = exceptions
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    @property
+    def available(self) -> bool:
+        """False while calls would be rejected without being attempted."""
+        state = self.state
+        return state == self.CLOSED or (
+            state == self.HALF_OPEN and not self._trial_in_flight
+        )
+
+    async def call(
+        self, fn: Callable[..., Awaitable[Any]], *args, timeout: Any = _DEFAULT
+    ) -> Any:
+        """
+        Awaits fn(*args) under the breaker. Failures are raised as
+        DependencyUnavailable; `timeout=None` leaves the duration to `fn`.
+        """
+        if not self.available:
+            self.rejected += 1
+            raise DependencyUnavailable(self.name, "circuit open")
+        trial = self.state == self.HALF_OPEN
+        if trial:
+            self._trial_in_flight = True
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+        try:
+            async with asyncio.timeout(timeout):
+                result = await fn(*args)
+        except TimeoutError:
+            self._record_failure()
+            raise DependencyUnavailable(self.name, "timed out") from None
+        except self.exceptions as e:
+            self._record_failure()
+            raise DependencyUnavailable(self.name, str(e) or type(e).__name__) from e
+        finally:
+            if trial:
+                self._trial_in_flight = False
+        self._record_success()
+        return result
+
+    def _record_success(self):
+        self._failures = 0
+        self._opened_at = None
+
+    def _record_failure(self):
+        self.failures += 1
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            # 半開狀態的試探失敗也會重新計時
+            if self._opened_at is None:
+                self.opened += 1
+            self._opened_at = self._clock()
+
+    def reset(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+
+def create_circuit_breaker(
+    name: str,
+    exceptions: Tuple[Type[BaseException], ...],
+    default_timeout: float,
+) -> CircuitBreaker:
+    """
+    Builds a breaker configured by <NAME>_TIMEOUT, <NAME>_BREAKER_THRESHOLD
+    and <NAME>_BREAKER_RESET, e.g. REDIS_TIMEOUT=0.25.
+    """
+    prefix = name.upper()
+    return CircuitBreaker(
+        name,
+        exceptions=exceptions,
+        timeout=float(os.environ.get(f"{prefix}_TIMEOUT", default_timeout)),
+        failure_threshold=int(os.environ.get(f"{prefix}_BREAKER_THRESHOLD", 5)),
+        reset_timeout=float(os.environ.get(f"{prefix}_BREAKER_RESET", 5)),
+    )
@@ -0,0 +1,84 @@
+# redirect-service/security.py
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import Response
+from passlib.context import CryptContext  # 導入密碼雜湊工具
+
+logger = logging.getLogger(__name__)
+
+# Password hashing context
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt 刻意耗費數十毫秒 CPU，放到獨立的執行緒池中執行，避免凍結事件迴圈。
+# bcrypt 在計算雜湊時會釋放 GIL，所以執行緒即可並行。
+PASSWORD_VERIFY_CONCURRENCY = int(os.environ.get("PASSWORD_VERIFY_CONCURRENCY", 4))
+_verify_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_VERIFY_CONCURRENCY, thread_name_prefix="password-verify"
+)
+_verify_semaphore = asyncio.Semaphore(PASSWORD_VERIFY_CONCURRENCY)
+
+# Signed "already unlocked" cookie, scoped to /r/{slug}
+ACCESS_COOKIE_NAME = "link_access"
+ACCESS_TOKEN_TTL = int(os.environ.get("LINK_ACCESS_TTL", 900))
+_access_secret = os.environ.get("LINK_ACCESS_SECRET", "").encode()
+if not _access_secret:
+    # 未設定時每個 worker 使用隨機金鑰：token 只在同一個 process 內有效
+    logger.warning("LINK_ACCESS_SECRET not set, using a per-process random key.")
+    _access_secret = secrets.token_bytes(32)
+
+
+async def verify_password(plain_password: str, password_hash: str) -> bool:
+    """
+    Verifies a password against its bcrypt hash on the bounded verify pool.
+    """
+    loop = asyncio.get_running_loop()
+    async with _verify_semaphore:
+        try:
+            return await loop.run_in_executor(
+                _verify_executor, pwd_context.verify, plain_password, password_hash
+            )
+        except ValueError:
+            # 無法辨識的雜湊格式，視為密碼錯誤
+            return False
+
+
+def _sign(slug: str, password_hash: str, expires: int) -> str:
+    # 將密碼雜湊納入簽章：連結密碼變更後，舊的 token 自動失效
+    message = f"{slug}:{expires}:{password_hash}".encode()
+    return hmac.new(_access_secret, message, hashlib.sha256).hexdigest()
+
+
+def create_access_token(
+    slug: str, password_hash: str, ttl: Optional[int] = None
+) -> str:
+    expires = int(time.time()) + (ACCESS_TOKEN_TTL if ttl is None else ttl)
+    return f"{expires}.{_sign(slug, password_hash, expires)}"
+
+
+def verify_access_token(token: str, slug: str, password_hash: str) -> bool:
+    """
+    Checks an access token issued for this slug and password hash.
+    """
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _sign(slug, password_hash, int(expires)))
+
+
+def set_access_cookie(response: Response, slug: str, password_hash: str):
+    response.set_cookie(
+        ACCESS_COOKIE_NAME,
+        create_access_token(slug, password_hash),
+        max_age=ACCESS_TOKEN_TTL,
+        path=f"/r/{slug}",
+        httponly=True,
+        samesite="lax",
+    )
@@ -0,0 +1,98 @@
+# redirect-service/server.py
+"""
+Runs the service under uvicorn with a server profile chosen by SERVER_PROFILE.
+
+  default      what `uvicorn main:app` does: one worker, the best event loop
+               and HTTP parser available, access log on.
+  performance  uvloop and httptools (required, startup fails without them),
+               WEB_CONCURRENCY workers (default one per usable CPU), no
+               access log, and /r/{slug} is answered without the middleware
+               stack and FastAPI parameter handling (fast_path.RedirectFastPath),
+               so CORS headers are not sent on redirects.
+
+Several workers need LINK_ACCESS_SECRET: without it each worker signs the
+unlock cookies of password-protected links with its own random key, so a
+cookie only works on the worker that issued it. uvicorn_options() refuses to
+start them.
+
+With several workers, SIGHUP restarts them one at a time, each finishing its
+in-flight requests within GRACEFUL_SHUTDOWN_TIMEOUT seconds, so new code or
+configuration is picked up without dropping the listening socket; SIGTTIN /
+SIGTTOU add or remove a worker.
+
+Behind a load balancer or CDN, set FORWARDED_ALLOW_IPS to its addresses
+(comma-separated IPs or networks, "*" to trust any peer) so the client address
+used by the per-IP rate limits comes from X-Forwarded-For instead of being the
+proxy's. The default trusts only 127.0.0.1.
+
+Usage:
+    SERVER_PROFILE=performance uv run python -m server
+    kill -HUP <server pid>    # graceful reload
+"""
+
+import os
+from typing import Optional
+
+import uvicorn
+
+PROFILES = ("default", "performance")
+
+
+def server_profile() -> str:
+    profile = os.environ.get("SERVER_PROFILE", "default")
+    if profile not in PROFILES:
+        raise ValueError(f"SERVER_PROFILE must be one of {', '.join(PROFILES)}")
+    return profile
+
+
+def worker_count(profile: str, workers: Optional[int] = None) -> int:
+    """
+    Workers uvicorn will start: `workers`, else WEB_CONCURRENCY (which
+    uvicorn reads itself when no count is passed), else one per usable CPU
+    for the performance profile and one otherwise.
+    """
+    if workers:
+        return workers
+    if os.environ.get("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    if profile == "performance":
+        return os.process_cpu_count() or 1
+    return 1
+
+
+def uvicorn_options(profile: str, workers: Optional[int] = None) -> dict:
+    """uvicorn.run() keyword arguments for a server profile."""
+    options = {
+        "host": os.environ.get("HOST", "0.0.0.0"),
+        "port": int(os.environ.get("PORT", 8002)),
+        "timeout_graceful_shutdown": int(
+            os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", 10)
+        ),
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    }
+    count = worker_count(profile, workers)
+    if profile == "performance":
+        options.update(
+            loop="uvloop",
+            http="httptools",
+            workers=count,
+            access_log=False,
+            backlog=int(os.environ.get("SERVER_BACKLOG", 4096)),
+        )
+    elif workers:
+        options["workers"] = workers
+    if count > 1 and not os.environ.get("LINK_ACCESS_SECRET"):
+        raise ValueError(
+            "LINK_ACCESS_SECRET must be set to run several workers, otherwise "
+            "unlock cookies are only accepted by the worker that issued them"
+        )
+    return options
+
+
+def main():
+    uvicorn.run("main:app", **uvicorn_options(server_profile()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+# redirect-service/sharding.py
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# 視為節點故障、改送到下一個節點的錯誤；其他錯誤 (例如 WRONGTYPE) 照常拋出
+NODE_ERRORS = (redis.ConnectionError, redis.TimeoutError, OSError)
+
+# 只讀取、不改變資料的指令；其他指令在故障節點上視為被丟棄的寫入
+READ_COMMANDS = frozenset({"get", "exists", "ttl", "pttl", "hgetall"})
+# 故障節點上的回覆：如同節點是空的，SET 成功但沒有寫入，其餘為 nil
+DOWN_NODE_REPLIES = {"set": True, "delete": 0, "exists": 0, "expire": False}
+
+
+def key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def routing_key(key: str) -> str:
+    """
+    Part of the key that decides its node. As in Redis Cluster, a non-empty
+    {hash tag} keeps related keys on the same node.
+    """
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1 : end]
+    return key
+
+
+class HashRing:
+    """
+    Consistent hash ring with `vnodes` virtual nodes per node, so adding or
+    removing one of N nodes moves only about 1/N of the keys.
+    """
+
+    def __init__(self, nodes: List[str], vnodes: int = 160):
+        self.nodes = list(nodes)
+        points = sorted(
+            (key_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def preference_list(self, key: str) -> List[str]:
+        """Distinct nodes in ring order starting at the key's owner."""
+        start = bisect.bisect(self._hashes, key_hash(routing_key(key)))
+        nodes: List[str] = []
+        for i in range(len(self._owners)):
+            node = self._owners[(start + i) % len(self._owners)]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == len(self.nodes):
+                    break
+        return nodes
+
+    def node_for(self, key: str) -> str:
+        return self.preference_list(key)[0]
+
+
+class ShardedRedis:
+    """
+    Redis client facade that spreads keys over several nodes.
+
+    Supports the commands the cache layer uses on single keys, EVAL whose
+    keys all live on one node, and non-transactional pipelines (split per
+    node and run concurrently). Each node keeps its own connection pool.
+
+    A node that fails with a connection error or timeout is skipped for
+    `retry_interval` seconds. Its keys are not moved to another node, which
+    would leave copies there that turn stale once the owner is back; instead
+    they behave as if the node were empty and dropped every write: reads
+    miss, SET succeeds without storing anything, scripts return nil. Keys
+    written while a node was down are deleted from it when it recovers (up
+    to `max_stale_keys` per node), so entries it held from before the outage
+    cannot outlive a change made in the meantime.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, redis.Redis],
+        vnodes: int = 160,
+        retry_interval: float = 5.0,
+        max_stale_keys: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.clients = clients
+        self.ring = HashRing(list(clients), vnodes)
+        self.retry_interval = retry_interval
+        self.max_stale_keys = max_stale_keys
+        self._clock = clock
+        self._down_until: Dict[str, float] = {}
+        # 節點故障期間被丟棄的寫入：恢復後先刪除這些 key
+        self._stale_keys: Dict[str, Set[str]] = {}
+        self.failovers: Dict[str, int] = {node: 0 for node in clients}
+        self.dropped_writes: Dict[str, int] = {node: 0 for node in clients}
+
+    def healthy(self, node: str) -> bool:
+        return self._down_until.get(node, 0) <= self._clock()
+
+    def node_for(self, key: str) -> str:
+        return self.ring.node_for(key)
+
+    def mark_down(self, node: str, error: Exception):
+        if self.healthy(node):
+            logger.warning(
+                "Redis node %s failed, treating its keys as misses for %ss: %s",
+                node,
+                self.retry_interval,
+                error,
+            )
+        self._down_until[node] = self._clock() + self.retry_interval
+        self.failovers[node] += 1
+
+    def _down_reply(self, node: str, key: str, command: str) -> Any:
+        """Reply of a command on a down node, recording dropped writes."""
+        if command not in READ_COMMANDS:
+            self.dropped_writes[node] += 1
+            stale = self._stale_keys.setdefault(node, set())
+            if len(stale) < self.max_stale_keys:
+                stale.add(key)
+        return DOWN_NODE_REPLIES.get(command)
+
+    async def _recover(self, node: str):
+        """Deletes the keys written while `node` was down before using it again."""
+        stale = self._stale_keys.pop(node, None)
+        if not stale:
+            return
+        if len(stale) >= self.max_stale_keys:
+            logger.warning(
+                "Redis node %s missed more than %s writes while down, older "
+                "entries may be served until their TTL expires.",
+                node,
+                self.max_stale_keys,
+            )
+        keys = list(stale)
+        try:
+            for start in range(0, len(keys), 1000):
+                await self.clients[node].delete(*keys[start : start + 1000])
+        except NODE_ERRORS:
+            self._stale_keys.setdefault(node, set()).update(stale)
+            raise
+        logger.info("Redis node %s recovered, dropped %s stale keys.", node, len(stale))
+
+    async def _call(self, key: str, command: str, *args, **kwargs) -> Any:
+        node = self.node_for(key)
+        if not self.healthy(node):
+            return self._down_reply(node, key, command)
+        try:
+            if node in self._stale_keys:
+                await self._recover(node)
+            return await getattr(self.clients[node], command)(*args, **kwargs)
+        except NODE_ERRORS as e:
+            self.mark_down(node, e)
+            return self._down_reply(node, key, command)
+
+    def __getattr__(self, command: str):
+        if command.startswith("_"):
+            raise AttributeError(command)
+
+        # 單一 key 的指令 (get、set、delete...)：依第一個參數路由
+        async def call(key: str, *args, **kwargs):
+            return await self._call(key, command, key, *args, **kwargs)
+
+        return call
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args) -> Any:
+        keys = keys_and_args[:numkeys]
+        if len({self.node_for(key) for key in keys}) > 1:
+            raise redis.RedisError(
+                "Script keys map to different nodes, use a common {hash tag}."
+            )
+        return await self._call(keys[0], "eval", script, numkeys, *keys_and_args)
+
+    def pipeline(self, transaction: bool = False) -> "ShardedPipeline":
+        if transaction:
+            raise redis.RedisError("Transactions are not supported across nodes.")
+        return ShardedPipeline(self)
+
+    async def ping(self) -> bool:
+        """
+        Pings every node. Fails only if no node answers; unreachable nodes
+        are routed around.
+        """
+        results = await asyncio.gather(
+            *(client.ping() for client in self.clients.values()),
+            return_exceptions=True,
+        )
+        errors = []
+        for node, result in zip(self.clients, results):
+            if isinstance(result, NODE_ERRORS):
+                self.mark_down(node, result)
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+        if len(errors) == len(self.clients):
+            raise errors[0]
+        return True
+
+    async def aclose(self, close_connection_pool: Optional[bool] = None):
+        await asyncio.gather(
+            *(
+                client.aclose(close_connection_pool=close_connection_pool)
+                for client in self.clients.values()
+            )
+        )
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            node: {
+                "healthy": self.healthy(node),
+                "failovers": self.failovers[node],
+                "dropped_writes": self.dropped_writes[node],
+            }
+            for node in self.clients
+        }
+
+
+class ShardedPipeline:
+    """
+    Buffers commands like a non-transactional redis.asyncio pipeline; execute()
+    sends one pipeline per involved node concurrently and returns the replies
+    in command order.
+    """
+
+    def __init__(self, sharded: ShardedRedis):
+        self._sharded = sharded
+        # (key, command, args, kwargs)
+        self._commands: List[Tuple[str, str, tuple, dict]] = []
+
+    def __getattr__(self, command: str):
+        if command.startswith("_"):
+            raise AttributeError(command)
+
+        def queue(*args, **kwargs):
+            # EVAL 的第一個 key 在 script 與 numkeys 之後
+            key = args[2] if command == "eval" else args[0]
+            self._commands.append((key, command, args, kwargs))
+            return self
+
+        return queue
+
+    def __await__(self):
+        # 與 redis.asyncio 的 Pipeline 相同：await 佇列中的指令會回傳 pipeline 本身
+        if False:
+            yield
+        return self
+
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        commands, self._commands = self._commands, []
+        groups: Dict[str, List[int]] = {}
+        for index, (key, _, _, _) in enumerate(commands):
+            groups.setdefault(self._sharded.node_for(key), []).append(index)
+        replies: List[Any] = [None] * len(commands)
+        await asyncio.gather(
+            *(
+                self._execute_group(node, indexes, commands, replies, raise_on_error)
+                for node, indexes in groups.items()
+            )
+        )
+        return replies
+
+    async def _execute_group(
+        self,
+        node: str,
+        indexes: List[int],
+        commands: List[Tuple[str, str, tuple, dict]],
+        replies: List[Any],
+        raise_on_error: bool,
+    ):
+        sharded = self._sharded
+        if sharded.healthy(node):
+            try:
+                if node in sharded._stale_keys:
+                    await sharded._recover(node)
+                results = await self._run_on(node, indexes, commands, raise_on_error)
+            except NODE_ERRORS as e:
+                sharded.mark_down(node, e)
+            else:
+                for index, result in zip(indexes, results):
+                    replies[index] = result
+                return
+        for index in indexes:
+            key, command, _, _ = commands[index]
+            replies[index] = sharded._down_reply(node, key, command)
+
+    async def _run_on(
+        self,
+        node: str,
+        indexes: List[int],
+        commands: List[Tuple[str, str, tuple, dict]],
+        raise_on_error: bool,
+    ) -> List[Any]:
+        pipeline = self._sharded.clients[node].pipeline(transaction=False)
+        for index in indexes:
+            _, command, args, kwargs = commands[index]
+            getattr(pipeline, command)(*args, **kwargs)
+        return await pipeline.execute(raise_on_error=raise_on_error)
@@ -0,0 +1,308 @@
+# redirect-service/shared_snapshot.py
+import asyncio
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from cache import decode_link_data, encode_link_data
+from database import link_data_from_document
+from warmup import hottest_links
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LSNP"
+FORMAT_VERSION = 1
+# magic, format version, slot count, record count, built at (unix time)
+_HEADER = struct.Struct("<4sIIId")
+# slug hash, record offset (0 = empty slot)
+_SLOT = struct.Struct("<QI")
+# slug length, value length; followed by the slug and the cache-encoded value
+_RECORD = struct.Struct("<HI")
+
+
+def slug_hash(slug: bytes) -> int:
+    # 需要跨行程一致的雜湊：內建 hash() 在每個行程的 seed 都不同
+    return int.from_bytes(hashlib.blake2b(slug, digest_size=8).digest(), "little")
+
+
+def write_link_snapshot(
+    path: str, links: Iterable[Tuple[str, dict]], built_at: Optional[float] = None
+) -> int:
+    """
+    Writes an open-addressing hash table of links to `path` and atomically
+    replaces the previous snapshot. Values use the Redis cache encoding;
+    `built_at` is when the data was read (defaults to now).
+    Returns the number of links written.
+    """
+    records = [
+        (slug.encode(), encode_link_data(link_data).encode())
+        for slug, link_data in links
+    ]
+    # 負載係數 0.5：線性探測一定會遇到空槽
+    slot_count = max(len(records) * 2, 8)
+    slots = bytearray(slot_count * _SLOT.size)
+    data = bytearray()
+    data_start = _HEADER.size + len(slots)
+    for slug, value in records:
+        digest = slug_hash(slug)
+        index = digest % slot_count
+        while _SLOT.unpack_from(slots, index * _SLOT.size)[1]:
+            index = (index + 1) % slot_count
+        _SLOT.pack_into(slots, index * _SLOT.size, digest, data_start + len(data))
+        data += _RECORD.pack(len(slug), len(value)) + slug + value
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                slot_count,
+                len(records),
+                time.time() if built_at is None else built_at,
+            )
+        )
+        f.write(slots)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class LinkSnapshot:
+    """
+    Read-mostly table of the hottest links shared by every worker on a host.
+
+    One worker, elected with an exclusive lock on `<path>.lock`, rebuilds the
+    snapshot file from MongoDB every `refresh_interval` seconds and swaps it
+    in with an atomic rename. Every worker maps the current file read-only
+    and picks up new versions within `check_interval` seconds, so the pages
+    live once in the OS page cache no matter how many workers there are, and
+    a freshly started worker is hot as soon as it maps the file. Lookups
+    probe the mapping in place and only decode the matching record.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 100000,
+        refresh_interval: float = 60.0,
+        check_interval: float = 5.0,
+        enabled: bool = True,
+    ):
+        self.path = path
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self.enabled = enabled
+        self._map: Optional[mmap.mmap] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._slot_count = 0
+        self._record_count = 0
+        self.built_at: Optional[float] = None
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        # slug -> 失效時間；在更新的快照載入前不再提供這些 slug
+        self._invalidated: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.reloads = 0
+
+    def __len__(self) -> int:
+        return self._record_count
+
+    @property
+    def ready(self) -> bool:
+        return self._map is not None
+
+    @property
+    def is_builder(self) -> bool:
+        return self._lock_file is not None
+
+    def get(self, slug: str) -> Optional[Dict]:
+        """
+        Returns the link data of a slug in the snapshot, or None.
+        """
+        mapped = self._map
+        if mapped is None or slug in self._invalidated:
+            return None
+        key = slug.encode()
+        digest = slug_hash(key)
+        index = digest % self._slot_count
+        while True:
+            slot_digest, offset = _SLOT.unpack_from(
+                mapped, _HEADER.size + index * _SLOT.size
+            )
+            if offset == 0:
+                self.misses += 1
+                return None
+            if slot_digest == digest:
+                slug_length, value_length = _RECORD.unpack_from(mapped, offset)
+                start = offset + _RECORD.size
+                if mapped[start : start + slug_length] == key:
+                    self.hits += 1
+                    start += slug_length
+                    return decode_link_data(
+                        mapped[start : start + value_length].decode()
+                    )
+            index = (index + 1) % self._slot_count
+
+    def reload(self) -> bool:
+        """
+        Maps the snapshot file if it was replaced since the last call.
+        Returns True if a new version was mapped.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._version:
+            return False
+        self._version = version
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, format_version, slot_count, record_count, built_at = (
+                _HEADER.unpack_from(mapped, 0)
+            )
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("Could not map link snapshot %s: %s", self.path, e)
+            return False
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            mapped.close()
+            logger.warning("Ignoring link snapshot %s in unknown format.", self.path)
+            return False
+        # 查詢不會跨越 await，替換後即可關閉舊的 mapping
+        previous, self._map = self._map, mapped
+        self._slot_count = slot_count
+        self._record_count = record_count
+        self.built_at = built_at
+        self._invalidated = {
+            slug: invalidated_at
+            for slug, invalidated_at in self._invalidated.items()
+            if invalidated_at >= built_at
+        }
+        self.reloads += 1
+        if previous is not None:
+            previous.close()
+        return True
+
+    def invalidate(self, slug: str):
+        """
+        Stops serving a changed link until a snapshot built after the change
+        is mapped.
+        """
+        if self._map is not None:
+            self._invalidated[slug] = time.time()
+
+    async def build(self) -> int:
+        """
+        Writes a new snapshot of the `size` most clicked links.
+        """
+        started_at = time.time()
+        links = [
+            (document["slug"], link_data_from_document(document))
+            async for document in hottest_links(self.size, batch_size=5000)
+        ]
+        count = await asyncio.to_thread(
+            write_link_snapshot, self.path, links, started_at
+        )
+        self.builds += 1
+        logger.info("Link snapshot built with %s links.", count)
+        return count
+
+    def start(self):
+        if not self.enabled:
+            return
+        # 先映射既有的快照，新啟動的 worker 立即可用
+        self.reload()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._version = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self._try_become_builder() and self._build_due():
+                    await self.build()
+                self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Link snapshot refresh failed: %s", e)
+            await asyncio.sleep(self.check_interval)
+
+    def _try_become_builder(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        # 持有鎖的 worker 結束時鎖會自動釋放，由其他 worker 接手
+        self._lock_file = lock_file
+        logger.info("This worker now builds the shared link snapshot.")
+        return True
+
+    def _build_due(self) -> bool:
+        try:
+            age = time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return True
+        return age >= self.refresh_interval
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "builder": self.is_builder,
+            "links": self._record_count,
+            "age_seconds": (
+                time.time() - self.built_at if self.built_at is not None else None
+            ),
+            "hits": self.hits,
+            "misses": self.misses,
+            "builds": self.builds,
+            "reloads": self.reloads,
+        }
+
+
+def create_link_snapshot() -> LinkSnapshot:
+    """
+    Builds the shared snapshot from environment variables.
+    Disabled unless SHARED_SNAPSHOT_PATH is set; every worker on a host must
+    use the same path.
+    """
+    path = os.environ.get("SHARED_SNAPSHOT_PATH", "")
+    return LinkSnapshot(
+        path,
+        size=int(os.environ.get("SHARED_SNAPSHOT_SIZE", 100000)),
+        refresh_interval=float(os.environ.get("SHARED_SNAPSHOT_REFRESH", 60)),
+        check_interval=float(os.environ.get("SHARED_SNAPSHOT_CHECK_INTERVAL", 5)),
+        enabled=bool(path),
+    )
@@ -0,0 +1,264 @@
+# redirect-service/slug_index.py
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+from bson import ObjectId
+from models import Link
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+    Uses double hashing on a single blake2b digest to derive the k bit positions.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.num_bits = max(
+            8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str):
+        # 只有設定了新位元時才計數，重複加入同一個項目不會讓 count 膨脹
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Estimated false-positive rate for the items added so far."""
+        return (
+            1 - math.exp(-self.num_hashes * self.count / self.num_bits)
+        ) ** self.num_hashes
+
+
+def sized_bloom_filter(expected: int, error_rate: float) -> BloomFilter:
+    """
+    Filter for a collection of `expected` slugs, with room for twice as many
+    so slugs added between rebuilds keep the false-positive rate near
+    `error_rate`.
+    """
+    return BloomFilter(max(expected * 2, 1000), error_rate)
+
+
+class SlugIndex:
+    """
+    Probabilistic membership index of every existing Link.slug.
+
+    Built from MongoDB in the background at startup and kept current by
+    polling for recently inserted links every `refresh_interval` seconds and
+    by link change events (see main.apply_link_change). A link created after
+    the last sync is answered 404 until one of those adds it, so the poll
+    interval bounds the create-then-click window. The poll only sees new
+    documents, so a renamed slug is added by its change event or, with
+    invalidation off, by the full rebuild every `rebuild_interval` seconds,
+    which also drops deleted slugs. Until the first build
+    finishes, and whenever no sync succeeded for `max_staleness` seconds,
+    might_exist() answers True so requests fall through to the normal lookup.
+
+    `pattern` optionally rejects slugs the backend can never generate; it
+    must match every slug the backend accepts.
+    """
+
+    def __init__(
+        self,
+        error_rate: float = 0.001,
+        pattern: Optional[str] = None,
+        refresh_interval: float = 1.0,
+        max_staleness: float = 30.0,
+        rebuild_interval: float = 600.0,
+        enabled: bool = True,
+    ):
+        self.error_rate = error_rate
+        self.enabled = enabled
+        self.refresh_interval = refresh_interval
+        self.max_staleness = timedelta(seconds=max_staleness)
+        self.rebuild_interval = timedelta(seconds=rebuild_interval)
+        self._pattern = re.compile(pattern) if pattern else None
+        self._filter: Optional[BloomFilter] = None
+        self._synced_until: Optional[datetime] = None
+        self._built_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.rejected_malformed = 0
+        self.rejected_absent = 0
+        self.stale_passes = 0
+        self.rebuilds = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._filter is not None
+
+    def is_valid_slug(self, slug: str) -> bool:
+        if self._pattern is None or self._pattern.fullmatch(slug):
+            return True
+        self.rejected_malformed += 1
+        return False
+
+    def might_exist(self, slug: str) -> bool:
+        """
+        False only if the slug is malformed or definitely not a known link.
+        """
+        if not self.is_valid_slug(slug):
+            return False
+        if self._filter is None or slug in self._filter:
+            return True
+        # 更新失敗太久時，新建立的連結可能不在 filter 中：改走一般查詢
+        if datetime.now(timezone.utc) - self._synced_until > self.max_staleness:
+            self.stale_passes += 1
+            return True
+        self.rejected_absent += 1
+        return False
+
+    def add(self, slug: str):
+        if self._filter is not None:
+            self._filter.add(slug)
+
+    def clear(self):
+        self._filter = None
+        self._synced_until = None
+        self._built_at = None
+
+    async def build(self):
+        """
+        Streams every slug from the links collection into a fresh filter and
+        swaps it in. Sized with headroom so incremental adds keep the
+        false-positive rate close to the target.
+        """
+        collection = Link.get_motor_collection()
+        started_at = datetime.now(timezone.utc)
+        expected = await collection.estimated_document_count()
+        bloom = sized_bloom_filter(expected, self.error_rate)
+        async for document in collection.find(
+            {}, {"slug": 1, "_id": 0}, batch_size=10000
+        ):
+            bloom.add(document["slug"])
+        self._filter = bloom
+        self._synced_until = started_at
+        self._built_at = started_at
+        self.rebuilds += 1
+        logger.info(
+            "Slug index built with %s slugs (%s bytes).",
+            bloom.count,
+            bloom.memory_bytes,
+        )
+
+    async def refresh(self):
+        """
+        Adds links inserted since the last sync. ObjectIds are generated by
+        the writers' clocks, so the query overlaps the previous window by a
+        minute; adding a slug twice is harmless. Rebuilds the filter when it
+        is full or older than `rebuild_interval`.
+        """
+        if self._rebuild_due():
+            await self.build()
+            return
+        started_at = datetime.now(timezone.utc)
+        since = ObjectId.from_datetime(self._synced_until - timedelta(minutes=1))
+        async for document in Link.get_motor_collection().find(
+            {"_id": {"$gte": since}}, {"slug": 1, "_id": 0}
+        ):
+            self._filter.add(document["slug"])
+        self._synced_until = started_at
+
+    def _rebuild_due(self) -> bool:
+        if self._filter is None or self._filter.count >= self._filter.capacity:
+            return True
+        if not self.rebuild_interval or self._built_at is None:
+            return False
+        return datetime.now(timezone.utc) - self._built_at >= self.rebuild_interval
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # 初次建立後定期增量更新；背景執行，不阻塞服務啟動
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Slug index refresh failed: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+    def stats(self) -> Dict[str, float]:
+        stats = {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "rejected_malformed": self.rejected_malformed,
+            "rejected_absent": self.rejected_absent,
+            "stale_passes": self.stale_passes,
+            "rebuilds": self.rebuilds,
+        }
+        if self._filter is not None:
+            stats.update(
+                {
+                    "slugs": self._filter.count,
+                    "capacity": self._filter.capacity,
+                    "memory_bytes": self._filter.memory_bytes,
+                    "hash_functions": self._filter.num_hashes,
+                    "false_positive_rate": self._filter.false_positive_rate,
+                }
+            )
+        return stats
+
+
+def create_slug_index() -> SlugIndex:
+    """
+    Builds the slug index from environment variables.
+    With SLUG_INDEX_ENABLED=false only the syntactic slug check is applied.
+    SLUG_INDEX_REBUILD_INTERVAL=0 disables the periodic full rebuild.
+    SLUG_PATTERN (a full-match regex, e.g. "[A-Za-z0-9_-]{1,128}") is off by
+    default; set it only to the backend's own slug rules.
+    """
+    return SlugIndex(
+        enabled=os.environ.get("SLUG_INDEX_ENABLED", "true").lower() == "true",
+        error_rate=float(os.environ.get("SLUG_INDEX_ERROR_RATE", 0.001)),
+        pattern=os.environ.get("SLUG_PATTERN") or None,
+        refresh_interval=float(os.environ.get("SLUG_INDEX_REFRESH_INTERVAL", 1)),
+        max_staleness=float(os.environ.get("SLUG_INDEX_MAX_STALENESS", 30)),
+        rebuild_interval=float(os.environ.get("SLUG_INDEX_REBUILD_INTERVAL", 600)),
+    )
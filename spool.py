@@ -0,0 +1,291 @@
+# redirect-service/spool.py
+import fcntl
+import json
+import logging
+import os
+import shutil
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor"
+LOCK_FILE = "lock"
+WORKER_DIR_PREFIX = "worker-"
+
+Position = Tuple[int, int]
+
+
+class ClickSpool:
+    """
+    Append-only on-disk journal for click events the broker could not take.
+
+    Events are stored as JSON lines in numbered segment files of about
+    `segment_bytes` each. Every append() writes its whole batch with a single
+    fsync. read() returns the oldest events and the position after them; once
+    they are published, commit(position) persists the read cursor and deletes
+    fully replayed segments. Delivery is at-least-once: a crash between
+    publish and commit replays that batch again.
+
+    Appends are refused once `max_bytes` would be exceeded, so disk usage is
+    bounded. Not thread-safe: the publisher calls it from its own thread.
+    A directory must only be used by one process at a time; see
+    claim_worker_directory(). `lock_file` is released by close().
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 4 * 1024 * 1024,
+        max_bytes: int = 256 * 1024 * 1024,
+        lock_file=None,
+    ):
+        self.directory = directory
+        self._lock_file = lock_file
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._sizes = {
+            int(name[: -len(SEGMENT_SUFFIX)]): os.path.getsize(
+                os.path.join(directory, name)
+            )
+            for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        }
+        self._read_segment, self._read_offset = self._load_cursor()
+        for segment in [s for s in self._sizes if s < self._read_segment]:
+            self._remove_segment(segment)
+        if self._read_segment not in self._sizes:
+            self._read_segment, self._read_offset = min(self._sizes, default=0), 0
+        # 重新啟動後一律寫入新的 segment，上次中斷時殘留的半行只會留在舊檔案
+        self._write_segment = max(self._sizes, default=self._read_segment - 1) + 1
+        self._writer = None
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.adopted = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    @property
+    def pending_bytes(self) -> int:
+        return self.size_bytes - self._read_offset
+
+    @property
+    def pending(self) -> bool:
+        return self.pending_bytes > 0
+
+    def append(self, messages: List[dict]) -> bool:
+        """
+        Durably appends a batch. Returns False, counting the events as
+        dropped, if the spool is full.
+        """
+        data = "".join(json.dumps(message) + "\n" for message in messages).encode()
+        if self.size_bytes + len(data) > self.max_bytes:
+            self.dropped += len(messages)
+            return False
+        size = self._sizes.get(self._write_segment, 0)
+        if self._writer is None or (size and size + len(data) > self.segment_bytes):
+            self._open_next_segment()
+        self._writer.write(data)
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._sizes[self._write_segment] += len(data)
+        self.appended += len(messages)
+        return True
+
+    def read(self, max_events: int) -> Tuple[List[dict], Position]:
+        """
+        Returns up to `max_events` of the oldest events and the position to
+        commit once they have been delivered. Corrupt lines are skipped.
+        """
+        messages: List[dict] = []
+        segment, offset = self._read_segment, self._read_offset
+        while len(messages) < max_events and segment in self._sizes:
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                while len(messages) < max_events:
+                    line = f.readline()
+                    if not line:
+                        break
+                    offset += len(line)
+                    try:
+                        messages.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(
+                            "Skipping corrupt spool record in segment %s.", segment
+                        )
+            if len(messages) >= max_events or offset < self._sizes[segment]:
+                break
+            # 讀完的 segment：若後面還有較新的檔案就往下讀
+            next_segments = [s for s in self._sizes if s > segment]
+            if not next_segments:
+                break
+            segment, offset = min(next_segments), 0
+        return messages, (segment, offset)
+
+    def commit(self, position: Position, count: int):
+        """Marks everything before `position` as delivered."""
+        segment, offset = position
+        for old in [s for s in self._sizes if s < segment]:
+            self._remove_segment(old)
+        self._read_segment, self._read_offset = segment, offset
+        self._save_cursor()
+        self.replayed += count
+
+    def adopt(self, directory: str, batch_size: int = 10000) -> bool:
+        """
+        Moves the pending events of another spool directory into this one and
+        deletes it. The caller must hold that directory's lock. Returns False,
+        leaving the rest in place, if this spool fills up.
+        """
+        orphan = ClickSpool(
+            directory, segment_bytes=self.segment_bytes, max_bytes=self.max_bytes
+        )
+        try:
+            while orphan.pending:
+                messages, position = orphan.read(batch_size)
+                if messages and not self.append(messages):
+                    # 事件仍留在原目錄，不算遺失
+                    self.dropped -= len(messages)
+                    return False
+                orphan.commit(position, len(messages))
+                self.adopted += len(messages)
+                if not messages:
+                    break
+        finally:
+            orphan.close()
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> dict:
+        return {
+            "size_bytes": self.size_bytes,
+            "pending_bytes": self.pending_bytes,
+            "segments": len(self._sizes),
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+            "adopted": self.adopted,
+        }
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _open_next_segment(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._write_segment += 1
+        self._writer = open(self._segment_path(self._write_segment), "ab")
+        self._sizes.setdefault(self._write_segment, 0)
+
+    def _remove_segment(self, segment: int):
+        self._sizes.pop(segment, None)
+        try:
+            os.remove(self._segment_path(segment))
+        except FileNotFoundError:
+            pass
+
+    def _load_cursor(self) -> Position:
+        path = os.path.join(self.directory, CURSOR_FILE)
+        if not os.path.exists(path):
+            return min(self._sizes, default=0), 0
+        with open(path) as f:
+            cursor = json.load(f)
+        return cursor["segment"], cursor["offset"]
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": self._read_segment, "offset": self._read_offset}, f)
+        os.replace(tmp_path, path)
+
+
+def _try_lock(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, LOCK_FILE), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _worker_directories(root: str) -> List[str]:
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        os.path.join(root, name) for name in names if name.startswith(WORKER_DIR_PREFIX)
+    )
+
+
+def claim_worker_directory(root: str):
+    """
+    Returns (directory, lock_file) for the first `root/worker-N` no other
+    process holds, so every worker of a multi-process server gets its own
+    spool. The flock is released when the process exits, and a restarted
+    worker takes over a free directory together with its pending events.
+    """
+    index = 0
+    while True:
+        directory = os.path.join(root, f"{WORKER_DIR_PREFIX}{index}")
+        lock_file = _try_lock(directory)
+        if lock_file is not None:
+            return directory, lock_file
+        index += 1
+
+
+def adopt_orphaned_directories(spool: ClickSpool, root: str):
+    """
+    Merges the spools of worker directories nobody holds (e.g. after the
+    worker count was lowered) into `spool`, so their events are replayed
+    instead of waiting for a worker that never comes back.
+    """
+    for directory in _worker_directories(root):
+        if directory == spool.directory:
+            continue
+        lock_file = _try_lock(directory)
+        if lock_file is None:
+            continue
+        try:
+            if not spool.adopt(directory):
+                logger.warning("Click spool full, left events in %s.", directory)
+                return
+        finally:
+            lock_file.close()
+        logger.info("Adopted orphaned click spool %s.", directory)
+
+
+def create_click_spool() -> Optional[ClickSpool]:
+    """
+    Builds the click spool from environment variables.
+    An empty CLICK_SPOOL_DIR disables it. Each worker process spools into
+    its own CLICK_SPOOL_DIR/worker-N, so no event is replayed twice.
+    """
+    root = os.environ.get("CLICK_SPOOL_DIR", "click_spool")
+    if not root:
+        return None
+    directory, lock_file = claim_worker_directory(root)
+    spool = ClickSpool(
+        directory,
+        segment_bytes=int(os.environ.get("CLICK_SPOOL_SEGMENT_BYTES", 4 * 1024**2)),
+        max_bytes=int(os.environ.get("CLICK_SPOOL_MAX_BYTES", 256 * 1024**2)),
+        lock_file=lock_file,
+    )
+    adopt_orphaned_directories(spool, root)
+    return spool
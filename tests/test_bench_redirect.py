@@ -0,0 +1,28 @@
+# redirect_service/tests/test_bench_redirect.py
+import json
+
+from benchmarks.bench_redirect import SCENARIOS, compare, main
+
+
+def test_benchmark_covers_every_branch(tmp_path):
+    output = tmp_path / "bench.json"
+    exit_code = main(
+        ["--requests", "10", "--concurrency", "2", "--output", str(output)]
+    )
+    results = json.loads(output.read_text())
+
+    assert exit_code == 0
+    assert set(results["scenarios"]) == {scenario.name for scenario in SCENARIOS}
+    for result in results["scenarios"].values():
+        assert result["errors"] == 0
+        assert result["rps"] > 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_compare_flags_regressions():
+    baseline = {"scenarios": {"redis_hit": {"rps": 1000.0, "p99_ms": 10.0}}}
+    slower = {"scenarios": {"redis_hit": {"rps": 800.0, "p99_ms": 13.0}}}
+    steady = {"scenarios": {"redis_hit": {"rps": 950.0, "p99_ms": 10.5}}}
+
+    assert len(compare(slower, baseline, max_regression=0.1)) == 2
+    assert compare(steady, baseline, max_regression=0.1) == []
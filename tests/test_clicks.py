@@ -0,0 +1,172 @@
+# redirect_service/tests/test_clicks.py
+import asyncio
+import json
+import os
+
+import pytest
+from clicks import ClickAggregator
+
+
+class RecordingSink:
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, counts):
+        if self.fail:
+            raise ConnectionError("mongo down")
+        self.batches.append(counts)
+
+
+@pytest.mark.asyncio
+async def test_clicks_are_aggregated_per_slug():
+    sink = RecordingSink()
+    aggregator = ClickAggregator(sink)
+    for slug in ["a", "b", "a", "a"]:
+        aggregator.record(slug)
+
+    assert await aggregator.flush() is True
+    assert sink.batches == [{"a": 3, "b": 1}]
+    assert aggregator.pending == 0
+    assert aggregator.flushed == 4
+
+
+@pytest.mark.asyncio
+async def test_empty_window_does_not_call_sink():
+    sink = RecordingSink()
+    assert await ClickAggregator(sink).flush() is True
+    assert sink.batches == []
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_counts():
+    sink = RecordingSink(fail=True)
+    aggregator = ClickAggregator(sink)
+    aggregator.record("a")
+    assert await aggregator.flush() is False
+    aggregator.record("a")
+
+    sink.fail = False
+    assert await aggregator.flush() is True
+    assert sink.batches == [{"a": 2}]
+
+
+@pytest.mark.asyncio
+async def test_undelivered_counts_are_retried():
+    async def partial_sink(counts):
+        return {"b": counts["b"]}
+
+    aggregator = ClickAggregator(partial_sink)
+    aggregator.record("a")
+    aggregator.record("b")
+    assert await aggregator.flush() is False
+    assert aggregator.pending == 1
+    assert aggregator.flushed == 1
+
+
+@pytest.mark.asyncio
+async def test_periodic_flush():
+    sink = RecordingSink()
+    aggregator = ClickAggregator(sink, interval=0.01)
+    aggregator.start()
+    aggregator.record("a")
+    await asyncio.sleep(0.05)
+    await aggregator.stop()
+    assert sink.batches == [{"a": 1}]
+
+
+@pytest.mark.asyncio
+async def test_unflushed_counts_survive_restart(tmp_path):
+    state_file = tmp_path / "click_counts.json"
+    sink = RecordingSink(fail=True)
+    aggregator = ClickAggregator(sink, interval=60, state_file=str(state_file))
+    aggregator.start()
+    aggregator.record("a")
+    aggregator.record("a")
+    await aggregator.stop()
+    saved = tmp_path / f"click_counts.json.{os.getpid()}"
+    assert json.loads(saved.read_text()) == {"a": 2}
+
+    sink = RecordingSink()
+    restarted = ClickAggregator(sink, interval=60, state_file=str(state_file))
+    restarted.start()
+    assert restarted.pending == 2
+    assert list(tmp_path.iterdir()) == []
+    await restarted.stop()
+    assert sink.batches == [{"a": 2}]
+
+
+@pytest.mark.asyncio
+async def test_state_files_of_every_worker_are_restored_once(tmp_path):
+    state_file = tmp_path / "click_counts.json"
+    # 兩個 worker 關閉時各自留下的檔案
+    (tmp_path / "click_counts.json.101").write_text(json.dumps({"a": 1}))
+    (tmp_path / "click_counts.json.102").write_text(json.dumps({"a": 2, "b": 1}))
+
+    first = ClickAggregator(RecordingSink(), interval=60, state_file=str(state_file))
+    second = ClickAggregator(RecordingSink(), interval=60, state_file=str(state_file))
+    first.start()
+    second.start()
+    assert first.pending + second.pending == 4
+    assert first._counts == {"a": 3, "b": 1}
+    await first.stop()
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_unrelated_and_corrupt_state_files_do_not_block_start(tmp_path):
+    state_file = tmp_path / "click_counts.json"
+    (tmp_path / "click_counts.json.bak").write_text("not json")
+    (tmp_path / "click_counts.json.loading.7").write_text(json.dumps({"a": 5}))
+    (tmp_path / "click_counts.json.101").write_text("{truncated")
+    (tmp_path / "click_counts.json.102").write_text(json.dumps({"b": 1}))
+
+    aggregator = ClickAggregator(
+        RecordingSink(), interval=60, state_file=str(state_file)
+    )
+    aggregator.start()
+    assert aggregator._counts == {"b": 1}
+    # 無法讀取的檔案移到一旁，下次啟動不會再讀
+    assert sorted(os.listdir(tmp_path)) == [
+        "click_counts.json.101.corrupt",
+        "click_counts.json.bak",
+        "click_counts.json.loading.7",
+    ]
+    await aggregator.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_during_flush_keeps_counts():
+    release = asyncio.Event()
+    delivered = []
+
+    async def slow_sink(counts):
+        await release.wait()
+        delivered.append(counts)
+
+    aggregator = ClickAggregator(slow_sink, interval=0.01)
+    aggregator.start()
+    for _ in range(7):
+        aggregator.record("a")
+    await asyncio.sleep(0.03)  # 週期 flush 進行中
+    stopping = asyncio.create_task(aggregator.stop())
+    await asyncio.sleep(0.01)
+    release.set()
+    await stopping
+    assert delivered == [{"a": 7}]
+    assert aggregator.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_flush_restores_counts():
+    async def hanging_sink(counts):
+        await asyncio.Event().wait()
+
+    aggregator = ClickAggregator(hanging_sink, interval=60)
+    aggregator.record("a")
+    flush = asyncio.create_task(aggregator.flush())
+    await asyncio.sleep(0)
+    flush.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flush
+    assert aggregator.pending == 1
@@ -0,0 +1,95 @@
+# redirect_service/tests/test_edge_cache.py
+import os
+from unittest.mock import patch
+
+import pytest
+from cache import decode_link_data, encode_link_data
+from edge_cache import (
+    NO_STORE,
+    EdgePurger,
+    RedirectCachePolicy,
+    create_edge_purger,
+)
+
+PUBLIC_LINK = {
+    "original_url": "http://public.com",
+    "is_active": True,
+    "password": None,
+    "expires_at": None,
+    "redirect_type": 301,
+}
+
+
+def test_only_public_non_expiring_links_are_cacheable():
+    policy = RedirectCachePolicy(edge_max_age=3600, browser_max_age=60)
+    assert policy.headers("public", PUBLIC_LINK) == {
+        "Cache-Control": "public, max-age=60, s-maxage=3600",
+        "Surrogate-Key": "link-public",
+    }
+    for change in (
+        {"password": "$2b$12$hash"},
+        {"expires_at": 1900000000.0},
+        {"is_active": False},
+    ):
+        link_data = dict(PUBLIC_LINK, **change)
+        assert policy.headers("other", link_data) == {"Cache-Control": NO_STORE}
+
+
+def test_policy_disabled_by_default():
+    assert RedirectCachePolicy().headers("public", PUBLIC_LINK) == {
+        "Cache-Control": NO_STORE
+    }
+
+
+@pytest.mark.parametrize("redirect_type", [301, 302, 307, 308])
+def test_redirect_type_survives_cache_encoding(redirect_type):
+    link_data = dict(PUBLIC_LINK, redirect_type=redirect_type)
+    assert decode_link_data(encode_link_data(link_data)) == link_data
+
+
+class FakeResponse:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self):
+        return b""
+
+
+@pytest.mark.asyncio
+async def test_purger_sends_surrogate_key_and_counts_failures():
+    requests = []
+
+    def opener(request, timeout):
+        requests.append(request)
+        if len(requests) > 1:
+            raise OSError("connection refused")
+        return FakeResponse()
+
+    purger = EdgePurger(
+        "https://cdn.example/purge/{key}",
+        headers={"Fastly-Key": "token"},
+        opener=opener,
+    )
+    assert await purger.purge("abc") is True
+    assert await purger.purge("abc") is False
+    assert requests[0].full_url == "https://cdn.example/purge/link-abc"
+    assert requests[0].get_method() == "POST"
+    assert requests[0].get_header("Fastly-key") == "token"
+    assert (purger.purged, purger.failed) == (1, 1)
+
+
+def test_create_edge_purger_from_env():
+    with patch.dict(os.environ, {"EDGE_PURGE_URL": ""}):
+        assert create_edge_purger() is None
+    env = {
+        "EDGE_PURGE_URL": "https://cdn.example/purge/{slug}",
+        "EDGE_PURGE_METHOD": "PURGE",
+        "EDGE_PURGE_HEADERS": "Authorization: Bearer x; X-Env: prod",
+    }
+    with patch.dict(os.environ, env):
+        purger = create_edge_purger()
+    assert purger.method == "PURGE"
+    assert purger.headers == {"Authorization": "Bearer x", "X-Env": "prod"}
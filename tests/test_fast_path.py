@@ -0,0 +1,73 @@
+# redirect_service/tests/test_fast_path.py
+import pytest
+from fast_path import FastRedirectResponse, RedirectFastPath, error_response
+from fastapi import FastAPI, HTTPException
+from fastapi.exception_handlers import http_exception_handler
+from httpx import ASGITransport, AsyncClient
+from starlette.responses import RedirectResponse
+
+
+@pytest.mark.parametrize(
+    "url", ["http://example.com/a b?q=1&x=ü", "https://example.com/#frag"]
+)
+def test_fast_redirect_response_matches_starlette(url):
+    headers = {"Cache-Control": "private, no-store"}
+    fast = FastRedirectResponse(url, 301, headers)
+    reference = RedirectResponse(url, 301, headers)
+    assert fast.status_code == reference.status_code
+    assert sorted(fast.raw_headers) == sorted(reference.raw_headers)
+    assert fast.body == reference.body
+    # set_access_cookie 仍可加上 cookie
+    fast.set_cookie("name", "value")
+    assert fast.headers["set-cookie"].startswith("name=value")
+
+
+@pytest.mark.asyncio
+async def test_error_response_matches_fastapi_handler():
+    e = HTTPException(
+        status_code=429, detail="Too many requésts.", headers={"Retry-After": "3"}
+    )
+    fast = error_response(e)
+    reference = await http_exception_handler(None, e)
+    assert fast.status_code == reference.status_code
+    assert sorted(fast.raw_headers) == sorted(reference.raw_headers)
+    assert fast.body == reference.body
+
+
+@pytest.mark.asyncio
+async def test_fast_path_handles_only_single_segment_get_and_head():
+    app = FastAPI()
+    calls = []
+
+    @app.get("/r/{rest:path}")
+    async def routed(rest: str):
+        return {"routed": rest}
+
+    async def handler(slug, request, password):
+        calls.append((request.method, slug, password))
+        if slug == "missing":
+            raise HTTPException(status_code=404, detail="Short link not found.")
+        return FastRedirectResponse(f"http://target/{slug}", 302, {})
+
+    fast_app = RedirectFastPath(app, "/r/", handler)
+    async with AsyncClient(
+        transport=ASGITransport(app=fast_app), base_url="http://test"
+    ) as client:
+        response = await client.get("/r/abc", params={"password": "pw"})
+        head = await client.head("/r/abc")
+        missing = await client.get("/r/missing")
+        nested = await client.get("/r/a/b")
+        post = await client.post("/r/abc")
+
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://target/abc"
+    assert head.status_code == 302
+    assert missing.status_code == 404
+    assert missing.json() == {"detail": "Short link not found."}
+    assert nested.json() == {"routed": "a/b"}
+    assert post.status_code == 405
+    assert calls == [
+        ("GET", "abc", "pw"),
+        ("HEAD", "abc", None),
+        ("GET", "missing", None),
+    ]
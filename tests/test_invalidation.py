@@ -0,0 +1,169 @@
+# redirect_service/tests/test_invalidation.py
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from invalidation import (
+    LINK_CHANGES_EXCHANGE,
+    ChangeStreamInvalidationConsumer,
+    RabbitInvalidationConsumer,
+    link_changes_from_change_event,
+    link_changes_from_message,
+    pre_images_enabled,
+)
+
+
+def make_document(slug: str, url: str) -> dict:
+    return {
+        "slug": slug,
+        "original_url": url,
+        "is_active": True,
+        "password": None,
+        "expires_at": None,
+    }
+
+
+def test_link_changes_from_message_includes_old_slug():
+    assert link_changes_from_message(b'{"slug": "abc"}') == [("abc", None)]
+    assert link_changes_from_message(
+        json.dumps({"slug": "new", "old_slug": "old"}).encode()
+    ) == [("new", None), ("old", None)]
+
+
+def test_link_changes_from_change_event():
+    update = {
+        "operationType": "update",
+        "fullDocument": make_document("abc", "http://new.com"),
+    }
+    [(slug, link_data)] = link_changes_from_change_event(update)
+    assert slug == "abc"
+    assert link_data["original_url"] == "http://new.com"
+
+    rename = {
+        "operationType": "update",
+        "fullDocument": make_document("new", "http://a.com"),
+        "fullDocumentBeforeChange": make_document("old", "http://a.com"),
+    }
+    assert [slug for slug, _ in link_changes_from_change_event(rename)] == [
+        "new",
+        "old",
+    ]
+
+    delete = {
+        "operationType": "delete",
+        "fullDocumentBeforeChange": make_document("gone", "http://a.com"),
+    }
+    assert link_changes_from_change_event(delete) == [("gone", None)]
+
+
+class FakeChannel:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.bindings = []
+        self.acked = []
+
+    def exchange_declare(self, exchange, exchange_type, durable):
+        assert exchange_type == "fanout"
+
+    def queue_declare(self, queue, exclusive, auto_delete):
+        return SimpleNamespace(method=SimpleNamespace(queue="amq.gen-worker"))
+
+    def queue_bind(self, exchange, queue):
+        self.bindings.append((exchange, queue))
+
+    def consume(self, queue, inactivity_timeout):
+        for tag, body in enumerate(self.bodies, start=1):
+            yield SimpleNamespace(delivery_tag=tag), None, body
+        while True:
+            yield None, None, None
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def cancel(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, channel):
+        self._channel = channel
+        self.is_open = True
+
+    def channel(self):
+        return self._channel
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.mark.asyncio
+async def test_rabbit_consumer_applies_and_acks_messages():
+    applied = []
+
+    async def handler(slug, link_data):
+        if slug == "broken":
+            raise RuntimeError("boom")
+        applied.append((slug, link_data))
+
+    channel = FakeChannel(
+        [b'{"slug": "a", "old_slug": "b"}', b"not json", b'{"slug": "broken"}']
+    )
+    consumer = RabbitInvalidationConsumer(handler, lambda: FakeConnection(channel))
+    consumer.start()
+    for _ in range(100):
+        if len(channel.acked) == 3:
+            break
+        await asyncio.sleep(0.01)
+    await consumer.stop()
+
+    assert channel.bindings == [(LINK_CHANGES_EXCHANGE, "amq.gen-worker")]
+    assert applied == [("a", None), ("b", None)]
+    # 無法處理的訊息也會 ack，避免在佇列中無限重送
+    assert channel.acked == [1, 2, 3]
+    assert consumer.received == 3
+    assert consumer.failed == 2
+
+
+@pytest.mark.asyncio
+async def test_change_events_without_pre_images_count_as_failed():
+    applied = []
+
+    async def handler(slug, link_data):
+        applied.append(slug)
+
+    consumer = ChangeStreamInvalidationConsumer(handler)
+    await consumer._apply({"operationType": "delete", "documentKey": {"_id": 1}})
+    await consumer._apply(
+        {
+            "operationType": "update",
+            "fullDocument": make_document("new", "http://a.com"),
+            "updateDescription": {"updatedFields": {"slug": "new"}},
+        }
+    )
+    await consumer._apply(
+        {
+            "operationType": "update",
+            "fullDocument": make_document("same", "http://b.com"),
+            "updateDescription": {"updatedFields": {"original_url": "http://b.com"}},
+        }
+    )
+    assert applied == ["new", "same"]
+    assert consumer.received == 3
+    assert consumer.failed == 2
+
+
+class FakeCollection:
+    def __init__(self, options):
+        self.name = "links"
+        self._options = options
+
+    async def options(self):
+        return self._options
+
+
+@pytest.mark.asyncio
+async def test_pre_images_enabled_reads_collection_options():
+    enabled = {"changeStreamPreAndPostImages": {"enabled": True}}
+    assert await pre_images_enabled(FakeCollection(enabled)) is True
+    assert await pre_images_enabled(FakeCollection({})) is False
@@ -0,0 +1,124 @@
+# redirect_service/tests/test_local_cache.py
+from local_cache import NOT_FOUND, LocalLinkCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_link_data(url: str) -> dict:
+    return {"original_url": url, "is_active": True, "password": None}
+
+
+def test_get_returns_none_on_miss():
+    cache = LocalLinkCache(max_size=10)
+    assert cache.get("missing") is None
+    assert cache.misses == 1
+
+
+def test_set_and_get_hit():
+    cache = LocalLinkCache(max_size=10)
+    cache.set("abc", make_link_data("http://abc.com"))
+    assert cache.get("abc")["original_url"] == "http://abc.com"
+    assert cache.hits == 1
+
+
+def test_negative_entry():
+    cache = LocalLinkCache(max_size=10)
+    cache.set_not_found("ghost")
+    assert cache.get("ghost") is NOT_FOUND
+    assert cache.negative_hits == 1
+    assert cache.hits == 0
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LocalLinkCache(max_size=10, ttl=10, negative_ttl=1, clock=clock)
+    cache.set("abc", make_link_data("http://abc.com"))
+    cache.set_not_found("ghost")
+
+    clock.now = 2
+    assert cache.get("ghost") is None
+    assert cache.get("abc") is not None
+
+    clock.now = 11
+    assert cache.get("abc") is None
+    assert cache.expirations == 2
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = LocalLinkCache(max_size=2)
+    cache.set("a", make_link_data("http://a.com"))
+    cache.set("b", make_link_data("http://b.com"))
+    cache.get("a")  # a 成為最近使用
+    cache.set("c", make_link_data("http://c.com"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.evictions == 1
+
+
+def test_zero_size_disables_cache():
+    cache = LocalLinkCache(max_size=0)
+    cache.set("abc", make_link_data("http://abc.com"))
+    assert cache.get("abc") is None
+    assert len(cache) == 0
+
+
+def test_invalidate_and_stats():
+    cache = LocalLinkCache(max_size=10)
+    cache.set("abc", make_link_data("http://abc.com"))
+    cache.invalidate("abc")
+    assert cache.get("abc") is None
+    assert cache.stats() == {
+        "size": 0,
+        "max_size": 10,
+        "hits": 0,
+        "negative_hits": 0,
+        "misses": 1,
+        "evictions": 0,
+        "expirations": 0,
+        "stale_hits": 0,
+    }
+
+
+def test_expired_entries_served_stale_within_stale_ttl():
+    clock = FakeClock()
+    cache = LocalLinkCache(max_size=10, ttl=10, stale_ttl=60, clock=clock)
+    cache.set("abc", make_link_data("http://abc.com"))
+    cache.set_not_found("ghost")
+
+    clock.now = 30
+    assert cache.get("abc") is None
+    assert cache.get_stale("abc")["original_url"] == "http://abc.com"
+    # negative entry 不提供 stale 版本，過期即刪除
+    assert cache.get_stale("ghost") is None
+    assert cache.get("ghost") is None
+
+    clock.now = 71
+    assert cache.get_stale("abc") is None
+    assert cache.get("abc") is None
+    assert len(cache) == 0
+    assert cache.stale_hits == 1
+
+
+def test_refresh_due_once_after_soft_ttl():
+    clock = FakeClock()
+    cache = LocalLinkCache(max_size=10, ttl=10, soft_ttl=8, clock=clock)
+    cache.set("abc", make_link_data("http://abc.com"))
+
+    clock.now = 5
+    assert cache.refresh_due("abc") is False
+    clock.now = 9
+    assert cache.refresh_due("abc") is True
+    assert cache.refresh_due("abc") is False
+
+    cache.set("abc", make_link_data("http://abc.com"))
+    clock.now = 18
+    assert cache.refresh_due("abc") is True
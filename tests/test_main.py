@@ -1,16 +1,53 @@
 # redirect_service/tests/test_main.py
+import asyncio
 import hashlib
 import os
-from unittest.mock import patch
+import re
+import time
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
 
 import pytest
 import pytest_asyncio  # 確保已安裝 uv add pytest-asyncio --group dev
-import redis  # 導入 redis 模組
-from cache import get_redis_db
-from database import close_mongo_connection, connect_to_mongo
+import redis.asyncio as redis  # 導入 redis 非同步模組
+from cache import (
+    cache_link,
+    cache_missing_link,
+    delete_cached_link,
+    extend_cached_links,
+    get_redis_db,
+    read_cached_link,
+    read_cached_links,
+)
+from clicks import increment_click_counts
+from database import (
+    close_mongo_connection,
+    connect_to_mongo,
+    fetch_link_data,
+    fetch_many_link_data,
+)
+from fast_path import RedirectFastPath
 from httpx import ASGITransport, AsyncClient
-from main import app
+from local_cache import NOT_FOUND
+from main import (
+    app,
+    apply_link_change,
+    link_cache,
+    link_popularity,
+    link_refreshes,
+    link_snapshot,
+    mongo_breaker,
+    rate_limiter,
+    redirect_cache_policy,
+    redis_breaker,
+    serve_redirect,
+    slug_index,
+)
 from models import Link
+from pymongo.errors import ServerSelectionTimeoutError
+from rate_limit import Rate
+from shared_snapshot import write_link_snapshot
+from warmup import warm_link_cache
 
 # Use a test database name
 TEST_MONGO_DB = "test_links_db"
@@ -69,8 +106,8 @@ async def mongo_test_client():
 
 
 # Fixture for Redis test client (function scope to ensure clean state per test)
-@pytest.fixture(scope="function")  # 這是同步 fixture
-def redis_test_client():
+@pytest_asyncio.fixture(scope="function")
+async def redis_test_client():
     # 直接建立 Redis 客戶端實例，確保 decode_responses=True
     REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
@@ -78,10 +115,10 @@ def redis_test_client():
         host=REDIS_HOST, port=REDIS_PORT, db=TEST_REDIS_DB, decode_responses=True
     )
 
-    client.flushdb()  # 在每個測試前清空測試資料庫
+    await client.flushdb()  # 在每個測試前清空測試資料庫
     yield client  # 提供 Redis 客戶端
-    client.flushdb()  # 在每個測試後清空測試資料庫
-    client.close()
+    await client.flushdb()  # 在每個測試後清空測試資料庫
+    await client.aclose()
 
 
 # Override the get_redis_db dependency (autouse to apply to all tests)
@@ -91,13 +128,34 @@ def redis_test_client():
 async def override_get_redis_db_fixture(redis_test_client):  # 依賴 redis_test_client
     # 這個非同步生成器將是實際的依賴覆寫
     async def _override_get_redis_db_callable():
-        yield redis_test_client  # 這裡 yield 的是實際的 Redis 客戶端實例
+        return redis_test_client  # 這裡回傳的是實際的 Redis 客戶端實例
 
     app.dependency_overrides[get_redis_db] = _override_get_redis_db_callable
     yield  # 執行測試
     app.dependency_overrides.clear()  # 測試結束後清除覆寫
 
 
+# Clear the in-process link cache so cached entries do not leak between tests
+@pytest.fixture(autouse=True)
+def clear_local_link_cache():
+    link_cache.clear()
+    yield
+    link_cache.clear()
+
+
+# Reset circuit breakers and wait for background refreshes between tests
+@pytest_asyncio.fixture(autouse=True)
+async def reset_dependency_state():
+    redis_breaker.reset()
+    mongo_breaker.reset()
+    rate_limiter.reset()
+    yield
+    await asyncio.gather(*link_refreshes.values(), return_exceptions=True)
+    redis_breaker.reset()
+    mongo_breaker.reset()
+    rate_limiter.reset()
+
+
 # Fixture for FastAPI test client
 @pytest_asyncio.fixture(scope="function")  # 使用 pytest_asyncio.fixture
 async def client():
@@ -117,7 +175,12 @@ def mock_publish_click_event():
 
 # Helper to create a link with hash
 async def create_test_link(
-    original_url: str, slug: str, is_active: bool = True, password: str = None
+    original_url: str,
+    slug: str,
+    is_active: bool = True,
+    password: str = None,
+    expires_at: datetime = None,
+    redirect_type: int = 302,
 ):
     original_url_hash = hashlib.sha256(original_url.encode()).hexdigest()
     link = Link(
@@ -126,6 +189,8 @@ async def create_test_link(
         slug=slug,
         is_active=is_active,
         password=password,
+        expires_at=expires_at,
+        redirect_type=redirect_type,
     )
     await link.insert()
     return link
@@ -151,7 +216,7 @@ async def test_redirect_link_not_found(
     response = await client.get("/r/nonexistent")
     assert response.status_code == 404
     assert response.json()["detail"] == "Short link not found."
-    assert redis_test_client.get("link_data:nonexistent") == "NULL"
+    assert await read_cached_link(redis_test_client, "nonexistent") is NOT_FOUND
 
 
 @pytest.mark.asyncio
@@ -164,24 +229,24 @@ async def test_redirect_link_inactive(
     response = await client.get("/r/inactive")
     assert response.status_code == 403
     assert response.json()["detail"] == "Short link is inactive."
-    cached_data = redis_test_client.hgetall("link_data:inactive")
-    assert cached_data.get("is_active") == "False"  # 修正為使用 .get()
+    cached_data = await read_cached_link(redis_test_client, "inactive")
+    assert cached_data["is_active"] is False
 
 
 @pytest.mark.asyncio
 async def test_redirect_link_success_db_hit(
     client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
 ):
-    redis_test_client.flushdb()
+    await redis_test_client.flushdb()
     await create_test_link(
         original_url="http://active.com", slug="active", is_active=True
     )
     response = await client.get("/r/active", follow_redirects=False)
     assert response.status_code == 302
     assert response.headers["location"] == "http://active.com"
-    cached_data = redis_test_client.hgetall("link_data:active")
-    assert cached_data.get("original_url") == "http://active.com"  # 修正為使用 .get()
-    assert cached_data.get("is_active") == "True"
+    cached_data = await read_cached_link(redis_test_client, "active")
+    assert cached_data["original_url"] == "http://active.com"
+    assert cached_data["is_active"] is True
     mock_publish_click_event.assert_called_once_with("active")
 
 
@@ -189,15 +254,16 @@ async def test_redirect_link_success_db_hit(
 async def test_redirect_link_success_cache_hit(
     client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
 ):
-    redis_test_client.hmset(
-        "link_data:cached",
+    await cache_link(
+        redis_test_client,
+        "cached",
         {
             "original_url": "http://cached.com",
-            "is_active": "True",  # 確保是字串 "True"
-            "password": "",
+            "is_active": True,
+            "password": None,
+            "expires_at": None,
         },
     )
-    redis_test_client.expire("link_data:cached", 3600 * 24 * 7)
     response = await client.get("/r/cached", follow_redirects=False)
     assert response.status_code == 302
     assert response.headers["location"] == "http://cached.com"
@@ -217,25 +283,26 @@ async def test_redirect_password_protected_link_db_hit(
     response = await client.get("/r/protected", follow_redirects=False)
     assert response.status_code == 401
     assert response.json()["detail"] == "Password required or incorrect password."
-    cached_data = redis_test_client.hgetall("link_data:protected")
-    assert cached_data.get("original_url") == "http://protected.com"
-    assert cached_data.get("is_active") == "True"
-    assert cached_data.get("password") == "hashed_password"
+    cached_data = await read_cached_link(redis_test_client, "protected")
+    assert cached_data["original_url"] == "http://protected.com"
+    assert cached_data["is_active"] is True
+    assert cached_data["password"] == "hashed_password"
 
 
 @pytest.mark.asyncio
 async def test_redirect_password_protected_link_cache_hit(
     client: AsyncClient, mongo_test_client, redis_test_client
 ):
-    redis_test_client.hmset(
-        "link_data:cached_protected",
+    await cache_link(
+        redis_test_client,
+        "cached_protected",
         {
             "original_url": "http://cached-protected.com",
-            "is_active": "True",  # 確保是字串 "True"
+            "is_active": True,
             "password": "another_hashed_password",
+            "expires_at": None,
         },
     )
-    redis_test_client.expire("link_data:cached_protected", 3600 * 24 * 7)
     response = await client.get("/r/cached_protected", follow_redirects=False)
     assert response.status_code == 401
     assert response.json()["detail"] == "Password required or incorrect password."
@@ -277,15 +344,16 @@ async def test_redirect_password_protected_link_with_correct_password_cache_hit(
     test_password = "another_correct_password"
     hashed_test_password = pwd_context.hash(test_password)
 
-    redis_test_client.hmset(
-        "link_data:cached_protected_correct",
+    await cache_link(
+        redis_test_client,
+        "cached_protected_correct",
         {
             "original_url": "http://cached-protected-correct.com",
-            "is_active": "True",
+            "is_active": True,
             "password": hashed_test_password,
+            "expires_at": None,
         },
     )
-    redis_test_client.expire("link_data:cached_protected_correct", 3600 * 24 * 7)
     response = await client.get(
         "/r/cached_protected_correct",
         params={"password": test_password},
@@ -294,3 +362,706 @@ async def test_redirect_password_protected_link_with_correct_password_cache_hit(
     assert response.status_code == 302
     assert response.headers["location"] == "http://cached-protected-correct.com"
     mock_publish_click_event.assert_called_once_with("cached_protected_correct")
+
+
+@pytest.mark.asyncio
+async def test_redirect_local_cache_hit_skips_redis(
+    client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
+):
+    await create_test_link(
+        original_url="http://local-cached.com", slug="local-cached", is_active=True
+    )
+    response = await client.get("/r/local-cached", follow_redirects=False)
+    assert response.status_code == 302
+
+    # 第二次請求應由本機快取處理，即使 Redis 已被清空
+    await redis_test_client.flushdb()
+    hits = link_cache.hits
+    response = await client.get("/r/local-cached", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://local-cached.com"
+    assert await redis_test_client.exists("link:v1:local-cached") == 0
+    assert link_cache.hits == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_redirect_local_cache_negative_entry(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    response = await client.get("/r/missing-local")
+    assert response.status_code == 404
+
+    await redis_test_client.flushdb()
+    negative_hits = link_cache.negative_hits
+    response = await client.get("/r/missing-local")
+    assert response.status_code == 404
+    assert await redis_test_client.exists("link:v1:missing-local") == 0
+    assert link_cache.negative_hits == negative_hits + 1
+
+
+@pytest.mark.asyncio
+async def test_redirect_password_protected_link_sets_access_cookie(
+    client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
+):
+    from main import pwd_context
+
+    test_password = "cookie_password"
+    await create_test_link(
+        original_url="http://protected-cookie.com",
+        slug="protected-cookie",
+        password=pwd_context.hash(test_password),
+        is_active=True,
+    )
+    response = await client.get(
+        "/r/protected-cookie",
+        params={"password": test_password},
+        follow_redirects=False,
+    )
+    assert response.status_code == 302
+    assert "link_access" in response.cookies
+
+    # 帶著 cookie 再次造訪時，不需要密碼也不會重新驗證
+    with patch("main.verify_password") as mock_verify:
+        response = await client.get("/r/protected-cookie", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://protected-cookie.com"
+    mock_verify.assert_not_called()
+    assert mock_publish_click_event.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_redirect_password_protected_link_rejects_foreign_cookie(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    from security import create_access_token
+
+    await create_test_link(
+        original_url="http://protected-foreign.com",
+        slug="protected-foreign",
+        password="hashed_password",
+        is_active=True,
+    )
+    token = create_access_token("some-other-slug", "hashed_password")
+    client.cookies.set("link_access", token)
+    response = await client.get("/r/protected-foreign", follow_redirects=False)
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cache_misses_query_mongo_once(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link(
+        original_url="http://stampede.com", slug="stampede", is_active=True
+    )
+    with patch("main.fetch_link_data", wraps=fetch_link_data) as mock_fetch:
+        responses = await asyncio.gather(
+            *(client.get("/r/stampede", follow_redirects=False) for _ in range(10))
+        )
+    assert all(response.status_code == 302 for response in responses)
+    assert mock_fetch.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_redirect_malformed_slug_rejected_without_lookup(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    with (
+        patch.object(slug_index, "_pattern", re.compile(r"[A-Za-z0-9_-]{1,128}")),
+        patch("main.get_link_data") as mock_get_link_data,
+    ):
+        response = await client.get("/r/bad%20slug!")
+    assert response.status_code == 404
+    mock_get_link_data.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_redirect_unknown_slug_rejected_by_slug_index(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link(
+        original_url="http://indexed.com", slug="indexed", is_active=True
+    )
+    await slug_index.build()
+    try:
+        response = await client.get("/r/indexed", follow_redirects=False)
+        assert response.status_code == 302
+
+        response = await client.get("/r/not-indexed")
+        assert response.status_code == 404
+        # Bloom filter 判定不存在時，不會寫入 NULL marker
+        assert await redis_test_client.exists("link:v1:not-indexed") == 0
+        assert slug_index.stats()["rejected_absent"] >= 1
+    finally:
+        slug_index.clear()
+
+
+@pytest.mark.asyncio
+async def test_warm_link_cache_loads_most_clicked_links(
+    mongo_test_client, redis_test_client
+):
+    for slug, clicks in (("cold", 1), ("hot", 100), ("warm", 50)):
+        link = await create_test_link(original_url=f"http://{slug}.com", slug=slug)
+        link.click_count = clicks
+        await link.save()
+
+    loaded = await warm_link_cache(redis_test_client, link_cache, limit=2)
+
+    assert loaded == 2
+    hot = await read_cached_link(redis_test_client, "hot")
+    assert hot["original_url"] == "http://hot.com"
+    assert await redis_test_client.exists("link:v1:warm") == 1
+    assert await redis_test_client.exists("link:v1:cold") == 0
+    assert link_cache.get("hot")["original_url"] == "http://hot.com"
+
+
+@pytest.mark.asyncio
+async def test_redirect_expired_link_db_hit(
+    client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
+):
+    await create_test_link(
+        original_url="http://expired.com",
+        slug="expired",
+        expires_at=datetime.utcnow() - timedelta(hours=1),
+    )
+    response = await client.get("/r/expired", follow_redirects=False)
+    assert response.status_code == 410
+    assert response.json()["detail"] == "Short link has expired."
+    # 已過期的連結只短暫快取
+    assert 0 < await redis_test_client.ttl("link:v1:expired") <= 60
+    mock_publish_click_event.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_redirect_expired_link_cache_hit(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await cache_link(
+        redis_test_client,
+        "cached_expired",
+        {
+            "original_url": "http://cached-expired.com",
+            "is_active": True,
+            "password": None,
+            "expires_at": time.time() - 1,
+        },
+    )
+    response = await client.get("/r/cached_expired", follow_redirects=False)
+    assert response.status_code == 410
+
+
+@pytest.mark.asyncio
+async def test_redirect_expiring_link_cache_ttl_capped(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link(
+        original_url="http://expiring.com",
+        slug="expiring",
+        expires_at=datetime.utcnow() + timedelta(hours=1),
+    )
+    response = await client.get("/r/expiring", follow_redirects=False)
+    assert response.status_code == 302
+    assert 3500 < await redis_test_client.ttl("link:v1:expiring") <= 3600
+
+
+@pytest.mark.asyncio
+async def test_increment_click_counts_bulk_updates_links(mongo_test_client):
+    await create_test_link(original_url="http://one.com", slug="one")
+    await create_test_link(original_url="http://two.com", slug="two")
+
+    await increment_click_counts({"one": 3, "two": 1, "missing": 5})
+
+    assert (await Link.find_one(Link.slug == "one")).click_count == 3
+    assert (await Link.find_one(Link.slug == "two")).click_count == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_redirect_stages(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link(original_url="http://metrics.com", slug="metrics")
+    await client.get("/r/metrics", follow_redirects=False)
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    for stage in ("redis", "mongo", "publish", "total"):
+        assert f'redirect_stage_duration_seconds_count{{stage="{stage}"}}' in body
+    assert 'link_cache_lookups_total{layer="redis",result="miss"}' in body
+    assert 'redirect_responses_total{status="302"}' in body
+    assert "click_event_queue_depth" in body
+
+
+@pytest.mark.asyncio
+async def test_bulk_resolve_reports_statuses_and_backfills_cache(
+    client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
+):
+    await create_test_link(original_url="http://bulk-active.com", slug="bulk-active")
+    await create_test_link(
+        original_url="http://bulk-inactive.com", slug="bulk-inactive", is_active=False
+    )
+    await create_test_link(
+        original_url="http://bulk-protected.com",
+        slug="bulk-protected",
+        password="hashed",
+    )
+    await cache_link(
+        redis_test_client,
+        "bulk-cached",
+        {
+            "original_url": "http://bulk-cached.com",
+            "is_active": True,
+            "password": None,
+            "expires_at": None,
+        },
+    )
+    await cache_missing_link(redis_test_client, "bulk-null")
+
+    slugs = [
+        "bulk-active",
+        "bulk-inactive",
+        "bulk-protected",
+        "bulk-cached",
+        "bulk-null",
+        "bulk-missing",
+        "bulk-active",
+    ]
+    with patch("main.fetch_many_link_data", wraps=fetch_many_link_data) as mock_fetch:
+        response = await client.post("/resolve", json={"slugs": slugs})
+
+    assert response.status_code == 200
+    results = {item["slug"]: item for item in response.json()["results"]}
+    assert len(response.json()["results"]) == 6
+    assert results["bulk-active"] == {
+        "slug": "bulk-active",
+        "status": "active",
+        "original_url": "http://bulk-active.com",
+    }
+    assert results["bulk-inactive"]["status"] == "inactive"
+    assert results["bulk-protected"]["status"] == "protected"
+    assert results["bulk-protected"]["original_url"] is None
+    assert results["bulk-cached"]["original_url"] == "http://bulk-cached.com"
+    assert results["bulk-null"]["status"] == "missing"
+    assert results["bulk-missing"]["status"] == "missing"
+
+    # Redis 命中的 slug 不會查詢 MongoDB，其餘只查詢一次
+    mock_fetch.assert_called_once()
+    assert set(mock_fetch.call_args.args[0]) == {
+        "bulk-active",
+        "bulk-inactive",
+        "bulk-protected",
+        "bulk-missing",
+    }
+    active = await read_cached_link(redis_test_client, "bulk-active")
+    assert active["original_url"] == "http://bulk-active.com"
+    assert await read_cached_link(redis_test_client, "bulk-missing") is NOT_FOUND
+    mock_publish_click_event.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_bulk_resolve_rejects_oversized_batches(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    with patch.dict(os.environ, {"BULK_RESOLVE_MAX_SLUGS": "2"}):
+        response = await client.post("/resolve", json={"slugs": ["a", "b", "c"]})
+    assert response.status_code == 413
+
+    response = await client.post("/resolve", json={"slugs": []})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_redirect_migrates_legacy_cache_entries(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    # 舊格式：Hash 加上字串 "NULL" marker，沒有 MongoDB 資料也應該能直接命中
+    await redis_test_client.hset(
+        "link_data:legacy",
+        mapping={
+            "original_url": "http://legacy.com/a|b",
+            "is_active": "True",
+            "password": "",
+            "expires_at": "",
+        },
+    )
+    await redis_test_client.expire("link_data:legacy", 600)
+    await redis_test_client.set("link_data:legacy-null", "NULL", ex=60)
+
+    response = await client.get("/r/legacy", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://legacy.com/a%7Cb"
+    response = await client.get("/r/legacy-null")
+    assert response.status_code == 404
+
+    # 新格式寫在新的 key；舊 key 原封不動，仍在執行舊版的 worker 照常讀取
+    assert await redis_test_client.type("link_data:legacy") == "hash"
+    assert 0 < await redis_test_client.ttl("link:v1:legacy") <= 600
+    assert (
+        await redis_test_client.get("link:v1:legacy") == "1|1|||http://legacy.com/a|b"
+    )
+
+    await delete_cached_link(redis_test_client, "legacy")
+    assert await redis_test_client.exists("link:v1:legacy", "link_data:legacy") == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_read_falls_back_to_legacy_keys(redis_test_client):
+    await redis_test_client.set("link_data:old-null", "NULL", ex=60)
+    await cache_link(
+        redis_test_client,
+        "new",
+        {
+            "original_url": "http://new.com",
+            "is_active": True,
+            "password": None,
+            "expires_at": None,
+        },
+    )
+    cached = await read_cached_links(redis_test_client, ["new", "old-null", "none"])
+    assert cached["new"]["original_url"] == "http://new.com"
+    assert cached["old-null"] is NOT_FOUND
+    assert "none" not in cached
+    assert await redis_test_client.get("link:v1:old-null") == "NULL"
+
+
+@pytest.mark.asyncio
+async def test_redirect_falls_back_to_mongo_when_redis_fails(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link(original_url="http://no-redis.com", slug="no-redis")
+    with patch(
+        "main.read_cached_link", side_effect=redis.ConnectionError("redis down")
+    ):
+        response = await client.get("/r/no-redis", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://no-redis.com"
+    assert redis_breaker.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_redirect_serves_stale_link_while_stores_fail(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link(original_url="http://stale.com", slug="stale")
+    with patch.object(link_cache, "ttl", 0.01):
+        response = await client.get("/r/stale", follow_redirects=False)
+    assert response.status_code == 302
+    await asyncio.sleep(0.02)
+
+    with (
+        patch("main.read_cached_link", side_effect=redis.ConnectionError("down")),
+        patch(
+            "main.fetch_link_data",
+            side_effect=ServerSelectionTimeoutError("mongo down"),
+        ),
+    ):
+        response = await client.get("/r/stale", follow_redirects=False)
+        assert response.status_code == 302
+        assert response.headers["location"] == "http://stale.com"
+        assert link_cache.stats()["stale_hits"] == 1
+
+        # 沒有舊資料可用時快速回應 503
+        response = await client.get("/r/never-seen")
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+
+
+@pytest.mark.asyncio
+async def test_redirect_served_from_shared_snapshot(
+    client: AsyncClient, mongo_test_client, redis_test_client, tmp_path
+):
+    path = str(tmp_path / "links.snapshot")
+    write_link_snapshot(
+        path,
+        [
+            (
+                "shared",
+                {
+                    "original_url": "http://shared.com",
+                    "is_active": True,
+                    "password": None,
+                    "expires_at": None,
+                },
+            )
+        ],
+    )
+    with patch.object(link_snapshot, "path", path):
+        link_snapshot.reload()
+        try:
+            response = await client.get("/r/shared", follow_redirects=False)
+        finally:
+            await link_snapshot.stop()
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://shared.com"
+    # 快照命中不經過 Redis，也不複製到本機快取
+    assert await redis_test_client.exists("link:v1:shared") == 0
+    assert link_cache.get("shared") is None
+
+
+@pytest.mark.asyncio
+async def test_apply_link_change_refreshes_and_deletes_cached_links(
+    redis_test_client,
+):
+    old_data = {
+        "original_url": "http://old.com",
+        "is_active": True,
+        "password": None,
+        "expires_at": None,
+    }
+    new_data = dict(old_data, original_url="http://new.com")
+    for slug in ("edited", "deleted"):
+        await cache_link(redis_test_client, slug, old_data)
+        link_cache.set(slug, old_data)
+
+    with patch("main.LINK_INVALIDATION_REPEAT_DELAY", 0):
+        await apply_link_change(redis_test_client, "edited", new_data)
+        await apply_link_change(redis_test_client, "deleted", None)
+
+    assert link_cache.get("edited") is None
+    assert link_cache.get("deleted") is None
+    cached = await read_cached_link(redis_test_client, "edited")
+    assert cached["original_url"] == "http://new.com"
+    assert await redis_test_client.exists("link:v1:deleted") == 0
+
+
+@pytest.mark.asyncio
+async def test_apply_link_change_adds_slug_without_link_data(redis_test_client):
+    # rabbitmq 模式只帶 slug：新建或改名的連結也要立即進入索引
+    with (
+        patch("main.LINK_INVALIDATION_REPEAT_DELAY", 0),
+        patch.object(slug_index, "add") as mock_add,
+    ):
+        await apply_link_change(redis_test_client, "renamed", None)
+    mock_add.assert_called_once_with("renamed")
+
+
+@pytest.mark.asyncio
+async def test_password_attempts_rate_limited_before_bcrypt(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    from main import pwd_context
+
+    await cache_link(
+        redis_test_client,
+        "guarded",
+        {
+            "original_url": "http://guarded.com",
+            "is_active": True,
+            "password": pwd_context.hash("secret"),
+            "expires_at": None,
+        },
+    )
+    rules = dict(rate_limiter.rules, password_ip=Rate(2, 60))
+    with (
+        patch.object(rate_limiter, "rules", rules),
+        patch("main.verify_password") as mock_verify,
+    ):
+        mock_verify.return_value = False
+        statuses = [
+            (await client.get("/r/guarded", params={"password": "guess"})).status_code
+            for _ in range(3)
+        ]
+        response = await client.get("/r/guarded", params={"password": "guess"})
+    assert statuses == [401, 401, 429]
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # 超過額度的嘗試不會執行 bcrypt
+    assert mock_verify.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_falls_back_to_local_buckets_without_redis(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await cache_missing_link(redis_test_client, "scanned")
+    rules = dict(rate_limiter.rules, redirect_ip=Rate(2, 60))
+    with (
+        patch.object(rate_limiter, "rules", rules),
+        patch.object(redis_test_client, "eval", side_effect=ConnectionError("down")),
+    ):
+        statuses = [(await client.get("/r/scanned")).status_code for _ in range(3)]
+    assert statuses == [404, 404, 429]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_checks_local_buckets_before_redis(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await cache_missing_link(redis_test_client, "hammered")
+    rules = dict(rate_limiter.rules, redirect_ip=Rate(2, 60))
+    with (
+        patch.object(rate_limiter, "rules", rules),
+        patch.object(rate_limiter, "check", wraps=rate_limiter.check) as mock_check,
+    ):
+        statuses = [(await client.get("/r/hammered")).status_code for _ in range(3)]
+    assert statuses == [404, 404, 429]
+    # 本機 bucket 已拒絕的請求不會再查 Redis
+    assert mock_check.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_slug_index_rejects_before_rate_limit(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    rules = dict(rate_limiter.rules, redirect_ip=Rate(1, 60))
+    with (
+        patch.object(rate_limiter, "rules", rules),
+        patch.object(slug_index, "might_exist", return_value=False),
+        patch.object(rate_limiter, "check") as mock_check,
+    ):
+        statuses = [(await client.get("/r/scanner")).status_code for _ in range(3)]
+    assert statuses == [404, 404, 404]
+    mock_check.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_ttl_short_for_cold_links_extended_for_hot_ones(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link("http://warming.com", "warming")
+    link_popularity.pop_extensions()
+    with patch.multiple(link_popularity, min_ttl=100, max_ttl=1000, half_life=3600):
+        response = await client.get("/r/warming", follow_redirects=False)
+        assert response.status_code == 302
+        ttl = await redis_test_client.ttl("link:v1:warming")
+        assert 0 < ttl <= 100
+
+        for _ in range(3):
+            link_cache.clear()
+            await client.get("/r/warming", follow_redirects=False)
+        extensions = link_popularity.pop_extensions()
+        link_popularity.forget("warming")
+    assert extensions == {"warming": 200}
+    await extend_cached_links(redis_test_client, extensions)
+    assert await redis_test_client.ttl("link:v1:warming") > 100
+
+
+@pytest.mark.asyncio
+async def test_redirect_public_link_cacheable_at_edge(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link("http://moved.com", "moved", redirect_type=301)
+    await cache_link(
+        redis_test_client,
+        "expiring",
+        {
+            "original_url": "http://expiring.com",
+            "is_active": True,
+            "password": None,
+            "expires_at": time.time() + 3600,
+            "redirect_type": 308,
+        },
+    )
+    with patch.multiple(redirect_cache_policy, edge_max_age=3600, browser_max_age=60):
+        response = await client.get("/r/moved", follow_redirects=False)
+        expiring = await client.get("/r/expiring", follow_redirects=False)
+    assert response.status_code == 301
+    assert response.headers["cache-control"] == "public, max-age=60, s-maxage=3600"
+    assert response.headers["surrogate-key"] == "link-moved"
+    # 會過期的連結不可快取，即使是永久重導向
+    assert expiring.status_code == 308
+    assert expiring.headers["cache-control"] == "private, no-store"
+    assert "surrogate-key" not in expiring.headers
+
+
+@pytest.mark.asyncio
+async def test_redirect_uncacheable_by_default(
+    client: AsyncClient, mongo_test_client, redis_test_client
+):
+    await create_test_link("http://default.com", "default")
+    response = await client.get("/r/default", follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["cache-control"] == "private, no-store"
+
+
+@pytest.mark.asyncio
+async def test_head_redirect_has_no_side_effects(
+    client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
+):
+    from main import pwd_context
+
+    await create_test_link("http://peek.com", "peek")
+    await create_test_link(
+        "http://locked.com", "locked", password=pwd_context.hash("secret")
+    )
+    link_popularity.pop_extensions()
+    with (
+        patch.multiple(link_popularity, min_ttl=100, max_ttl=1000),
+        patch("main.verify_password") as mock_verify,
+    ):
+        response = await client.head("/r/peek", follow_redirects=False)
+        locked = await client.head(
+            "/r/locked", params={"password": "secret"}, follow_redirects=False
+        )
+        assert link_popularity.score("peek") == 0
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://peek.com"
+    mock_publish_click_event.assert_not_called()
+    assert locked.status_code == 401
+    mock_verify.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_refused_redirects_do_not_raise_popularity(
+    client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
+):
+    from main import pwd_context
+
+    await create_test_link(
+        "http://locked.com", "guessed", password=pwd_context.hash("secret")
+    )
+    link_popularity.pop_extensions()
+    with (
+        patch.multiple(link_popularity, min_ttl=100, max_ttl=1000),
+        patch("main.verify_password", return_value=False),
+    ):
+        for _ in range(3):
+            response = await client.get("/r/guessed", params={"password": "guess"})
+            assert response.status_code == 401
+        assert link_popularity.score("guessed") == 0
+    mock_publish_click_event.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_apply_link_change_purges_edge_once_across_workers(
+    redis_test_client,
+):
+    purger = AsyncMock()
+    with (
+        patch("main.edge_purger", purger),
+        patch("main.LINK_INVALIDATION_REPEAT_DELAY", 0),
+    ):
+        # 兩個 worker 收到同一個事件
+        await apply_link_change(redis_test_client, "changed", None)
+        await apply_link_change(redis_test_client, "changed", None)
+    purger.purge.assert_awaited_once_with("changed")
+
+
+@pytest.mark.asyncio
+async def test_redirect_fast_path_skips_cors_middleware(
+    client: AsyncClient, mongo_test_client, redis_test_client, mock_publish_click_event
+):
+    await create_test_link("http://fast.com", "fast")
+    fast_app = RedirectFastPath(
+        app,
+        "/r/",
+        lambda slug, request, password: serve_redirect(
+            slug, request, redis_test_client, password
+        ),
+    )
+    origin = {"Origin": "http://elsewhere.com"}
+    async with AsyncClient(
+        transport=ASGITransport(app=fast_app), base_url="http://test"
+    ) as fast_client:
+        response = await fast_client.get("/r/fast", headers=origin)
+        missing = await fast_client.get("/r/absent", headers=origin)
+    routed = await client.get("/r/fast", headers=origin)
+
+    assert response.status_code == 302
+    assert response.headers["location"] == "http://fast.com"
+    assert "access-control-allow-origin" not in response.headers
+    assert missing.status_code == 404
+    assert missing.json() == {"detail": "Short link not found."}
+    assert routed.headers["access-control-allow-origin"] == "*"
+    assert mock_publish_click_event.call_count == 2
@@ -0,0 +1,186 @@
+# redirect_service/tests/test_messaging.py
+import asyncio
+import json
+
+import pika
+import pytest
+from messaging import CLICK_QUEUE, ClickEventPublisher
+from spool import ClickSpool
+
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.transactional = False
+        self.uncommitted = []
+
+    def queue_declare(self, queue, durable):
+        self.broker.round_trips += 1
+        self.broker.declared.append((queue, durable))
+
+    def tx_select(self):
+        self.broker.round_trips += 1
+        self.transactional = True
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        if self.broker.fail_next:
+            self.broker.fail_next -= 1
+            self.is_open = False
+            # 連線中斷時 broker 丟棄尚未 commit 的訊息
+            self.uncommitted = []
+            raise pika.exceptions.ConnectionClosed(320, "connection forced")
+        self.uncommitted.append((routing_key, json.loads(body)))
+
+    def tx_commit(self):
+        self.broker.round_trips += 1
+        self.broker.commits += 1
+        self.broker.messages.extend(self.uncommitted)
+        self.uncommitted = []
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self):
+        channel = FakeChannel(self.broker)
+        self.broker.channels.append(channel)
+        return channel
+
+    def process_data_events(self, time_limit=None):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeBroker:
+    """In-memory stand-in for RabbitMQ."""
+
+    def __init__(self):
+        self.messages = []
+        self.declared = []
+        self.channels = []
+        self.connections = 0
+        self.fail_next = 0
+        self.round_trips = 0
+        self.commits = 0
+
+    def connect(self):
+        self.connections += 1
+        return FakeConnection(self)
+
+
+@pytest.mark.asyncio
+async def test_publisher_batches_over_one_transactional_channel():
+    broker = FakeBroker()
+    publisher = ClickEventPublisher(
+        connection_factory=broker.connect, flush_size=10, flush_interval=0.01
+    )
+    publisher.start()
+    for i in range(25):
+        assert publisher.publish(f"slug-{i}")
+    await asyncio.sleep(0.05)
+    await publisher.stop()
+
+    assert [m for _, m in broker.messages] == [{"slug": f"slug-{i}"} for i in range(25)]
+    assert all(queue == CLICK_QUEUE for queue, _ in broker.messages)
+    assert broker.connections == 1
+    assert broker.declared == [(CLICK_QUEUE, True)]
+    assert broker.channels[0].transactional is True
+    assert publisher.published == 25
+    # 每批一次 commit，是唯一需要等待 broker 的呼叫
+    assert broker.commits == 3
+    assert broker.round_trips == 2 + broker.commits
+
+
+@pytest.mark.asyncio
+async def test_publisher_drains_queue_on_stop():
+    broker = FakeBroker()
+    publisher = ClickEventPublisher(
+        connection_factory=broker.connect, flush_size=5, flush_interval=10
+    )
+    publisher.start()
+    for i in range(12):
+        publisher.publish(f"slug-{i}")
+    await publisher.stop()
+
+    assert len(broker.messages) == 12
+    assert publisher.queue_depth == 0
+    assert publisher.publish("late") is False
+
+
+@pytest.mark.asyncio
+async def test_publisher_drops_events_when_queue_full():
+    publisher = ClickEventPublisher(
+        connection_factory=FakeBroker().connect, queue_size=2
+    )
+    assert publisher.publish("a")
+    assert publisher.publish("b")
+    assert publisher.publish("c") is False
+    assert publisher.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_publisher_reconnects_after_connection_loss():
+    broker = FakeBroker()
+    broker.fail_next = 1
+    publisher = ClickEventPublisher(
+        connection_factory=broker.connect, flush_size=10, flush_interval=0.01
+    )
+    publisher.start()
+    publisher.publish("retry-me")
+    await publisher.stop()
+
+    assert broker.messages == [(CLICK_QUEUE, {"slug": "retry-me"})]
+    assert broker.connections == 2
+    assert publisher.failed == 0
+
+
+@pytest.mark.asyncio
+async def test_publisher_includes_count_for_aggregated_events():
+    broker = FakeBroker()
+    publisher = ClickEventPublisher(
+        connection_factory=broker.connect, flush_size=10, flush_interval=0.01
+    )
+    publisher.start()
+    publisher.publish("single")
+    publisher.publish("many", count=7)
+    await publisher.stop()
+
+    assert [m for _, m in broker.messages] == [
+        {"slug": "single"},
+        {"slug": "many", "count": 7},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_publisher_spools_while_broker_is_down_and_replays_in_order(tmp_path):
+    broker = FakeBroker()
+    broker.fail_next = 2  # 第一次發布與重新連線後的重試都失敗
+    publisher = ClickEventPublisher(
+        connection_factory=broker.connect,
+        flush_size=10,
+        flush_interval=0.01,
+        spool=ClickSpool(str(tmp_path)),
+        retry_interval=0.05,
+    )
+    publisher.start()
+    publisher.publish("first")
+    await asyncio.sleep(0.02)
+    publisher.publish("second")
+    await asyncio.sleep(0.02)
+    assert broker.messages == []
+    assert publisher.spool.appended == 2
+
+    await asyncio.sleep(0.1)
+    publisher.publish("third")
+    await asyncio.sleep(0.05)
+    await publisher.stop()
+
+    assert [m["slug"] for _, m in broker.messages] == ["first", "second", "third"]
+    assert publisher.failed == 0
+    assert not publisher.spool.pending
+    assert publisher.spool.replayed == 2
@@ -0,0 +1,53 @@
+# redirect_service/tests/test_metrics.py
+from metrics import MetricsRegistry
+
+
+def test_counter_renders_labelled_samples():
+    registry = MetricsRegistry()
+    counter = registry.counter("lookups_total", "Lookups.", labelnames=("result",))
+    counter.inc(result="hit")
+    counter.inc(2, result="miss")
+
+    output = registry.render()
+    assert "# TYPE lookups_total counter" in output
+    assert 'lookups_total{result="hit"} 1' in output
+    assert 'lookups_total{result="miss"} 2' in output
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "Stage.", labelnames=("stage",))
+    histogram.observe(0.0001, stage="redis")
+    histogram.observe(0.003, stage="redis")
+    histogram.observe(10, stage="redis")
+
+    output = registry.render()
+    assert 'stage_seconds_bucket{stage="redis",le="0.0005"} 1' in output
+    assert 'stage_seconds_bucket{stage="redis",le="0.005"} 2' in output
+    assert 'stage_seconds_bucket{stage="redis",le="+Inf"} 3' in output
+    assert 'stage_seconds_count{stage="redis"} 3' in output
+    assert histogram.count(stage="redis") == 3
+
+
+def test_histogram_timer():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("total_seconds", "Total.")
+    with histogram.time():
+        pass
+    assert histogram.count() == 1
+
+
+def test_callback_metric_reads_value_at_scrape_time():
+    registry = MetricsRegistry()
+    state = {"depth": 3}
+    registry.callback("queue_depth", "Depth.", lambda: state["depth"])
+    assert "queue_depth 3.0" in registry.render()
+    state["depth"] = 5
+    assert "queue_depth 5.0" in registry.render()
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter("odd_total", "Odd.", labelnames=("value",))
+    counter.inc(value='a"b\\c')
+    assert 'odd_total{value="a\\"b\\\\c"} 1' in registry.render()
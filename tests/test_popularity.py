@@ -0,0 +1,70 @@
+# redirect_service/tests/test_popularity.py
+import time
+
+from popularity import PopularityTracker
+
+
+def make_tracker(now, **kwargs) -> PopularityTracker:
+    defaults = {"min_ttl": 100, "max_ttl": 1000, "half_life": 60}
+    defaults.update(kwargs)
+    return PopularityTracker(clock=lambda: now[0], **defaults)
+
+
+def test_ttl_grows_with_popularity_and_decays():
+    now = [0.0]
+    tracker = make_tracker(now)
+    assert tracker.ttl("cold") == 100
+
+    for _ in range(8):
+        tracker.hit("hot")
+    assert tracker.ttl("hot") == 800
+    for _ in range(8):
+        tracker.hit("hot")
+    assert tracker.ttl("hot") == 1000
+
+    # 每個半衰期分數減半
+    now[0] += 240
+    assert tracker.score("hot") == 1.0
+    assert tracker.ttl("hot") == 100
+
+
+def test_hot_links_queue_one_extension_per_tier():
+    now = [0.0]
+    tracker = make_tracker(now)
+    tracker.hit("link")
+    assert tracker.ttl("link") == 100
+    tracker.hit("link")
+    assert tracker.pop_extensions() == {"link": 200}
+    tracker.hit("link")
+    assert tracker.pop_extensions() == {}
+    tracker.hit("link")
+    assert tracker.pop_extensions() == {"link": 400}
+
+
+def test_extensions_capped_at_link_expiry():
+    now = [0.0]
+    tracker = make_tracker(now)
+    expires_at = time.time() + 300
+    for _ in range(4):
+        tracker.hit("expiring", expires_at)
+    # 第四次命中應延長到 400 秒，但連結 300 秒後就過期
+    assert 0 < tracker.pop_extensions()["expiring"] <= 300
+    for _ in range(8):
+        tracker.hit("expiring", expires_at)
+    assert tracker.pop_extensions() == {}
+
+
+def test_fixed_ttl_when_min_equals_max():
+    tracker = make_tracker([0.0], min_ttl=1000)
+    tracker.hit("link")
+    assert not tracker.adaptive
+    assert len(tracker) == 0
+    assert tracker.ttl("link") == 1000
+
+
+def test_tracked_slugs_are_bounded():
+    tracker = make_tracker([0.0], max_entries=2)
+    for slug in ("a", "b", "c"):
+        tracker.hit(slug)
+    assert len(tracker) == 2
+    assert tracker.score("a") == 0.0
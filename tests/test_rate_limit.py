@@ -0,0 +1,43 @@
+# redirect_service/tests/test_rate_limit.py
+import pytest
+from rate_limit import Rate, RateLimiter, RateLimitExceeded, parse_rate
+
+
+def test_parse_rate():
+    assert parse_rate("600/60") == Rate(600, 60.0)
+    assert parse_rate("5") == Rate(5, 1.0)
+    assert parse_rate("") is None
+    assert parse_rate("0") is None
+
+
+def test_local_buckets_refill_over_time():
+    now = [1000.0]
+    limiter = RateLimiter({"ip": Rate(2, 10)}, clock=lambda: now[0])
+    limiter.check_local([("ip", "a")])
+    limiter.check_local([("ip", "a")])
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        limiter.check_local([("ip", "a")])
+    assert exc_info.value.retry_after == pytest.approx(5.0)
+    # 其他身分有各自的額度
+    limiter.check_local([("ip", "b")])
+
+    now[0] += 5
+    limiter.check_local([("ip", "a")])
+
+
+def test_local_check_consumes_nothing_when_any_rule_fails():
+    limiter = RateLimiter(
+        {"ip": Rate(5, 60), "slug": Rate(1, 60)}, clock=lambda: 1000.0
+    )
+    limiter.check_local([("ip", "a"), ("slug", "s")])
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        limiter.check_local([("ip", "a"), ("slug", "s")])
+    assert exc_info.value.rule == "slug"
+    assert limiter._buckets[("ip", "a")][0] == 4
+
+
+def test_local_buckets_are_bounded():
+    limiter = RateLimiter({"ip": Rate(1, 60)}, max_local_keys=2)
+    for identity in ("a", "b", "c"):
+        limiter.check_local([("ip", identity)])
+    assert list(limiter._buckets) == [("ip", "b"), ("ip", "c")]
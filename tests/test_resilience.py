@@ -0,0 +1,88 @@
+# redirect_service/tests/test_resilience.py
+import asyncio
+
+import pytest
+from resilience import CircuitBreaker, DependencyUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def failing():
+    raise ConnectionError("connection refused")
+
+
+async def succeeding():
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_consecutive_failures():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        "redis", (ConnectionError,), failure_threshold=3, reset_timeout=5, clock=clock
+    )
+    for _ in range(3):
+        with pytest.raises(DependencyUnavailable):
+            await breaker.call(failing)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # 斷路期間不會呼叫依賴
+    calls = 0
+
+    async def counted():
+        nonlocal calls
+        calls += 1
+
+    with pytest.raises(DependencyUnavailable, match="circuit open"):
+        await breaker.call(counted)
+    assert calls == 0
+    assert breaker.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_trial_closes_or_reopens_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        "mongo", (ConnectionError,), failure_threshold=1, reset_timeout=5, clock=clock
+    )
+    with pytest.raises(DependencyUnavailable):
+        await breaker.call(failing)
+
+    clock.now = 6
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(DependencyUnavailable):
+        await breaker.call(failing)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 12
+    assert await breaker.call(succeeding) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.opened == 1
+
+
+@pytest.mark.asyncio
+async def test_timeouts_count_as_failures():
+    breaker = CircuitBreaker("redis", timeout=0.01, failure_threshold=1)
+
+    with pytest.raises(DependencyUnavailable, match="timed out"):
+        await breaker.call(asyncio.sleep, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.asyncio
+async def test_unrelated_exceptions_propagate():
+    breaker = CircuitBreaker("redis", (ConnectionError,), failure_threshold=1)
+
+    async def buggy():
+        raise KeyError("original_url")
+
+    with pytest.raises(KeyError):
+        await breaker.call(buggy)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
@@ -0,0 +1,47 @@
+# redirect_service/tests/test_security.py
+import time
+
+import pytest
+from security import (
+    create_access_token,
+    pwd_context,
+    verify_access_token,
+    verify_password,
+)
+
+
+@pytest.mark.asyncio
+async def test_verify_password_runs_off_loop():
+    password_hash = pwd_context.hash("s3cret")
+    assert await verify_password("s3cret", password_hash) is True
+    assert await verify_password("wrong", password_hash) is False
+
+
+@pytest.mark.asyncio
+async def test_verify_password_with_unknown_hash_format():
+    assert await verify_password("s3cret", "not-a-bcrypt-hash") is False
+
+
+def test_access_token_roundtrip():
+    token = create_access_token("abc", "hash-1")
+    assert verify_access_token(token, "abc", "hash-1") is True
+
+
+def test_access_token_is_scoped_to_slug_and_password():
+    token = create_access_token("abc", "hash-1")
+    assert verify_access_token(token, "other", "hash-1") is False
+    # 密碼變更後舊 token 失效
+    assert verify_access_token(token, "abc", "hash-2") is False
+
+
+def test_access_token_expires():
+    token = create_access_token("abc", "hash-1", ttl=-1)
+    assert verify_access_token(token, "abc", "hash-1") is False
+
+
+def test_access_token_rejects_tampering():
+    expires, _, signature = create_access_token("abc", "hash-1").partition(".")
+    forged = f"{int(expires) + 3600}.{signature}"
+    assert verify_access_token(forged, "abc", "hash-1") is False
+    assert verify_access_token("garbage", "abc", "hash-1") is False
+    assert int(expires) > time.time()
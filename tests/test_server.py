@@ -0,0 +1,52 @@
+# redirect_service/tests/test_server.py
+import os
+from unittest.mock import patch
+
+import pytest
+from server import server_profile, uvicorn_options
+
+
+def test_default_profile_matches_plain_uvicorn():
+    options = uvicorn_options("default")
+    assert "loop" not in options and "http" not in options
+    assert "workers" not in options
+    assert options["port"] == 8002
+
+
+def test_performance_profile():
+    with patch.dict(
+        os.environ, {"WEB_CONCURRENCY": "3", "LINK_ACCESS_SECRET": "s3cret"}
+    ):
+        options = uvicorn_options("performance")
+    assert options["loop"] == "uvloop"
+    assert options["http"] == "httptools"
+    assert options["workers"] == 3
+    assert options["access_log"] is False
+    assert uvicorn_options("performance", workers=1)["workers"] == 1
+
+
+def test_several_workers_require_access_secret():
+    with patch.dict(os.environ, {"WEB_CONCURRENCY": "3"}):
+        os.environ.pop("LINK_ACCESS_SECRET", None)
+        with pytest.raises(ValueError, match="LINK_ACCESS_SECRET"):
+            uvicorn_options("performance")
+        with pytest.raises(ValueError, match="LINK_ACCESS_SECRET"):
+            uvicorn_options("default", workers=2)
+        # default profile 不傳 workers 時 uvicorn 仍會讀取 WEB_CONCURRENCY
+        with pytest.raises(ValueError, match="LINK_ACCESS_SECRET"):
+            uvicorn_options("default")
+        # 單一 worker 不受影響 (例如 bench_server)
+        assert uvicorn_options("performance", workers=1)["workers"] == 1
+
+
+def test_unknown_profile_rejected():
+    with patch.dict(os.environ, {"SERVER_PROFILE": "turbo"}):
+        with pytest.raises(ValueError):
+            server_profile()
+
+
+def test_client_address_from_trusted_proxies_only():
+    with patch.dict(os.environ, {"FORWARDED_ALLOW_IPS": "10.0.0.0/8"}):
+        options = uvicorn_options("performance")
+    assert options["proxy_headers"] is True
+    assert options["forwarded_allow_ips"] == "10.0.0.0/8"
@@ -0,0 +1,117 @@
+# redirect_service/tests/test_sharding.py
+import pytest
+import redis.asyncio as redis
+from benchmarks.standins import InMemoryRedis
+from cache import cache_link, link_cache_key, read_cached_link, read_cached_links
+from rate_limit import Rate, RateLimiter, RateLimitExceeded
+from sharding import HashRing, ShardedRedis, routing_key
+
+LINK_DATA = {
+    "original_url": "http://example.com",
+    "is_active": True,
+    "password": None,
+    "expires_at": None,
+}
+
+
+class UnreachableRedis(InMemoryRedis):
+    async def _round_trip(self):
+        raise redis.ConnectionError("Connection refused")
+
+
+def make_sharded(count: int = 3, **kwargs) -> ShardedRedis:
+    return ShardedRedis(
+        {f"node-{i}:6379": InMemoryRedis() for i in range(count)}, **kwargs
+    )
+
+
+def test_adding_a_node_moves_a_small_share_of_keys():
+    keys = [link_cache_key(f"slug-{i}") for i in range(10000)]
+    before = HashRing(["a", "b", "c", "d"])
+    after = HashRing(["a", "b", "c", "d", "e"])
+
+    moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+    # 理想值是 1/5；只有移到新節點的 key 會改變位置
+    assert 0.15 < len(moved) / len(keys) < 0.25
+    assert {after.node_for(key) for key in moved} == {"e"}
+    shares = [
+        sum(before.node_for(key) == node for key in keys) / len(keys)
+        for node in before.nodes
+    ]
+    assert max(shares) < 0.33
+
+
+def test_hash_tags_route_related_keys_together():
+    assert routing_key("rate:redirect_ip:{1.2.3.4}:7") == "1.2.3.4"
+    assert routing_key("link_data:abc") == "link_data:abc"
+    assert routing_key("odd{}key") == "odd{}key"
+
+
+@pytest.mark.asyncio
+async def test_commands_and_pipelines_are_spread_across_nodes():
+    sharded = make_sharded()
+    slugs = [f"slug-{i}" for i in range(60)]
+    pipeline = sharded.pipeline(transaction=False)
+    for slug in slugs:
+        await cache_link(pipeline, slug, LINK_DATA)
+    await pipeline.execute()
+
+    assert all(len(client._data) > 0 for client in sharded.clients.values())
+    assert sum(len(client._data) for client in sharded.clients.values()) == 60
+    cached = await read_cached_links(sharded, slugs)
+    assert set(cached) == set(slugs)
+    assert (await read_cached_link(sharded, "slug-7"))["original_url"] == (
+        "http://example.com"
+    )
+
+
+@pytest.mark.asyncio
+async def test_down_node_keys_are_misses_and_not_moved():
+    now = [0.0]
+    sharded = make_sharded(retry_interval=5, clock=lambda: now[0])
+    key = link_cache_key("moving")
+    owner = sharded.node_for(key)
+    healthy_owner = sharded.clients[owner]
+    await cache_link(sharded, "moving", LINK_DATA)
+    sharded.clients[owner] = UnreachableRedis()
+
+    # 故障節點的 key 視為未命中，寫入直接丟棄，不會搬到其他節點
+    assert (await read_cached_link(sharded, "moving")) is None
+    assert sharded.stats()[owner]["healthy"] is False
+    await cache_link(sharded, "moving", {**LINK_DATA, "original_url": "http://new"})
+    assert await read_cached_links(sharded, ["moving"]) == {}
+    others = [client for node, client in sharded.clients.items() if node != owner]
+    assert all(key not in client._data for client in others)
+    assert sharded.stats()[owner]["dropped_writes"] == 1
+
+    # 恢復後先刪除故障期間被改過的 key，舊值不會再被讀到
+    sharded.clients[owner] = healthy_owner
+    now[0] += 5
+    assert (await read_cached_link(sharded, "moving")) is None
+    assert key not in healthy_owner._data
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_counters_spread_by_identity():
+    sharded = make_sharded()
+    limiter = RateLimiter({"ip": Rate(5, 60)})
+    for i in range(30):
+        await limiter.check(sharded, [("ip", f"10.0.0.{i}")])
+    assert all(len(client._data) > 0 for client in sharded.clients.values())
+
+
+@pytest.mark.asyncio
+async def test_refused_request_gives_back_other_rules_counts():
+    sharded = make_sharded()
+    limiter = RateLimiter({"ip": Rate(5, 60), "slug": Rate(1, 60)})
+    await limiter.check(sharded, [("ip", "1.2.3.4"), ("slug", "abc")])
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        await limiter.check(sharded, [("ip", "1.2.3.4"), ("slug", "abc")])
+    assert exc_info.value.rule == "slug"
+    counts = [
+        value
+        for client in sharded.clients.values()
+        for key, value in client._data.items()
+        if key.startswith("rate:ip:")
+    ]
+    assert counts == ["1"]
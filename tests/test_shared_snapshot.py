@@ -0,0 +1,86 @@
+# redirect_service/tests/test_shared_snapshot.py
+import os
+
+import pytest
+from shared_snapshot import LinkSnapshot, write_link_snapshot
+
+
+def make_link_data(url: str, **overrides) -> dict:
+    link_data = {
+        "original_url": url,
+        "is_active": True,
+        "password": None,
+        "expires_at": None,
+    }
+    link_data.update(overrides)
+    return link_data
+
+
+def test_lookups_find_every_written_link(tmp_path):
+    path = str(tmp_path / "links.snapshot")
+    links = [(f"slug-{i}", make_link_data(f"http://{i}.com")) for i in range(500)]
+    links.append(("locked", make_link_data("http://locked.com", password="hash")))
+    assert write_link_snapshot(path, links) == 501
+
+    snapshot = LinkSnapshot(path)
+    assert snapshot.reload()
+    assert len(snapshot) == 501
+    for i in range(500):
+        assert snapshot.get(f"slug-{i}")["original_url"] == f"http://{i}.com"
+    assert snapshot.get("locked")["password"] == "hash"
+    assert snapshot.get("missing") is None
+    assert snapshot.hits == 501
+    assert snapshot.misses == 1
+
+
+def test_reload_picks_up_replaced_snapshot(tmp_path):
+    path = str(tmp_path / "links.snapshot")
+    write_link_snapshot(path, [("a", make_link_data("http://old.com"))])
+    snapshot = LinkSnapshot(path)
+    snapshot.reload()
+    assert snapshot.reload() is False
+
+    write_link_snapshot(path, [("a", make_link_data("http://new.com"))])
+    assert snapshot.reload() is True
+    assert snapshot.get("a")["original_url"] == "http://new.com"
+
+
+def test_invalidated_links_hidden_until_newer_snapshot(tmp_path):
+    path = str(tmp_path / "links.snapshot")
+    write_link_snapshot(path, [("a", make_link_data("http://old.com"))])
+    snapshot = LinkSnapshot(path)
+    snapshot.reload()
+    snapshot.invalidate("a")
+    assert snapshot.get("a") is None
+
+    # 變更前就開始讀取的快照仍可能含有舊資料
+    write_link_snapshot(path, [("a", make_link_data("http://old.com"))], built_at=0)
+    snapshot.reload()
+    assert snapshot.get("a") is None
+
+    write_link_snapshot(path, [("a", make_link_data("http://new.com"))])
+    snapshot.reload()
+    assert snapshot.get("a")["original_url"] == "http://new.com"
+
+
+def test_snapshot_in_unknown_format_is_ignored(tmp_path):
+    path = tmp_path / "links.snapshot"
+    path.write_bytes(b"not a snapshot at all, just some bytes")
+    snapshot = LinkSnapshot(str(path))
+    assert snapshot.reload() is False
+    assert not snapshot.ready
+    assert snapshot.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_only_one_worker_becomes_builder(tmp_path):
+    path = str(tmp_path / "links.snapshot")
+    first, second = LinkSnapshot(path), LinkSnapshot(path)
+
+    assert first._try_become_builder()
+    assert not second._try_become_builder()
+    await first.stop()
+    # 建置者結束後由其他 worker 接手
+    assert second._try_become_builder()
+    await second.stop()
+    assert os.path.exists(f"{path}.lock")
@@ -0,0 +1,89 @@
+# redirect_service/tests/test_simulate_cache.py
+import json
+
+from benchmarks.simulate_cache import (
+    PolicySimulation,
+    RedisModel,
+    main,
+    read_trace,
+    simulate,
+    slug_index_from_trace,
+    synthetic_trace,
+    write_trace,
+)
+from slug_index import SlugIndex, sized_bloom_filter
+
+
+def test_trace_round_trips_through_gzip(tmp_path):
+    path = str(tmp_path / "trace.log.gz")
+    requests = list(synthetic_trace("scanner", 1000, links=100, seed=1))
+    assert write_trace(path, requests) == 1000
+
+    replayed = list(read_trace(path))
+    assert [slug for _, slug, _ in replayed] == [slug for _, slug, _ in requests]
+    assert [exists for _, _, exists in replayed] == [e for _, _, e in requests]
+    assert not all(exists for _, _, exists in replayed)
+
+
+def test_longer_ttl_means_fewer_mongo_queries():
+    short, long = PolicySimulation(link_ttl=1), PolicySimulation(link_ttl=3600)
+    reports = simulate(
+        synthetic_trace("zipf", 20000, links=1000, rate=100), [short, long]
+    )
+    assert reports[1]["mongo_queries"] < reports[0]["mongo_queries"]
+    assert reports[1]["hit_rate"] > reports[0]["hit_rate"]
+
+
+def test_redis_memory_limit_evicts():
+    redis_model = RedisModel(max_bytes=1000, policy="lfu")
+    for i in range(50):
+        redis_model.set(f"link_data:{i}", True, ttl=60, now=0)
+    assert redis_model.memory_bytes <= 1000
+    assert redis_model.evictions > 0
+    redis_model.get("link_data:49", now=61)
+    assert len(redis_model) == 0
+
+
+def test_cli_compares_every_configuration(tmp_path):
+    output = tmp_path / "simulation.json"
+    exit_code = main(
+        [
+            "--synthetic",
+            "bursty",
+            "--requests",
+            "2000",
+            "--links",
+            "500",
+            "--link-ttl",
+            "60,3600",
+            "--policy",
+            "lru,lfu",
+            "--redis-memory",
+            "0,0.01",
+            "--slug-index",
+            "--output",
+            str(output),
+        ]
+    )
+    reports = json.loads(output.read_text())["simulations"]
+
+    assert exit_code == 0
+    assert len(reports) == 8
+    for report in reports:
+        assert report["requests"] == 2000
+        assert 0 <= report["hit_rate"] <= 1
+
+
+def test_slug_index_built_like_production(tmp_path):
+    path = str(tmp_path / "trace.log")
+    write_trace(path, synthetic_trace("scanner", 5000, links=2000, seed=1))
+    distinct = {slug for _, slug, exists in read_trace(path) if exists}
+
+    index = slug_index_from_trace(path, links=100000)
+    expected = sized_bloom_filter(len(distinct), SlugIndex().error_rate)
+    assert (index.capacity, index.num_bits) == (expected.capacity, expected.num_bits)
+    assert all(slug in index for slug in distinct)
+    assert index.false_positive_rate < 0.001
+
+    streamed = slug_index_from_trace(path, links=100000, expected=5000)
+    assert streamed.capacity == 10000
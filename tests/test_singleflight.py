@@ -0,0 +1,75 @@
+# redirect_service/tests/test_singleflight.py
+import asyncio
+
+import pytest
+from singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    executions = 0
+
+    async def lookup():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.01)
+        return {"original_url": "http://a.com"}
+
+    results = await asyncio.gather(*(flight.do("a", lookup) for _ in range(10)))
+
+    assert executions == 1
+    assert all(result == {"original_url": "http://a.com"} for result in results)
+    assert flight.calls == 1
+    assert flight.coalesced == 9
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_independently():
+    flight = SingleFlight()
+
+    async def lookup(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    results = await asyncio.gather(
+        flight.do("a", lambda: lookup("a")), flight.do("b", lambda: lookup("b"))
+    )
+    assert results == ["a", "b"]
+    assert flight.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared_and_not_cached():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("mongo down")
+
+    results = await asyncio.gather(
+        *(flight.do("a", failing) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def ok():
+        return "ok"
+
+    assert await flight.do("a", ok) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_lookup():
+    flight = SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    first = asyncio.create_task(flight.do("a", lookup))
+    second = asyncio.create_task(flight.do("a", lookup))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "done"
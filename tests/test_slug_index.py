@@ -0,0 +1,89 @@
+# redirect_service/tests/test_slug_index.py
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from slug_index import BloomFilter, SlugIndex
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    slugs = [f"slug-{i}" for i in range(1000)]
+    for slug in slugs:
+        bloom.add(slug)
+    assert all(slug in bloom for slug in slugs)
+
+
+def test_bloom_filter_false_positive_rate_near_target():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"slug-{i}")
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives / 10000 < 0.03
+    assert 0.005 < bloom.false_positive_rate < 0.02
+
+
+def test_bloom_filter_ignores_duplicate_adds_in_count():
+    bloom = BloomFilter(capacity=100, error_rate=0.01)
+    bloom.add("abc")
+    bloom.add("abc")
+    assert bloom.count == 1
+
+
+def test_slug_index_passes_through_until_built():
+    index = SlugIndex()
+    assert index.ready is False
+    assert index.might_exist("anything") is True
+
+
+def test_slug_index_rejects_malformed_slugs():
+    index = SlugIndex(pattern=r"[a-z0-9-]{1,16}")
+    assert index.might_exist("ok-slug") is True
+    assert index.might_exist("../etc/passwd") is False
+    assert index.might_exist("x" * 17) is False
+    assert index.stats()["rejected_malformed"] == 2
+
+
+def test_slug_index_accepts_any_slug_without_pattern():
+    index = SlugIndex()
+    assert index.is_valid_slug("Émoji.slug~1") is True
+
+
+def test_slug_index_rejects_absent_slugs_once_built():
+    index = SlugIndex()
+    index._filter = BloomFilter(capacity=100, error_rate=0.001)
+    index._synced_until = datetime.now(timezone.utc)
+    index.add("known")
+    assert index.might_exist("known") is True
+    assert index.might_exist("unknown") is False
+
+    stats = index.stats()
+    assert stats["ready"] is True
+    assert stats["slugs"] == 1
+    assert stats["rejected_absent"] == 1
+    assert stats["memory_bytes"] > 0
+
+
+def test_slug_index_fails_open_when_refreshes_stall():
+    index = SlugIndex(max_staleness=30)
+    index._filter = BloomFilter(capacity=100, error_rate=0.001)
+    index._synced_until = datetime.now(timezone.utc) - timedelta(seconds=60)
+    assert index.might_exist("created-after-sync") is True
+    assert index.stats()["stale_passes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_rebuilds_periodically():
+    index = SlugIndex(rebuild_interval=600)
+    index._filter = BloomFilter(capacity=100, error_rate=0.001)
+    index._built_at = datetime.now(timezone.utc)
+    assert index._rebuild_due() is False
+
+    # 改名不會產生新的 _id，只有完整重建會加入新的 slug
+    index._built_at -= timedelta(seconds=600)
+    with patch.object(index, "build", AsyncMock()) as mock_build:
+        await index.refresh()
+    mock_build.assert_awaited_once()
+
+    index.rebuild_interval = timedelta(0)
+    assert index._rebuild_due() is False
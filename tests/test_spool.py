@@ -0,0 +1,91 @@
+# redirect_service/tests/test_spool.py
+import os
+
+from spool import ClickSpool, claim_worker_directory, create_click_spool
+
+
+def test_append_and_read_in_order(tmp_path):
+    spool = ClickSpool(str(tmp_path))
+    assert spool.append([{"slug": "a"}, {"slug": "b"}])
+    assert spool.append([{"slug": "c", "count": 3}])
+
+    messages, position = spool.read(10)
+    assert messages == [{"slug": "a"}, {"slug": "b"}, {"slug": "c", "count": 3}]
+    assert spool.pending
+
+    spool.commit(position, len(messages))
+    assert not spool.pending
+    assert spool.read(10)[0] == []
+    assert spool.replayed == 3
+
+
+def test_segments_rotate_and_replayed_segments_are_deleted(tmp_path):
+    spool = ClickSpool(str(tmp_path), segment_bytes=40)
+    for i in range(6):
+        spool.append([{"slug": f"slug-{i}"}])
+    assert spool.stats()["segments"] > 1
+
+    messages, position = spool.read(4)
+    assert [m["slug"] for m in messages] == [f"slug-{i}" for i in range(4)]
+    spool.commit(position, len(messages))
+    messages, position = spool.read(10)
+    assert [m["slug"] for m in messages] == ["slug-4", "slug-5"]
+    spool.commit(position, len(messages))
+
+    segment_files = [name for name in os.listdir(tmp_path) if name.endswith(".log")]
+    assert len(segment_files) == 1
+
+
+def test_spool_survives_restart_and_skips_partial_records(tmp_path):
+    spool = ClickSpool(str(tmp_path))
+    spool.append([{"slug": "a"}, {"slug": "b"}])
+    messages, position = spool.read(1)
+    spool.commit(position, len(messages))
+    # 模擬寫到一半當機：最後一行不完整
+    spool._writer.write(b'{"slug": "tr')
+    spool.close()
+
+    reopened = ClickSpool(str(tmp_path))
+    reopened.append([{"slug": "c"}])
+    messages, _ = reopened.read(10)
+    assert messages == [{"slug": "b"}, {"slug": "c"}]
+
+
+def test_appends_refused_when_spool_is_full(tmp_path):
+    spool = ClickSpool(str(tmp_path), max_bytes=30)
+    assert spool.append([{"slug": "a"}])
+    assert spool.append([{"slug": "b"}, {"slug": "c"}]) is False
+    assert spool.dropped == 2
+    assert spool.size_bytes <= 30
+
+
+def test_workers_claim_separate_directories(tmp_path):
+    first, first_lock = claim_worker_directory(str(tmp_path))
+    second, second_lock = claim_worker_directory(str(tmp_path))
+    assert first != second
+
+    # 釋放後，下一個 worker 接手同一個目錄與其中待重送的事件
+    spool = ClickSpool(first, lock_file=first_lock)
+    spool.append([{"slug": "a"}])
+    spool.close()
+    reclaimed, lock_file = claim_worker_directory(str(tmp_path))
+    assert reclaimed == first
+    assert ClickSpool(reclaimed, lock_file=lock_file).read(10)[0] == [{"slug": "a"}]
+    second_lock.close()
+
+
+def test_create_click_spool_adopts_orphaned_directories(tmp_path, monkeypatch):
+    monkeypatch.setenv("CLICK_SPOOL_DIR", str(tmp_path))
+    held, held_lock = claim_worker_directory(str(tmp_path))
+    orphan = ClickSpool(str(tmp_path / "worker-7"))
+    orphan.append([{"slug": "a"}, {"slug": "b"}])
+    orphan.close()
+
+    spool = create_click_spool()
+    assert spool.directory not in (held, orphan.directory)
+    assert spool.read(10)[0] == [{"slug": "a"}, {"slug": "b"}]
+    assert spool.adopted == 2
+    assert not os.path.exists(orphan.directory)
+    assert os.path.exists(held)
+    spool.close()
+    held_lock.close()
@@ -0,0 +1,87 @@
+# redirect-service/warmup.py
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+
+from cache import cache_link
+from database import LINK_DATA_PROJECTION, link_data_from_document
+from local_cache import LocalLinkCache
+from models import Link
+from motor.motor_asyncio import AsyncIOMotorCursor
+from pymongo import DESCENDING
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+
+def hottest_links(limit: int, batch_size: int = 500) -> AsyncIOMotorCursor:
+    """
+    Cursor over the `limit` most clicked, unexpired links, projected to the
+    fields the redirect path needs.
+    """
+    return (
+        Link.get_motor_collection()
+        .find(
+            {
+                "$or": [
+                    {"expires_at": None},
+                    {"expires_at": {"$gt": datetime.now(timezone.utc)}},
+                ]
+            },
+            LINK_DATA_PROJECTION,
+        )
+        .sort("click_count", DESCENDING)
+        .limit(limit)
+        .batch_size(batch_size)
+    )
+
+
+async def warm_link_cache(
+    redis_client: Redis,
+    link_cache: LocalLinkCache,
+    limit: int,
+    batch_size: int = 500,
+) -> int:
+    """
+    Streams the `limit` most clicked links from MongoDB and bulk-loads them
+    into Redis, one pipeline per cursor batch. The hottest links that fit are
+    also put in the local cache. Returns the number of links loaded.
+    """
+    cursor = hottest_links(limit, batch_size)
+    loaded = 0
+    pipeline = redis_client.pipeline(transaction=False)
+    async for document in cursor:
+        link_data = link_data_from_document(document)
+        await cache_link(pipeline, document["slug"], link_data)
+        # 依熱門程度遞減載入，只放入本機快取容量內的前幾筆，避免最熱的被 LRU 淘汰
+        if loaded < link_cache.max_size:
+            link_cache.set(document["slug"], link_data)
+        loaded += 1
+        if loaded % batch_size == 0:
+            await pipeline.execute()
+    await pipeline.execute()
+    return loaded
+
+
+async def run_cache_warmup(redis_client: Redis, link_cache: LocalLinkCache):
+    """
+    Optional startup warm-up, enabled by CACHE_WARMUP_LIMIT > 0.
+    Gives up after CACHE_WARMUP_BUDGET seconds so readiness is never delayed
+    beyond the budget.
+    """
+    limit = int(os.environ.get("CACHE_WARMUP_LIMIT", 0))
+    if limit <= 0:
+        return
+    budget = float(os.environ.get("CACHE_WARMUP_BUDGET", 5))
+    batch_size = int(os.environ.get("CACHE_WARMUP_BATCH_SIZE", 500))
+    try:
+        loaded = await asyncio.wait_for(
+            warm_link_cache(redis_client, link_cache, limit, batch_size), budget
+        )
+        logger.info("Cache warm-up loaded %s links.", loaded)
+    except asyncio.TimeoutError:
+        logger.warning("Cache warm-up stopped after its %ss budget.", budget)
+    except Exception as e:
+        # 預熱失敗不影響服務啟動
+        logger.warning("Cache warm-up failed: %s", e)